@@ -1,3 +1,2 @@
 from .nc_router import router
 from . import validation_router
-from . import batch_router
\ No newline at end of file
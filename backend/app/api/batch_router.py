@@ -60,6 +60,11 @@ class BatchStartRequest(BaseModel):
     batch_id: str = Field(..., description="Batch ID from upload-and-scan")
     carpetas: List[str] = Field(..., description="List of folder names to process")
     sispro_token: str = Field(..., description="SISPRO JWT token for ministry API")
+    concurrencia: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Folders processed at the same time (defaults to BATCH_CONCURRENCY)"
+    )
 
 
 class BatchStartResponse(BaseModel):
@@ -80,6 +85,18 @@ class BatchDetalle(BaseModel):
     items_igualados_a_cero: Optional[int] = None
 
 
+class EtapaStatus(BaseModel):
+    """Statistics of a batch pipeline stage."""
+    nombre: str
+    workers: int
+    en_cola: int  # Carpetas esperando la etapa
+    en_proceso: int
+    procesados: int
+    errores: int
+    throughput: float  # Carpetas por segundo
+    tiempo_promedio: float  # Segundos por carpeta
+
+
 class BatchStatusResponse(BaseModel):
     """Response model for batch status."""
     batch_id: str
@@ -90,6 +107,8 @@ class BatchStatusResponse(BaseModel):
     exitosos: int
     errores: int
     rips_guardados: int = 0
+    concurrencia: int = 1
+    etapas: List[EtapaStatus] = []
     detalles: List[BatchDetalle]
 
 
@@ -304,7 +323,12 @@ async def start_batch(request: BatchStartRequest) -> BatchStartResponse:
         # Start processing in background
         async def process():
             try:
-                await processor.process_batch(batch_id, selected_folders, request.sispro_token)
+                await processor.process_batch(
+                    batch_id,
+                    selected_folders,
+                    request.sispro_token,
+                    concurrency=request.concurrencia
+                )
             except Exception as e:
                 logger.error(f"Batch {batch_id} failed: {e}")
                 state = processor.get_state(batch_id)
@@ -384,6 +408,8 @@ async def get_batch_status(batch_id: str) -> BatchStatusResponse:
         exitosos=state.exitosos,
         errores=state.errores,
         rips_guardados=rips_guardados,
+        concurrencia=state.concurrencia,
+        etapas=[EtapaStatus(**etapa.to_dict()) for etapa in state.etapas.values()],
         detalles=detalles
     )
 
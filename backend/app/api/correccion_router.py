@@ -3,6 +3,7 @@ from typing import List
 import copy
 import re
 import logging
+from dataclasses import replace
 
 from app.models import (
     CorreccionRequest,
@@ -11,6 +12,7 @@ from app.models import (
     AplicarCorreccionResponse,
     ValidationError,
 )
+from app.processors.xml_rewriter import RewriteRule, XMLRewriter
 from app.services.correccion_agent import CorreccionAgent
 
 router = APIRouter()
@@ -225,45 +227,22 @@ def _aplicar_cambio_en_cdata(cdata_text: str, partes_ruta: list, valor_nuevo: st
     tag_objetivo = partes_ruta[-1]
     contexto_padres = partes_ruta[1:-1]  # Sin root ni objetivo
 
-    texto = cdata_text
-    tag_regex = rf'(<{re.escape(tag_objetivo)}[^>]*>)[^<]*(</{re.escape(tag_objetivo)}>)'
+    # Primera ocurrencia del tag, con cualquier valor de texto (incluso vacío)
+    regla = RewriteRule(tag_objetivo, str(valor_nuevo), patron_valor=None, max_cambios=1)
 
     if contexto_padres:
         # Buscar dentro del padre inmediato para contexto correcto
         padre = contexto_padres[-1]
-        padre_pattern = re.compile(
-            rf'(<{re.escape(padre)}[^>]*>)(.*?)(</{re.escape(padre)}>)',
-            re.DOTALL
-        )
-
-        for padre_match in padre_pattern.finditer(texto):
-            contenido_padre = padre_match.group(2)
-
-            tag_match = re.search(tag_regex, contenido_padre)
-            if tag_match:
-                nuevo_contenido = (
-                    contenido_padre[:tag_match.start()] +
-                    tag_match.group(1) + str(valor_nuevo) + tag_match.group(2) +
-                    contenido_padre[tag_match.end():]
-                )
-                nuevo_texto = (
-                    texto[:padre_match.start(2)] +
-                    nuevo_contenido +
-                    texto[padre_match.end(2):]
-                )
-                logger.info(f"[_aplicar_cambio_en_cdata] Modificado: {'/'.join(partes_ruta)}")
-                return {'success': True, 'text': nuevo_texto}
+        resultado = XMLRewriter([replace(regla, padre=padre)]).apply(cdata_text)
+        if resultado.modificado:
+            logger.info(f"[_aplicar_cambio_en_cdata] Modificado: {'/'.join(partes_ruta)}")
+            return {'success': True, 'text': resultado.text}
 
     # Sin contexto padre o no encontrado: buscar el tag directamente
-    tag_match = re.search(tag_regex, texto)
-    if tag_match:
-        nuevo_texto = (
-            texto[:tag_match.start()] +
-            tag_match.group(1) + str(valor_nuevo) + tag_match.group(2) +
-            texto[tag_match.end():]
-        )
+    resultado = XMLRewriter([regla]).apply(cdata_text)
+    if resultado.modificado:
         logger.info(f"[_aplicar_cambio_en_cdata] Modificado (sin contexto padre): {tag_objetivo}")
-        return {'success': True, 'text': nuevo_texto}
+        return {'success': True, 'text': resultado.text}
 
     logger.warning(f"[_aplicar_cambio_en_cdata] No encontrado: {'/'.join(partes_ruta)}")
     return {'success': False}
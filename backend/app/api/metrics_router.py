@@ -0,0 +1,45 @@
+from typing import Optional
+
+from fastapi import APIRouter
+
+from app.processors.code_catalog import get_code_catalog
+from app.processors.section_cache import factura_section_cache
+from app.services.llm_matcher import matching_stats
+from app.services.match_cache import match_cache
+from app.services.rate_limiter import llm_rate_limiter
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    """Métricas internas del procesador (cachés) para dimensionar la configuración."""
+    catalogo = get_code_catalog()
+    return {
+        "factura_cache": factura_section_cache.stats(),
+        "match_cache": match_cache.stats(),
+        "matching": matching_stats.stats(),
+        "llm_rate_limit": llm_rate_limiter.stats(),
+        "code_catalog": catalogo.stats() if catalogo else None,
+    }
+
+
+@router.delete("/factura-cache")
+async def clear_factura_cache():
+    """Vacía la caché de secciones de facturas (memoria y disco) y reinicia sus contadores."""
+    factura_section_cache.clear()
+    return {"success": True}
+
+
+@router.delete("/match-cache")
+async def invalidate_match_cache(descripcion: Optional[str] = None):
+    """
+    Invalida matches guardados del LLM.
+
+    Con ``descripcion`` (la de la línea NC cuyo match se corrigió) solo se eliminan las
+    entradas de esa descripción; sin ella se vacía toda la caché.
+    """
+    if descripcion is None:
+        match_cache.clear()
+        return {"success": True}
+    return {"success": True, "eliminadas": match_cache.invalidate(descripcion)}
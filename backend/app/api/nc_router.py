@@ -1,12 +1,15 @@
-import re
 import logging
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 
 from app.processors.xml_processor import XMLProcessor
+from app.processors.ubl_document import ParsedUBLDocument, XMLText
+from app.processors.code_catalog import find_unknown_codes, get_code_catalog
+from app.processors.money import from_cents
 from app.processors.rips_processor import RIPSProcessor
-from app.services.llm_matcher import LLMMatcher
+from app.processors.service_overlay import materialize
+from app.services.llm_matcher import LLMMatcher, detect_equal_values
 from app.models import (
     ProcesarNCResponse,
     PreviewMatchingResponse,
@@ -14,7 +17,6 @@ from app.models import (
     MatchingDetail,
     LineaNC,
     ServicioRIPS,
-    ItemIgualadoCero,
     ValoresPreProcesamiento,
     PreviewValuesResponse,
 )
@@ -36,27 +38,28 @@ async def procesar_nc(
     warnings = []
 
     try:
-        # Leer archivos
-        nc_content = (await nc_xml.read()).decode('utf-8')
-        factura_content = (await factura_xml.read()).decode('utf-8')
+        # Leer archivos (los XML se procesan como bytes, sin decodificar el documento completo)
+        nc_bytes = await nc_xml.read()
+        factura_bytes = await factura_xml.read()
         rips_content = (await factura_rips.read()).decode('utf-8')
 
         # DEBUG: Loguear información del archivo NC
         logger.info(f"[procesar_nc] Archivo NC subido: {nc_xml.filename}")
-        logger.info(f"[procesar_nc] Tamaño NC: {len(nc_content)} bytes")
-        logger.info(f"[procesar_nc] Primeros 1000 caracteres del NC:\n{nc_content[:1000]}")
+        logger.info(f"[procesar_nc] Tamaño NC: {len(nc_bytes)} bytes")
+        logger.info(f"[procesar_nc] Primeros 1000 caracteres del NC:\n{nc_bytes[:1000].decode('utf-8', errors='replace')}")
         logger.info(f"[procesar_nc] Buscando ParentDocumentID en contenido crudo...")
 
-        # Buscar manualmente
-        manual_search = re.search(r'<cbc:ParentDocumentID[^>]*>([^<]+)</cbc:ParentDocumentID>', nc_content)
-        if manual_search:
-            logger.info(f"[procesar_nc] Encontrado en contenido crudo: {manual_search.group(1).strip()}")
+        # Analizar cada XML una sola vez; las extracciones reutilizan el mismo índice
+        nc_doc = ParsedUBLDocument(nc_bytes)
+        factura_doc = ParsedUBLDocument(factura_bytes)
+
+        if nc_doc.parent_document_id is not None:
+            logger.info(f"[procesar_nc] Encontrado en contenido crudo: {nc_doc.parent_document_id}")
         else:
             logger.info(f"[procesar_nc] No se encontró ParentDocumentID en contenido crudo")
 
         # Extraer secciones de la factura
-        interop = XMLProcessor.extract_interoperabilidad(factura_content)
-        period = XMLProcessor.extract_invoice_period(factura_content)
+        interop, period = XMLProcessor.extract_factura_sections(factura_doc)
 
         if not interop:
             errors.append("No se encontró sección de Interoperabilidad en la factura")
@@ -64,7 +67,7 @@ async def procesar_nc(
             errors.append("No se encontró InvoicePeriod en la factura")
 
         # Extraer líneas de la NC
-        lineas_nc = XMLProcessor.extract_nc_lines(nc_content)
+        lineas_nc = XMLProcessor.extract_nc_lines(nc_doc)
         if not lineas_nc:
             errors.append("No se encontraron líneas en la Nota Crédito")
 
@@ -92,7 +95,7 @@ async def procesar_nc(
         matching_result = await matcher.match_services(lineas_nc, servicios_rips)
 
         # Calculate pre-processing totals
-        total_nc_original = _extract_total_nc_original(nc_content)
+        total_nc_original = _extract_total_nc_original(nc_doc)
         total_rips_original = _calculate_total_rips_original(rips_data)
         valores_pre = ValoresPreProcesamiento(
             total_nc_xml=total_nc_original,
@@ -100,14 +103,14 @@ async def procesar_nc(
         )
 
         # Detect equal values (item by item)
-        items_igualados = _detect_equal_values(
+        items_igualados = detect_equal_values(
             matching_result.matches, lineas_nc, servicios_rips
         )
         codigos_igualados = {item.codigo_rips for item in items_igualados}
         lineas_igualadas = [item.linea_nc for item in items_igualados]
 
         # Extraer número de nota
-        num_nota = _extract_nc_number(nc_content)
+        num_nota = _extract_nc_number(nc_doc)
 
         # Generar RIPS de NC
         matches_for_rips = [
@@ -122,11 +125,17 @@ async def procesar_nc(
 
         nc_rips = RIPSProcessor.generate_nc_rips(
             rips_data, num_nota, matches_for_rips, es_caso_colesterol,
-            codigos_igualados_a_cero=codigos_igualados if codigos_igualados else None
+            codigos_igualados_a_cero=codigos_igualados if codigos_igualados else None,
+            catalogo=servicios_rips
         )
 
+        # Códigos que no están en CUPS/CUM (pueden ser códigos propios del prestador)
+        catalogo_codigos = get_code_catalog()
+        if catalogo_codigos is not None:
+            warnings.extend(find_unknown_codes(nc_rips, catalogo_codigos))
+
         # Insertar secciones en NC
-        nc_completo = XMLProcessor.insert_sections(nc_content, interop, period)
+        nc_completo = XMLProcessor.insert_sections(nc_doc, interop, period)
 
         # Apply per-line zero-equalization to XML
         if lineas_igualadas:
@@ -137,15 +146,16 @@ async def procesar_nc(
             nc_completo = XMLProcessor.aplicar_caso_colesterol(nc_completo)
 
         # Validar totales
-        # Usar nc_completo (con caso colesterol aplicado) no nc_content (original)
-        total_nc = _extract_total_nc(nc_completo)
-        total_rips = RIPSProcessor.calculate_total(nc_rips)
+        # Usar nc_completo (con caso colesterol aplicado) no nc_bytes (original)
+        # Comparación exacta en centavos
+        total_nc = ParsedUBLDocument.of(nc_completo).total_nc_cents
+        total_rips = RIPSProcessor.calculate_totals(nc_rips).total
 
         validacion = ValidacionResult(
-            total_nc_xml=total_nc,
-            total_rips=total_rips,
-            coinciden=abs(total_nc - total_rips) < 0.01,
-            diferencia=round(total_nc - total_rips, 2)
+            total_nc_xml=from_cents(total_nc),
+            total_rips=from_cents(total_rips),
+            coinciden=total_nc == total_rips,
+            diferencia=from_cents(total_nc - total_rips)
         )
 
         # Construir detalles de matching
@@ -174,8 +184,8 @@ async def procesar_nc(
 
         return ProcesarNCResponse(
             success=True,
-            nc_xml_completo=nc_completo,
-            nc_rips_json=nc_rips,
+            nc_xml_completo=nc_completo.decode('utf-8'),
+            nc_rips_json=materialize(nc_rips),
             validacion=validacion,
             matching_details=matching_details,
             warnings=matching_result.warnings + warnings,
@@ -197,10 +207,10 @@ async def preview_matching(
     """Preview del matching sin generar archivos."""
 
     try:
-        nc_content = (await nc_xml.read()).decode('utf-8')
+        nc_bytes = await nc_xml.read()
         rips_content = (await factura_rips.read()).decode('utf-8')
 
-        lineas_nc = XMLProcessor.extract_nc_lines(nc_content)
+        lineas_nc = XMLProcessor.extract_nc_lines(ParsedUBLDocument(nc_bytes))
 
         rips_data = RIPSProcessor.parse_rips(rips_content)
         servicios_rips = RIPSProcessor.get_all_services(rips_data)
@@ -219,7 +229,7 @@ async def preview_matching(
 
         return PreviewMatchingResponse(
             lineas_nc=lineas_nc,
-            servicios_rips=servicios_rips,
+            servicios_rips=servicios_rips.to_models(),
             matching_sugerido=matching_sugerido
         )
 
@@ -227,63 +237,35 @@ async def preview_matching(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def _extract_nc_number(nc_xml: str) -> str:
+def _extract_nc_number(nc_xml: Union[XMLText, ParsedUBLDocument]) -> str:
     """Extrae el número de nota del XML (ParentDocumentID)."""
     # Buscar en el XML completo (no solo el embedded) para Mayor robustez
-    xml_to_search = nc_xml
-
-    logger.info(f"[_extract_nc_number] XML length: {len(xml_to_search)}")
-
-    # Buscar ParentDocumentID con varios formatos posibles
-    patterns = [
-        r'<cbc:ParentDocumentID[^>]*>([^<]+)</cbc:ParentDocumentID>',
-        r'<ParentDocumentID[^>]*>([^<]+)</ParentDocumentID>',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, xml_to_search)
-        if match:
-            result = match.group(1).strip()
-            logger.info(f"[_extract_nc_number] Found ParentDocumentID: {result}")
-            return result
-
-    # Fallback: buscar ID
-    id_patterns = [
-        r'<cbc:ID[^>]*>([^<]+)</cbc:ID>',
-        r'<ID[^>]*>([^<]+)</ID>',
-    ]
-
-    for pattern in id_patterns:
-        match = re.search(pattern, xml_to_search)
-        if match:
-            result = match.group(1).strip()
-            logger.info(f"[_extract_nc_number] Found ID (fallback): {result}")
-            return result
+    doc = ParsedUBLDocument.of(nc_xml)
+
+    logger.info(f"[_extract_nc_number] XML length: {len(doc.raw)}")
+
+    # ParentDocumentID con o sin prefijo cbc:
+    if doc.parent_document_id is not None:
+        logger.info(f"[_extract_nc_number] Found ParentDocumentID: {doc.parent_document_id}")
+        return doc.parent_document_id
+
+    # Fallback: ID
+    if doc.nc_number is not None:
+        logger.info(f"[_extract_nc_number] Found ID (fallback): {doc.nc_number}")
+        return doc.nc_number
 
     logger.warning("[_extract_nc_number] No ID found, returning 'NC'")
     return "NC"
 
 
-def _extract_total_nc(nc_xml: str) -> float:
-    """Extrae el valor total de la NC."""
-    embedded = XMLProcessor.get_embedded_document(nc_xml)
-    # Buscar PayableAmount
-    match = re.search(r'<cbc:PayableAmount[^>]*>([^<]+)</cbc:PayableAmount>', embedded)
-    if match:
-        return float(match.group(1))
-    # Fallback: sumar líneas
-    lines = XMLProcessor.extract_nc_lines(nc_xml)
-    return sum(l.valor for l in lines)
+def _extract_total_nc(nc_xml: Union[XMLText, ParsedUBLDocument]) -> float:
+    """Extrae el valor total de la NC (PayableAmount o suma de líneas)."""
+    return ParsedUBLDocument.of(nc_xml).total_nc
 
 
-def _extract_total_nc_original(nc_content: str) -> float:
+def _extract_total_nc_original(nc_content: Union[XMLText, ParsedUBLDocument]) -> float:
     """Extract total from original NC XML (before any modifications)."""
-    embedded = XMLProcessor.get_embedded_document(nc_content)
-    match = re.search(r'<cbc:PayableAmount[^>]*>([^<]+)</cbc:PayableAmount>', embedded)
-    if match:
-        return float(match.group(1))
-    lines = XMLProcessor.extract_nc_lines(nc_content)
-    return sum(l.valor for l in lines)
+    return ParsedUBLDocument.of(nc_content).total_nc
 
 
 def _calculate_total_rips_original(rips_data) -> float:
@@ -291,42 +273,6 @@ def _calculate_total_rips_original(rips_data) -> float:
     return RIPSProcessor.calculate_total(rips_data)
 
 
-def _detect_equal_values(
-    matching_result_matches,
-    lineas_nc: List[LineaNC],
-    servicios_rips: List[ServicioRIPS]
-) -> List[ItemIgualadoCero]:
-    """Detect items where NC XML and RIPS values are equal before processing."""
-    items_igualados = []
-
-    for m in matching_result_matches:
-        linea = next((l for l in lineas_nc if l.id == m.linea_nc), None)
-        if not linea:
-            continue
-
-        valor_nc = linea.valor
-
-        servicio = next(
-            (s for s in servicios_rips
-             if s.codigo == m.codigo_rips and s.tipo == m.tipo_servicio),
-            None
-        )
-        if not servicio:
-            continue
-
-        valor_rips = servicio.valor_unitario
-
-        if abs(valor_nc - valor_rips) < 0.01:
-            items_igualados.append(ItemIgualadoCero(
-                linea_nc=m.linea_nc,
-                codigo_rips=m.codigo_rips,
-                tipo_servicio=m.tipo_servicio,
-                valor_original=valor_nc
-            ))
-
-    return items_igualados
-
-
 @router.post("/preview-values", response_model=PreviewValuesResponse)
 async def preview_values(
     nc_xml: UploadFile = File(...),
@@ -334,15 +280,16 @@ async def preview_values(
 ):
     """Preview original values from NC XML and RIPS before processing."""
     try:
-        nc_content = (await nc_xml.read()).decode('utf-8')
+        nc_bytes = await nc_xml.read()
         rips_content = (await factura_rips.read()).decode('utf-8')
 
-        total_nc = _extract_total_nc_original(nc_content)
+        nc_doc = ParsedUBLDocument(nc_bytes)
+        total_nc = _extract_total_nc_original(nc_doc)
 
         rips_data = RIPSProcessor.parse_rips(rips_content)
         total_rips = RIPSProcessor.calculate_total(rips_data)
 
-        nc_cdata = XMLProcessor.extract_cdata(nc_content) or nc_content
+        nc_cdata = nc_doc.cdata or nc_bytes.decode('utf-8')
 
         return PreviewValuesResponse(
             valores_nc_xml=total_nc,
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Header
 from app.models.schemas import NCValidationResponse, NCTotalPayload
 from app.services.ministerio_service import MinisterioService
-import requests
+import httpx
 
 router = APIRouter()
 
@@ -34,7 +34,7 @@ async def enviar_nc_total(
         service = MinisterioService()
         result = await service.enviar_nc_total(payload.xmlFevFile, token)
         return result
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         # Si el ministerio responde 401, propagar ese error al frontend
         if e.response.status_code == 401:
             raise HTTPException(
@@ -1,22 +1,20 @@
 from fastapi import APIRouter, HTTPException, Header
 from typing import Optional
-import requests
-import urllib3
+import httpx
 
 from app.models import (
     LoginCredentials,
     LoginResponse,
     NCPayload,
-    NCValidationResponse
+    NCValidationResponse,
+    ValidationError
 )
 from app.config import settings
+from app.processors.code_catalog import find_unknown_codes, get_code_catalog
 from app.services.ministerio_service import MinisterioService
 
 router = APIRouter()
 
-# Deshabilitar warnings de SSL verification (para certificados self-signed)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 
 @router.post("/login", response_model=LoginResponse)
 async def login_sispro(credentials: LoginCredentials):
@@ -29,13 +27,13 @@ async def login_sispro(credentials: LoginCredentials):
             token=token,
             message="Login exitoso"
         )
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         if e.response.status_code == 401:
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
         raise HTTPException(status_code=e.response.status_code, detail=str(e))
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Timeout al conectar con SISPRO")
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Error de conexión: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
@@ -49,17 +47,25 @@ async def enviar_nc(payload: NCPayload, authorization: Optional[str] = Header(No
 
     token = authorization.replace("Bearer ", "")
 
+    # Pre-validación local: los códigos fuera del catálogo se envían igual y se notifican
+    catalogo = get_code_catalog()
+    desconocidos = find_unknown_codes(payload.rips, catalogo) if catalogo is not None else []
+
     try:
         service = MinisterioService()
         result = await service.enviar_nc(payload, token)
+        result.notificaciones.extend(
+            ValidationError(Clase="NOTIFICACION", Codigo="CATALOGO", Descripcion=d, Fuente="ValidadorLocal")
+            for d in desconocidos
+        )
         return result
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         if e.response.status_code == 401:
             raise HTTPException(status_code=401, detail="Token expirado o inválido")
         raise HTTPException(status_code=e.response.status_code, detail=str(e))
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Timeout al enviar NC al ministerio")
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Error de conexión: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
@@ -20,6 +20,16 @@ class Settings(BaseSettings):
     llm_api_key: str
     llm_base_url: str = "https://api.moonshot.ai/v1"
     llm_model: str = "moonshot-v1-128k"
+    llm_pool_size: int = 20  # Conexiones simultáneas máximas por cliente LLM compartido
+    llm_keepalive_expiry: float = 30.0  # Segundos que una conexión ociosa al LLM se mantiene abierta
+    llm_timeout: float = 120.0  # Timeout de lectura/escritura de una llamada al LLM
+    llm_connect_timeout: float = 10.0  # Timeout para abrir la conexión al LLM
+    # Rate limit compartido por todas las llamadas al LLM (se adapta a los 429 del proveedor)
+    llm_requests_per_second: float = 5.0  # 0 desactiva el límite de solicitudes
+    llm_burst: int = 5  # Solicitudes que pueden salir seguidas sin esperar
+    llm_tokens_per_minute: int = 0  # Tokens estimados (prompt + max_tokens) por minuto; 0 sin límite
+    llm_rate_limit_retries: int = 3  # Reintentos de una llamada que recibió 429
+    llm_transient_retries: int = 2  # Reintentos ante errores de conexión, timeouts y 5xx del LLM
 
     host: str = "0.0.0.0"
     port: int = 8000
@@ -34,6 +44,46 @@ class Settings(BaseSettings):
     # Configuración API Ministerio de Salud (base para todos los endpoints del ministerio)
     ministerio_api_url: str = "https://rips.mamadominga.org/api"
     ministerio_api_timeout: int = 60  # Timeout para login y llamadas al ministerio
+    ministerio_pool_size: int = 20  # Conexiones simultáneas máximas en el pool HTTP del ministerio
+    ministerio_keepalive_expiry: float = 30.0  # Segundos que una conexión ociosa se mantiene abierta
+
+    # Procesamiento batch
+    batch_concurrency: int = 4  # Carpetas procesadas en paralelo por defecto
+    batch_max_concurrency: int = 16  # Límite superior para la concurrencia pedida por batch
+    batch_parse_workers: int = 2  # Hilos para las etapas CPU (lectura/parseo y armado del XML)
+    batch_match_concurrency: int = 4  # Carpetas en matching (LLM) al mismo tiempo
+    batch_submit_concurrency: int = 4  # Envíos simultáneos al ministerio
+    batch_queue_size: int = 8  # Carpetas en espera entre dos etapas del pipeline
+    rips_stream_threshold_mb: int = 64  # RIPS más grandes se leen por usuario (streaming) en vez de json.loads
+
+    # JSON: auto usa orjson si está instalado; json fuerza la librería estándar
+    json_backend: str = "auto"
+
+    # Caché de secciones extraídas de facturas (Interoperabilidad, InvoicePeriod)
+    factura_cache_size: int = 256  # Entradas en memoria (LRU); 0 desactiva la caché en memoria
+    factura_cache_dir: str = ""  # Directorio para persistir la caché en disco (vacío: solo memoria)
+    factura_cache_disk_size: int = 4096  # Archivos máximos en disco; se descartan los de uso más antiguo (0 = sin disco)
+
+    # Matching local (n-gramas TF-IDF + valores) antes de recurrir al LLM
+    local_match_enabled: bool = True
+    local_match_min_score: float = 0.75  # Puntaje mínimo (0-1) para aceptar un match sin LLM
+    local_match_margin: float = 0.1  # Ventaja mínima sobre el segundo candidato
+
+    # Prompts de matching al LLM
+    llm_candidates_per_line: int = 8  # Servicios candidatos por línea cuando el RIPS no cabe completo
+    llm_prompt_token_budget: int = 8000  # Tokens estimados máximos por prompt; más grande se divide
+    llm_max_lines_per_request: int = 20  # Líneas NC por solicitud (acota los tokens de la respuesta)
+    llm_concurrency: int = 4  # Solicitudes de matching al LLM en paralelo por NC
+    llm_chunk_retries: int = 2  # Reintentos de una solicitud fallida antes del fallback por similitud
+    llm_retry_delay: float = 1.0  # Segundos de espera antes de reintentar (crece con cada intento)
+
+    # Caché de matches resueltos por el LLM (descripción NC normalizada -> servicio)
+    match_cache_path: str = ""  # Archivo SQLite para persistirla (vacío: solo memoria del proceso)
+    match_cache_size: int = 50000  # Entradas máximas (LRU); 0 desactiva la caché
+    match_cache_ttl_hours: float = 720  # Horas que una entrada es válida
+
+    # Catálogo CUPS/CUM compilado (python -m app.processors.code_catalog) para validar códigos localmente
+    code_catalog_path: str = ""  # Archivo del índice binario (vacío: sin validación local de códigos)
 
     # Kimi API (reutiliza LLM_API_KEY si está disponible)
     kimi_api_key: str = ""  # Puede usar LLM_API_KEY como fallback
@@ -1,11 +1,15 @@
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from app.config import settings
-from app.api import nc_router, validation_router, correccion_router, batch_router, capita_router, nc_total_router, fev_rips_router
+from app.api import nc_router, validation_router, correccion_router, batch_router, capita_router, nc_total_router, fev_rips_router, metrics_router
+from app.services.ministerio_service import close_http_client
+from app.services.llm_clients import open_llm_clients, close_llm_clients
+from app.processors.code_catalog import get_code_catalog, close_code_catalog
 
 # Configurar logging
 logging.basicConfig(
@@ -17,10 +21,25 @@ logger = logging.getLogger(__name__)
 # Log CORS configuration
 logger.info(f"CORS Origins configurados: {settings.cors_origins}")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clientes LLM compartidos por todos los requests (un pool de conexiones por proveedor)
+    open_llm_clients()
+    # Catálogo CUPS/CUM mapeado en memoria (las páginas se comparten entre workers)
+    get_code_catalog()
+    yield
+    # Cerrar el pool de conexiones compartido con el ministerio
+    await close_http_client()
+    await close_llm_clients()
+    close_code_catalog()
+
+
 app = FastAPI(
     title="NC Processor API",
     description="API para procesar Notas Crédito del sector salud",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -47,6 +66,8 @@ app.include_router(nc_total_router.router, prefix="/api/nc-total", tags=["NC Tot
 logger.info("✓ NC Total router registrado")
 app.include_router(fev_rips_router.router, prefix="/api/fev-rips", tags=["FEV RIPS"])
 logger.info("✓ FEV RIPS router registrado")
+app.include_router(metrics_router.router, prefix="/api/metrics", tags=["Métricas"])
+logger.info("✓ Metrics router registrado")
 logger.info("Todos los routers registrados exitosamente")
 
 
@@ -0,0 +1,104 @@
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Códigos más cortos generan demasiados falsos positivos (cantidades, concentraciones)
+MIN_LONGITUD_CODIGO = 4
+
+
+class CodeHit(NamedTuple):
+    codigo: str
+    inicio: int
+    fin: int
+
+
+def _es_parte_de_codigo(char: str) -> bool:
+    return char.isalnum()
+
+
+class CodeAutomaton:
+    """
+    Autómata Aho-Corasick sobre un conjunto de códigos (CUM, CUPS, códigos internos).
+
+    Encuentra en una sola pasada lineal todas las apariciones de cualquiera de los
+    códigos en un texto, sin importar cuántos sean. Solo cuentan las apariciones que
+    no están pegadas a otras letras o dígitos (``12345`` no aparece en ``A12345``), y
+    la comparación no distingue mayúsculas de minúsculas.
+    """
+
+    def __init__(self, codigos: Iterable[str], min_longitud: int = MIN_LONGITUD_CODIGO):
+        # Nodo 0 es la raíz; _goto[n] transiciones, _fail[n] enlace de fallo,
+        # _salida[n] códigos que terminan en n (incluidos los de sus enlaces de fallo)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._salida: List[List[str]] = [[]]
+        self.codigos = set()
+
+        for codigo in codigos:
+            codigo = (codigo or '').strip()
+            if len(codigo) < min_longitud or codigo.upper() in self.codigos:
+                continue
+            clave = codigo.upper()
+            self.codigos.add(clave)
+            nodo = 0
+            for char in clave:
+                siguiente = self._goto[nodo].get(char)
+                if siguiente is None:
+                    siguiente = len(self._goto)
+                    self._goto[nodo][char] = siguiente
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._salida.append([])
+                nodo = siguiente
+            self._salida[nodo].append(codigo)
+
+        # Enlaces de fallo por niveles (BFS)
+        cola = deque(self._goto[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for char, hijo in self._goto[nodo].items():
+                cola.append(hijo)
+                fallo = self._fail[nodo]
+                while fallo and char not in self._goto[fallo]:
+                    fallo = self._fail[fallo]
+                destino = self._goto[fallo].get(char, 0)
+                self._fail[hijo] = destino if destino != hijo else 0
+                self._salida[hijo] = self._salida[hijo] + self._salida[self._fail[hijo]]
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def find_all(self, texto: str) -> List[CodeHit]:
+        """Todas las apariciones de códigos en ``texto``, en orden de fin."""
+        if not self.codigos or not texto:
+            return []
+        buscado = texto.upper()
+        if len(buscado) != len(texto):
+            # Algún carácter cambia de longitud al pasar a mayúsculas: posiciones del original
+            buscado = texto
+
+        hits = []
+        goto, fail, salida = self._goto, self._fail, self._salida
+        nodo = 0
+        for pos, char in enumerate(buscado):
+            while nodo and char not in goto[nodo]:
+                nodo = fail[nodo]
+            nodo = goto[nodo].get(char, 0)
+            for codigo in salida[nodo]:
+                inicio = pos + 1 - len(codigo)
+                fin = pos + 1
+                if inicio > 0 and _es_parte_de_codigo(texto[inicio - 1]):
+                    continue
+                if fin < len(texto) and _es_parte_de_codigo(texto[fin]):
+                    continue
+                hits.append(CodeHit(codigo, inicio, fin))
+        return hits
+
+    def best_code(self, texto: str) -> Optional[str]:
+        """El código más largo que aparece en el texto (el primero, a igual longitud)."""
+        mejor = None
+        for hit in self.find_all(texto):
+            if mejor is None or len(hit.codigo) > len(mejor.codigo) or (
+                len(hit.codigo) == len(mejor.codigo) and hit.inicio < mejor.inicio
+            ):
+                mejor = hit
+        return mejor.codigo if mejor else None
@@ -0,0 +1,325 @@
+"""
+Catálogos de referencia CUPS/CUM compilados a un índice binario ordenado.
+
+Los CSV públicos (CUPS de SISPRO, CUM de INVIMA) se compilan una vez con::
+
+    python -m app.processors.code_catalog --cups cups.csv --cum cum.csv -o catalogo.bin
+
+y el archivo resultante se abre con ``mmap`` de solo lectura: los workers de uvicorn
+comparten las mismas páginas del page cache del sistema en vez de cargar cada uno
+cientos de miles de códigos en memoria, y buscar un código es una búsqueda binaria.
+
+Formato (little endian)::
+
+    cabecera   MAGIC (8 bytes) + cantidad de entradas (uint32)
+    registros  por entrada: offset y largo del código, offset y largo del nombre, tipo
+               (16 bytes, ordenados por código en bytes UTF-8 y luego por tipo)
+    textos     códigos y nombres en UTF-8, uno tras otro
+
+Los códigos se guardan y se buscan en forma canónica (``canonical_codigo``): los RIPS
+escriben el mismo código con o sin ceros a la izquierda (``019943544-01``).
+"""
+
+import argparse
+import csv
+import logging
+import mmap
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from app.config import settings
+from app.processors.rips_processor import RIPSData, RIPSProcessor
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RIPSCAT2'
+_CABECERA = struct.Struct('<8sI')
+# codigo_offset, nombre_offset, codigo_len, nombre_len, tipo
+_REGISTRO = struct.Struct('<IIHHB3x')
+
+TIPOS_CATALOGO = ('CUPS', 'CUM')
+
+# Campo de código de cada tipo de servicio del RIPS y catálogo que lo valida.
+# otrosServicios no se valida: su codTecnologiaSalud puede ser un código propio del prestador.
+# Los medicamentos suelen traer solo el expediente del CUM (``19943544`` por ``19943544-1``)
+# o un código propio: un código desconocido es una advertencia, no un rechazo.
+CODIGOS_VALIDABLES = {
+    'consultas': ('codConsulta', 'CUPS'),
+    'procedimientos': ('codProcedimiento', 'CUPS'),
+    'medicamentos': ('codTecnologiaSalud', 'CUM'),
+}
+
+
+class CatalogEntry(NamedTuple):
+    codigo: str
+    nombre: str
+    tipo: str
+
+
+def normalize_codigo(codigo: Any) -> str:
+    return str(codigo or '').strip().upper()
+
+
+def canonical_codigo(codigo: Any) -> str:
+    """Código normalizado sin ceros a la izquierda en sus partes numéricas (``019943544-01`` -> ``19943544-1``)."""
+    return '-'.join(
+        parte.lstrip('0') or '0' if parte.isdigit() else parte
+        for parte in normalize_codigo(codigo).split('-')
+    )
+
+
+def compile_catalog(entradas: Iterable[Tuple[str, str, str]], path: Union[str, Path]) -> int:
+    """
+    Escribe el índice binario a partir de tuplas (codigo, nombre, tipo).
+
+    Los códigos se guardan en forma canónica (sin espacios, en mayúsculas, sin ceros a
+    la izquierda); una misma combinación de código y tipo se guarda una sola vez (gana
+    la primera). Retorna las entradas escritas.
+    """
+    unicas: Dict[Tuple[bytes, int], bytes] = {}
+    for codigo, nombre, tipo in entradas:
+        clave = canonical_codigo(codigo).encode('utf-8')
+        if not clave:
+            continue
+        tipo_idx = TIPOS_CATALOGO.index(tipo)
+        unicas.setdefault((clave, tipo_idx), (nombre or '').strip().encode('utf-8')[:0xFFFF])
+
+    orden = sorted(unicas)
+    inicio_textos = _CABECERA.size + _REGISTRO.size * len(orden)
+    registros = bytearray()
+    textos = bytearray()
+    for clave, tipo_idx in orden:
+        nombre = unicas[(clave, tipo_idx)]
+        codigo_offset = inicio_textos + len(textos)
+        textos += clave
+        registros += _REGISTRO.pack(codigo_offset, codigo_offset + len(clave), len(clave), len(nombre), tipo_idx)
+        textos += nombre
+
+    path = Path(path)
+    temporal = path.with_suffix(path.suffix + '.tmp')
+    with open(temporal, 'wb') as f:
+        f.write(_CABECERA.pack(MAGIC, len(orden)))
+        f.write(registros)
+        f.write(textos)
+    # Reemplazo atómico: los workers que ya tienen el anterior mapeado no se ven afectados
+    temporal.replace(path)
+    return len(orden)
+
+
+def read_catalog_csv(
+    path: Union[str, Path],
+    tipo: str,
+    codigo_cols: Sequence[str] = ('codigo',),
+    nombre_col: str = 'nombre'
+) -> Iterator[Tuple[str, str, str]]:
+    """
+    Lee un catálogo CSV público y produce tuplas (codigo, nombre, tipo).
+
+    Los nombres de columna no distinguen mayúsculas; si ``codigo_cols`` tiene varias
+    columnas el código es su unión con guiones (p.ej. expediente y consecutivo del CUM:
+    ``19943544-1``). El separador (coma, punto y coma, tabulador o barra) se detecta.
+    """
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        muestra = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t|')
+        except csv.Error:
+            dialecto = csv.excel
+        reader = csv.reader(f, dialecto)
+        cabecera = [c.strip().lower() for c in next(reader, [])]
+        try:
+            indices = [cabecera.index(c.lower()) for c in codigo_cols]
+            idx_nombre = cabecera.index(nombre_col.lower())
+        except ValueError:
+            raise ValueError(f"{path}: columnas {list(codigo_cols)} / {nombre_col} no encontradas en {cabecera}")
+
+        for fila in reader:
+            if len(fila) <= max(indices + [idx_nombre]):
+                continue
+            partes = [fila[i].strip() for i in indices]
+            if not all(partes):
+                continue
+            yield '-'.join(partes), fila[idx_nombre], tipo
+
+
+class CodeCatalog:
+    """
+    Catálogo de códigos CUPS/CUM de solo lectura sobre un archivo mapeado en memoria.
+
+    ``get`` hace una búsqueda binaria sobre los registros ordenados (O(log n)) y solo
+    decodifica el nombre encontrado. Los códigos se comparan en forma canónica, y un
+    expediente CUM sin consecutivo encuentra la primera presentación de ese expediente.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _CABECERA.size:
+            self._mm.close()
+            raise ValueError(f"{self.path}: catálogo vacío o truncado")
+        magic, self._n = _CABECERA.unpack_from(self._mm, 0)
+        if magic != MAGIC or len(self._mm) < _CABECERA.size + self._n * _REGISTRO.size:
+            self._mm.close()
+            raise ValueError(f"{self.path}: no es un catálogo compilado")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __contains__(self, codigo: Any) -> bool:
+        return self.get(codigo) is not None
+
+    def _registro(self, i: int) -> Tuple[int, int, int, int, int]:
+        return _REGISTRO.unpack_from(self._mm, _CABECERA.size + i * _REGISTRO.size)
+
+    def _codigo(self, i: int) -> bytes:
+        codigo_offset, _, codigo_len, _, _ = self._registro(i)
+        return self._mm[codigo_offset:codigo_offset + codigo_len]
+
+    def _entrada(self, i: int) -> CatalogEntry:
+        codigo_offset, nombre_offset, codigo_len, nombre_len, tipo_idx = self._registro(i)
+        mm = self._mm
+        return CatalogEntry(
+            codigo=mm[codigo_offset:codigo_offset + codigo_len].decode('utf-8'),
+            nombre=mm[nombre_offset:nombre_offset + nombre_len].decode('utf-8', errors='replace'),
+            tipo=TIPOS_CATALOGO[tipo_idx]
+        )
+
+    def _primero(self, clave: bytes) -> int:
+        """Primer registro con código >= clave."""
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._codigo(mid) < clave:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, codigo: Any, tipo: Optional[str] = None) -> Optional[CatalogEntry]:
+        """La entrada del código (del tipo indicado, si se pasa ``tipo``) o None."""
+        clave = canonical_codigo(codigo).encode('utf-8')
+        if not clave:
+            return None
+
+        i = self._primero(clave)
+        while i < self._n and self._codigo(i) == clave:
+            entrada = self._entrada(i)
+            if tipo is None or entrada.tipo == tipo:
+                return entrada
+            i += 1
+
+        # Expediente CUM sin consecutivo: cualquier ``expediente-consecutivo`` del CUM
+        if b'-' in clave or tipo not in (None, 'CUM'):
+            return None
+        prefijo = clave + b'-'
+        i = self._primero(prefijo)
+        while i < self._n and self._codigo(i).startswith(prefijo):
+            entrada = self._entrada(i)
+            if entrada.tipo == 'CUM':
+                return entrada
+            i += 1
+        return None
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'path': self.path, 'entries': self._n, 'bytes': len(self._mm)}
+
+
+def find_unknown_codes(rips_data: RIPSData, catalogo: CodeCatalog) -> List[str]:
+    """
+    Advertencias por cada código de consulta, procedimiento o medicamento del RIPS que
+    no está en el catálogo (un mensaje por código distinto, en orden de aparición).
+
+    Un código desconocido no implica que el ministerio rechace la NC (puede ser un
+    código propio del prestador), así que quien llama las reporta sin bloquear el envío.
+    """
+    advertencias = []
+    vistos = set()
+    for usuario in RIPSProcessor.iter_usuarios(rips_data):
+        servicios = usuario.get('servicios') or {}
+        for tipo_servicio, (campo, tipo) in CODIGOS_VALIDABLES.items():
+            for servicio in servicios.get(tipo_servicio) or ():
+                codigo = normalize_codigo(servicio.get(campo))
+                if not codigo or (tipo_servicio, canonical_codigo(codigo)) in vistos:
+                    continue
+                vistos.add((tipo_servicio, canonical_codigo(codigo)))
+                if catalogo.get(codigo, tipo) is None:
+                    advertencias.append(f"{campo} {codigo} ({tipo_servicio}) no existe en el catálogo {tipo}")
+    return advertencias
+
+
+_catalogo: Optional[CodeCatalog] = None
+_catalogo_path: Optional[str] = None
+_catalogo_lock = threading.Lock()
+
+
+def get_code_catalog() -> Optional[CodeCatalog]:
+    """
+    Catálogo configurado en ``code_catalog_path`` (abierto una vez por proceso), o None
+    si no hay catálogo configurado o no se puede abrir.
+    """
+    global _catalogo, _catalogo_path
+
+    path = settings.code_catalog_path
+    if path == _catalogo_path:
+        return _catalogo
+
+    # El armado del batch corre en hilos: solo uno abre el archivo
+    with _catalogo_lock:
+        if path != _catalogo_path:
+            _close_locked()
+            if path:
+                try:
+                    _catalogo = CodeCatalog(path)
+                    logger.info(f"[CodeCatalog] {len(_catalogo)} códigos cargados de {path}")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"[CodeCatalog] No se pudo abrir el catálogo {path}: {e}")
+            _catalogo_path = path
+        return _catalogo
+
+
+def _close_locked() -> None:
+    global _catalogo, _catalogo_path
+
+    if _catalogo is not None:
+        _catalogo.close()
+    _catalogo = None
+    _catalogo_path = None
+
+
+def close_code_catalog() -> None:
+    """Cierra el catálogo abierto (se llama al apagar la aplicación)."""
+    with _catalogo_lock:
+        _close_locked()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compila los catálogos CUPS/CUM a un índice binario")
+    parser.add_argument('-o', '--output', required=True, help="Archivo de salida (CODE_CATALOG_PATH)")
+    parser.add_argument('--cups', action='append', default=[], help="CSV del catálogo CUPS")
+    parser.add_argument('--cups-codigo', default='codigo', help="Columna del código CUPS")
+    parser.add_argument('--cups-nombre', default='nombre', help="Columna del nombre CUPS")
+    parser.add_argument('--cum', action='append', default=[], help="CSV del catálogo CUM")
+    parser.add_argument('--cum-codigo', default='expediente,consecutivocum',
+                        help="Columna(s) del código CUM, separadas por coma (se unen con '-')")
+    parser.add_argument('--cum-nombre', default='descripcioncomercial', help="Columna del nombre CUM")
+    args = parser.parse_args(argv)
+
+    def entradas():
+        for path in args.cups:
+            yield from read_catalog_csv(path, 'CUPS', args.cups_codigo.split(','), args.cups_nombre)
+        for path in args.cum:
+            yield from read_catalog_csv(path, 'CUM', args.cum_codigo.split(','), args.cum_nombre)
+
+    total = compile_catalog(entradas(), args.output)
+    print(f"{total} códigos escritos en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
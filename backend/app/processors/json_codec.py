@@ -0,0 +1,93 @@
+"""
+Codificación y decodificación JSON de la aplicación.
+
+Usa orjson si está instalado (opcional) y la librería estándar si no. Hay dos modos:
+
+- compacto (``dumps``): bytes UTF-8 sin espacios, para enviar al ministerio y persistir
+- legible (``dumps_pretty``): texto indentado, solo para exportaciones que lee una persona
+
+El backend se elige con ``JSON_BACKEND`` (auto, orjson o json).
+"""
+
+import json
+import logging
+from collections.abc import Mapping
+from typing import Any, Callable, Optional, Union
+
+from app.config import settings
+from app.processors.service_overlay import ServiceOverlay
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+if settings.json_backend == 'orjson' and orjson is None:
+    logger.warning("[json_codec] JSON_BACKEND=orjson pero orjson no está instalado; se usa json")
+
+USE_ORJSON = orjson is not None and settings.json_backend in ('auto', 'orjson')
+BACKEND = 'orjson' if USE_ORJSON else 'json'
+
+# Error de decodificación de ambos backends (orjson.JSONDecodeError hereda de este)
+JSONDecodeError = json.JSONDecodeError
+
+Default = Optional[Callable[[Any], Any]]
+
+
+def _with_mappings(default: Default) -> Callable[[Any], Any]:
+    """
+    Hook ``default`` que serializa cualquier Mapping (p.ej. ServiceOverlay) como objeto.
+
+    Ni orjson ni json aceptan un Mapping que no sea dict, así que cada overlay se
+    convierte con ``to_dict()`` justo cuando el encoder llega a él; ese dict se codifica
+    y se libera antes de pasar al siguiente, de modo que solo hay una copia viva a la vez
+    (la memoria pico depende del JSON de salida, no de la cantidad de servicios copiados).
+    """
+    def hook(obj: Any) -> Any:
+        if type(obj) is ServiceOverlay:
+            return obj.to_dict()
+        if isinstance(obj, Mapping):
+            return dict(obj)
+        if default is not None:
+            return default(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return hook
+
+
+if USE_ORJSON:
+    _OPCIONES = orjson.OPT_NON_STR_KEYS
+    _OPCIONES_PRETTY = _OPCIONES | orjson.OPT_INDENT_2
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Decodifica JSON desde texto o bytes UTF-8."""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, default: Default = None) -> bytes:
+    """JSON compacto en bytes UTF-8 (sin espacios, sin escapar caracteres no ASCII)."""
+    default = _with_mappings(default)
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default, option=_OPCIONES)
+        except orjson.JSONEncodeError:
+            # Enteros de más de 64 bits u otros tipos que orjson no acepta
+            pass
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_pretty(obj: Any, default: Default = None) -> str:
+    """JSON indentado (2 espacios) para exportaciones legibles."""
+    default = _with_mappings(default)
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default, option=_OPCIONES_PRETTY).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, default=default, ensure_ascii=False, indent=2)
@@ -0,0 +1,105 @@
+"""
+Montos en centavos enteros.
+
+Los montos del XML, del RIPS y de los modelos se convierten a ``Cents`` (int) para
+sumarlos y compararlos de forma exacta, sin tolerancias de float. El redondeo a
+centavos es half-up (``1.005`` -> 101); los float se redondean según su representación
+decimal más corta. ``format_cents`` y ``from_cents`` vuelven a texto o a pesos.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Iterable
+
+# Montos en centavos enteros: sumas y comparaciones exactas, sin tolerancias de float
+Cents = int
+
+# Por debajo de este valor (en centavos) el error de value * 100 es mucho menor a 1e-6
+_FLOAT_EXACTO = 1e9
+
+
+def _digits_to_cents(entero: str, fraccion: str) -> Cents:
+    """Centavos de la parte entera y decimal (sin signo), redondeo half-up."""
+    cents = int(entero or '0') * 100
+    if fraccion:
+        cents += int(fraccion[:2]) * (10 if len(fraccion) == 1 else 1)
+        if len(fraccion) > 2 and fraccion[2] >= '5':
+            cents += 1
+    return cents
+
+
+def _parse_decimal_text(text: str) -> Cents:
+    """Centavos de un número decimal en texto ('38900', '38900.00', '-1.005'), redondeo half-up."""
+    entero, _, fraccion = text.partition('.')
+    # Caso común: dígitos con punto decimal opcional
+    if entero.isdecimal() and (not fraccion or fraccion.isdecimal()):
+        return _digits_to_cents(entero, fraccion)
+
+    limpio = text.strip()
+    negativo = limpio.startswith('-')
+    entero, _, fraccion = (limpio[1:] if limpio[:1] in '+-' else limpio).partition('.')
+    if (entero or fraccion) and (not entero or entero.isdecimal()) and (not fraccion or fraccion.isdecimal()):
+        cents = _digits_to_cents(entero, fraccion)
+        return -cents if negativo else cents
+    # Notación científica u otros formatos: vía Decimal
+    try:
+        return int((Decimal(limpio) * 100).to_integral_value(ROUND_HALF_UP))
+    except ArithmeticError:
+        raise ValueError(f"Monto inválido: {text!r}") from None
+
+
+def _float_to_cents(value: float) -> Cents:
+    """Centavos de un float; solo los casos cercanos a medio centavo pasan por ``repr``."""
+    escalado = value * 100
+    if abs(escalado) < _FLOAT_EXACTO:
+        redondeado = round(escalado)
+        if abs(abs(escalado - redondeado) - 0.5) > 1e-6:
+            return redondeado
+    # 0.285 * 100 = 28.499999...: se decide con la representación decimal más corta
+    return _parse_decimal_text(repr(value))
+
+
+def to_cents(value: Any) -> Cents:
+    """
+    Convierte un monto a centavos enteros.
+
+    Acepta texto del XML/JSON, int, float o Decimal. Los float se redondean según su
+    representación decimal más corta (``repr``), de modo que 0.285 da 29 y no 28.
+    None cuenta como 0; un bool no es un monto (TypeError).
+    """
+    if isinstance(value, bool):
+        raise TypeError(f"Monto inválido: {value!r}")
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return _float_to_cents(value)
+    if isinstance(value, str):
+        return _parse_decimal_text(value)
+    if value is None:
+        return 0
+    if isinstance(value, Decimal):
+        return int((value * 100).to_integral_value(ROUND_HALF_UP))
+    if isinstance(value, bytes):
+        return _parse_decimal_text(value.decode('ascii'))
+    return _parse_decimal_text(str(value))
+
+
+def from_cents(cents: Cents) -> float:
+    """Monto en pesos (float) para los modelos de respuesta."""
+    return cents / 100
+
+
+def format_cents(cents: Cents) -> str:
+    """Monto con dos decimales para el XML (ej: 123456 -> '1234.56')."""
+    signo = '-' if cents < 0 else ''
+    entero, centavos = divmod(abs(cents), 100)
+    return f"{signo}{entero}.{centavos:02d}"
+
+
+def sum_cents(values: Iterable[Any]) -> Cents:
+    """Suma exacta de montos en centavos."""
+    return sum(to_cents(v) for v in values)
+
+
+def montos_iguales(a: Any, b: Any) -> bool:
+    """True si los dos montos son iguales al centavo."""
+    return to_cents(a) == to_cents(b)
@@ -1,80 +1,239 @@
-import json
-from typing import List, Dict, Any, Optional
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Deque, Iterable, Optional, Sequence, Tuple, Union
 from app.models import ServicioRIPS
+from app.processors import json_codec
+from app.processors.money import Cents, from_cents, to_cents
+from app.processors.rips_stream import RIPSStream
+from app.processors.service_overlay import ServiceOverlay
+
+# RIPS parseado completo (json.loads) o leído por usuario
+RIPSData = Union[Dict[str, Any], RIPSStream]
+
+# Campos de cada tipo de servicio: código, nombre, valor unitario y cantidad (None: 1)
+CAMPOS_SERVICIO = {
+    'medicamentos': ('codTecnologiaSalud', 'nomTecnologiaSalud', 'vrUnitMedicamento', 'cantidadMedicamento'),
+    'otrosServicios': ('codTecnologiaSalud', 'nomTecnologiaSalud', 'vrUnitOS', 'cantidadOS'),
+    'procedimientos': ('codProcedimiento', 'descripcion', 'vrServicio', 'cantidad'),
+    'consultas': ('codConsulta', 'descripcion', 'vrServicio', None),
+}
+TIPOS_SERVICIO = tuple(CAMPOS_SERVICIO)
+
+
+@dataclass
+class RIPSTotals:
+    """Totales de vrServicio del RIPS en centavos, por tipo de servicio y por usuario."""
+    total: Cents = 0
+    por_tipo: Dict[str, Cents] = field(default_factory=dict)
+    # (numDocumentoIdentificacion, total) en el orden de los usuarios
+    por_usuario: List[Tuple[Optional[str], Cents]] = field(default_factory=list)
+
+
+class ServiceRow:
+    """Vista de una fila de ServiceTable con los mismos atributos que ServicioRIPS."""
+
+    __slots__ = ('_table', '_i')
+
+    def __init__(self, table: "ServiceTable", i: int):
+        self._table = table
+        self._i = i
+
+    @property
+    def tipo(self) -> str:
+        return TIPOS_SERVICIO[self._table.tipos[self._i]]
+
+    @property
+    def codigo(self) -> str:
+        return self._table.codigos[self._i]
+
+    @property
+    def nombre(self) -> str:
+        if self._table.nombres is not None:
+            return self._table.nombres[self._i]
+        return self.datos_completos.get(CAMPOS_SERVICIO[self.tipo][1], '')
+
+    @property
+    def valor_unitario(self) -> float:
+        return self._table.valores_unitarios[self._i]
+
+    @property
+    def cantidad_original(self) -> float:
+        return self._table.cantidades[self._i]
+
+    @property
+    def datos_completos(self) -> Dict[str, Any]:
+        table, i = self._table, self._i
+        tipo = TIPOS_SERVICIO[table.tipos[i]]
+        return table.usuario(table.usuario_idx[i])['servicios'][tipo][table.servicio_idx[i]]
+
+    def to_model(self) -> ServicioRIPS:
+        return ServicioRIPS(
+            tipo=self.tipo,
+            codigo=self.codigo,
+            nombre=self.nombre,
+            valor_unitario=self.valor_unitario,
+            cantidad_original=self.cantidad_original,
+            datos_completos=self.datos_completos
+        )
+
+
+class ServiceTable:
+    """
+    Servicios del RIPS en columnas, con un índice por (tipo, código).
+
+    Guarda arreglos paralelos (tipo, código, valor unitario y cantidad) y la posición
+    de cada servicio en el JSON parseado (usuario y servicio), sin copiar los datos.
+    Las filas se leen como ServiceRow (mismos atributos que ServicioRIPS); los modelos
+    pydantic solo se crean en la respuesta de la API con ``to_models()``.
+
+    El índice ``(tipo, codigo) -> [(usuario_idx, servicio_idx), ...]`` conserva el
+    orden del RIPS, de modo que generar el RIPS de la NC no vuelve a recorrer los
+    servicios de cada usuario por cada match.
+
+    Sobre un RIPSStream no se retienen los usuarios: se guarda también la columna de
+    nombres y ``datos_completos`` vuelve a leer el archivo hasta el usuario.
+    """
+
+    def __init__(self, source: Optional[RIPSData] = None):
+        self.source = source if source is not None else {}
+        # Usuarios en memoria (None si el RIPS se lee por streaming)
+        self.usuarios: Optional[List[Dict[str, Any]]] = (
+            None if isinstance(self.source, RIPSStream) else self.source.get('usuarios', [])
+        )
+        self.nombres: Optional[List[str]] = [] if self.usuarios is None else None
+        self.tipos = array('b')
+        self.codigos: List[str] = []
+        self.valores_unitarios = array('d')
+        self.cantidades = array('d')
+        self.usuario_idx = array('l')
+        self.servicio_idx = array('l')
+        self.indice: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+
+    @classmethod
+    def from_rips(cls, rips_data: Dict[str, Any]) -> "ServiceTable":
+        """Arma la tabla y el índice en un solo recorrido del RIPS."""
+        table = cls(rips_data)
+        nombres = table.nombres
+        for usuario_idx, usuario in enumerate(RIPSProcessor.iter_usuarios(rips_data)):
+            servicios = usuario.get('servicios', {})
+            for tipo_idx, tipo in enumerate(TIPOS_SERVICIO):
+                campo_codigo, campo_nombre, campo_valor, campo_cantidad = CAMPOS_SERVICIO[tipo]
+                for servicio_idx, servicio in enumerate(servicios.get(tipo, [])):
+                    codigo = servicio.get(campo_codigo)
+                    if nombres is not None:
+                        nombres.append(servicio.get(campo_nombre, ''))
+                    table.tipos.append(tipo_idx)
+                    table.codigos.append(codigo if codigo is not None else '')
+                    table.valores_unitarios.append(float(servicio.get(campo_valor, 0)))
+                    table.cantidades.append(
+                        float(servicio.get(campo_cantidad, 0)) if campo_cantidad else 1.0
+                    )
+                    table.usuario_idx.append(usuario_idx)
+                    table.servicio_idx.append(servicio_idx)
+                    if codigo is not None:
+                        table.indice.setdefault((tipo, codigo), []).append((usuario_idx, servicio_idx))
+        return table
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def __getitem__(self, i: int) -> ServiceRow:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('ServiceTable index out of range')
+        return ServiceRow(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ServiceRow(self, i)
+
+    def to_models(self) -> List[ServicioRIPS]:
+        """ServicioRIPS de todas las filas (para respuestas de la API)."""
+        return [row.to_model() for row in self]
+
+    def describes(self, rips_data: RIPSData) -> bool:
+        """True si la tabla se construyó a partir de ``rips_data``."""
+        return self.source is rips_data
+
+    def usuario(self, usuario_idx: int) -> Dict[str, Any]:
+        """Usuario original en la posición ``usuario_idx``."""
+        if self.usuarios is not None:
+            return self.usuarios[usuario_idx]
+        return self.source.usuario(usuario_idx)
+
+    def primeros_por_usuario(self, tipo: str, codigo: str):
+        """Primer servicio de cada usuario con ese código: (usuario_idx, servicio_idx)."""
+        ultimo_usuario = -1
+        for usuario_idx, servicio_idx in self.indice.get((tipo, codigo), ()):
+            if usuario_idx != ultimo_usuario:
+                ultimo_usuario = usuario_idx
+                yield usuario_idx, servicio_idx
+
+
+def index_by_codigo(servicios: Sequence) -> Dict[str, Deque[int]]:
+    """
+    Índice ``codigo -> posiciones`` de los servicios (ServiceTable o lista de ServicioRIPS).
+
+    Las posiciones quedan en el orden de la lista, así que el frente de cada cola es
+    el primer servicio con ese código; quien consume servicios los saca con popleft().
+    """
+    if isinstance(servicios, ServiceTable):
+        codigos = servicios.codigos
+    else:
+        codigos = [s.codigo for s in servicios]
+    indice: Dict[str, Deque[int]] = {}
+    for i, codigo in enumerate(codigos):
+        cola = indice.get(codigo)
+        if cola is None:
+            cola = indice[codigo] = deque()
+        cola.append(i)
+    return indice
 
 
 class RIPSProcessor:
     """Procesador de archivos RIPS JSON."""
 
     @staticmethod
-    def parse_rips(rips_json: str) -> Dict[str, Any]:
+    def parse_rips(rips_json: Union[str, bytes]) -> Dict[str, Any]:
         """Parsea el JSON RIPS."""
-        return json.loads(rips_json)
+        return json_codec.loads(rips_json)
 
     @staticmethod
-    def get_all_services(rips_data: Dict[str, Any]) -> List[ServicioRIPS]:
-        """Extrae todos los servicios del RIPS en una lista plana."""
-        services = []
-
-        usuarios = rips_data.get('usuarios', [])
-        for usuario in usuarios:
-            servicios = usuario.get('servicios', {})
+    def iter_usuarios(rips_data: RIPSData) -> Iterable[Dict[str, Any]]:
+        """Usuarios del RIPS, ya sea parseado completo o leído por streaming."""
+        if isinstance(rips_data, RIPSStream):
+            return rips_data.usuarios()
+        return rips_data.get('usuarios', [])
 
-            # Medicamentos
-            for med in servicios.get('medicamentos', []):
-                services.append(ServicioRIPS(
-                    tipo='medicamentos',
-                    codigo=med.get('codTecnologiaSalud', ''),
-                    nombre=med.get('nomTecnologiaSalud', ''),
-                    valor_unitario=float(med.get('vrUnitMedicamento', 0)),
-                    cantidad_original=float(med.get('cantidadMedicamento', 0)),
-                    datos_completos=med
-                ))
-
-            # Otros Servicios
-            for os in servicios.get('otrosServicios', []):
-                services.append(ServicioRIPS(
-                    tipo='otrosServicios',
-                    codigo=os.get('codTecnologiaSalud', ''),
-                    nombre=os.get('nomTecnologiaSalud', ''),
-                    valor_unitario=float(os.get('vrUnitOS', 0)),
-                    cantidad_original=float(os.get('cantidadOS', 0)),
-                    datos_completos=os
-                ))
-
-            # Procedimientos
-            for proc in servicios.get('procedimientos', []):
-                services.append(ServicioRIPS(
-                    tipo='procedimientos',
-                    codigo=proc.get('codProcedimiento', ''),
-                    nombre=proc.get('descripcion', ''),
-                    valor_unitario=float(proc.get('vrServicio', 0)),
-                    cantidad_original=float(proc.get('cantidad', 0)),
-                    datos_completos=proc
-                ))
-
-            # Consultas
-            for cons in servicios.get('consultas', []):
-                services.append(ServicioRIPS(
-                    tipo='consultas',
-                    codigo=cons.get('codConsulta', ''),
-                    nombre=cons.get('descripcion', ''),
-                    valor_unitario=float(cons.get('vrServicio', 0)),
-                    cantidad_original=1.0,
-                    datos_completos=cons
-                ))
-
-        return services
+    @staticmethod
+    def get_all_services(rips_data: RIPSData) -> ServiceTable:
+        """Extrae todos los servicios del RIPS en una tabla plana indexada por (tipo, código)."""
+        return ServiceTable.from_rips(rips_data)
 
     @staticmethod
     def generate_nc_rips(
-        rips_data: Dict[str, Any],
+        rips_data: RIPSData,
         num_nota: str,
         matches: List[Dict[str, Any]],
         es_caso_colesterol: bool = False,
-        codigos_igualados_a_cero: Optional[set] = None
+        codigos_igualados_a_cero: Optional[set] = None,
+        catalogo: Optional[ServiceTable] = None
     ) -> Dict[str, Any]:
-        """Genera el RIPS filtrado para la Nota Crédito."""
+        """
+        Genera el RIPS filtrado para la Nota Crédito.
+
+        Cada match agrega a cada usuario el primer servicio del tipo con ese código.
+        Si se pasa la tabla de ``get_all_services`` se reutiliza su índice; si no,
+        se arma uno en un recorrido del RIPS. Los servicios de la NC se arman en un
+        segundo recorrido de los usuarios, así que con un RIPSStream solo se retiene
+        el resultado.
+
+        Cada servicio de la NC es un ServiceOverlay sobre el original (solo guarda los
+        campos cambiados); ``json_codec`` los serializa directamente y
+        ``service_overlay.materialize`` los convierte a dicts si hace falta.
+        """
         # Copiar estructura base
         nc_rips = {
             "numDocumentoIdObligado": rips_data.get("numDocumentoIdObligado", ""),
@@ -84,6 +243,9 @@ class RIPSProcessor:
             "usuarios": []
         }
 
+        if not isinstance(catalogo, ServiceTable) or not catalogo.describes(rips_data):
+            catalogo = ServiceTable.from_rips(rips_data)
+
         # Agrupar matches por tipo de servicio
         services_by_type: Dict[str, List[Dict]] = {}
         for match in matches:
@@ -91,10 +253,36 @@ class RIPSProcessor:
             if tipo not in services_by_type:
                 services_by_type[tipo] = []
             services_by_type[tipo].append(match)
+        tipos = [tipo for tipo in services_by_type if tipo in _CONSTRUCTORES_NC]
+
+        # Plan: (servicio_idx, match) por usuario y tipo, en el orden de los matches
+        plan: Dict[int, Dict[str, List[Tuple[int, Dict]]]] = {}
+        for tipo in tipos:
+            for match in services_by_type[tipo]:
+                for usuario_idx, servicio_idx in catalogo.primeros_por_usuario(tipo, match['codigo_rips']):
+                    plan.setdefault(usuario_idx, {}).setdefault(tipo, []).append((servicio_idx, match))
+
+        # Solo se agregan usuarios con servicios, en el orden del RIPS
+        pendientes = len(plan)
+        for usuario_idx, usuario in enumerate(RIPSProcessor.iter_usuarios(rips_data)):
+            if not pendientes:
+                break
+            plan_usuario = plan.get(usuario_idx)
+            if plan_usuario is None:
+                continue
+            pendientes -= 1
+
+            servicios_originales = usuario.get('servicios', {})
+            servicios_nc: Dict[str, List[ServiceOverlay]] = {}
+            for tipo, items in plan_usuario.items():
+                construir = _CONSTRUCTORES_NC[tipo]
+                originales = servicios_originales[tipo]
+                lista = servicios_nc[tipo] = []
+                for servicio_idx, match in items:
+                    servicio_nc = construir(originales[servicio_idx], match, es_caso_colesterol, codigos_igualados_a_cero)
+                    servicio_nc['consecutivo'] = len(lista) + 1
+                    lista.append(servicio_nc)
 
-        # Procesar usuarios
-        usuarios = rips_data.get('usuarios', [])
-        for usuario in usuarios:
             nc_usuario = {
                 "tipoDocumentoIdentificacion": usuario.get("tipoDocumentoIdentificacion"),
                 "numDocumentoIdentificacion": usuario.get("numDocumentoIdentificacion"),
@@ -107,134 +295,93 @@ class RIPSProcessor:
                 "incapacidad": usuario.get("incapacidad"),
                 "consecutivo": usuario.get("consecutivo"),
                 "codPaisOrigen": usuario.get("codPaisOrigen"),
-                "servicios": {}
+                # Todos los tipos con matches, aunque el usuario no tenga servicios de alguno
+                "servicios": {tipo: servicios_nc.get(tipo, []) for tipo in tipos}
             }
-
-            servicios_originales = usuario.get('servicios', {})
-
-            # Procesar cada tipo de servicio
-            for tipo, tipo_matches in services_by_type.items():
-                if tipo == 'medicamentos':
-                    nc_usuario['servicios']['medicamentos'] = RIPSProcessor._process_medicamentos(
-                        servicios_originales.get('medicamentos', []),
-                        tipo_matches,
-                        codigos_igualados_a_cero
-                    )
-                elif tipo == 'otrosServicios':
-                    nc_usuario['servicios']['otrosServicios'] = RIPSProcessor._process_otros_servicios(
-                        servicios_originales.get('otrosServicios', []),
-                        tipo_matches,
-                        codigos_igualados_a_cero
-                    )
-                elif tipo == 'procedimientos':
-                    nc_usuario['servicios']['procedimientos'] = RIPSProcessor._process_procedimientos(
-                        servicios_originales.get('procedimientos', []),
-                        tipo_matches,
-                        es_caso_colesterol,
-                        codigos_igualados_a_cero
-                    )
-                elif tipo == 'consultas':
-                    nc_usuario['servicios']['consultas'] = RIPSProcessor._process_consultas(
-                        servicios_originales.get('consultas', []),
-                        tipo_matches,
-                        codigos_igualados_a_cero
-                    )
-
-            # Solo agregar usuario si tiene servicios
-            if any(nc_usuario['servicios'].values()):
-                nc_rips['usuarios'].append(nc_usuario)
+            nc_rips['usuarios'].append(nc_usuario)
 
         return nc_rips
 
     @staticmethod
-    def _process_medicamentos(meds_originales: List[Dict], matches: List[Dict], codigos_igualados_a_cero: Optional[set] = None) -> List[Dict]:
-        """Procesa medicamentos para la NC."""
-        result = []
-        for match in matches:
-            codigo = match['codigo_rips']
-            for med in meds_originales:
-                if med.get('codTecnologiaSalud') == codigo:
-                    med_nc = dict(med)
-                    cantidad = 1
-                    med_nc['cantidadMedicamento'] = cantidad
-                    if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
-                        med_nc['vrServicio'] = 0
-                        med_nc['vrUnitMedicamento'] = 0
-                    else:
-                        med_nc['vrServicio'] = match['valor_nc']
-                        med_nc['vrUnitMedicamento'] = match['valor_nc'] / cantidad if cantidad > 0 else 0
-                    med_nc['consecutivo'] = len(result) + 1
-                    result.append(med_nc)
-                    break
-        return result
+    def _nc_medicamento(med: Dict, match: Dict, es_caso_colesterol: bool = False, codigos_igualados_a_cero: Optional[set] = None) -> ServiceOverlay:
+        """Medicamento para la NC a partir del original."""
+        codigo = match['codigo_rips']
+        cantidad = 1
+        if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
+            valor, valor_unitario = 0, 0
+        else:
+            valor = match['valor_nc']
+            valor_unitario = match['valor_nc'] / cantidad if cantidad > 0 else 0
+        return ServiceOverlay(med, {
+            'cantidadMedicamento': cantidad,
+            'vrServicio': valor,
+            'vrUnitMedicamento': valor_unitario,
+        })
 
     @staticmethod
-    def _process_otros_servicios(os_originales: List[Dict], matches: List[Dict], codigos_igualados_a_cero: Optional[set] = None) -> List[Dict]:
-        """Procesa otros servicios para la NC."""
-        result = []
-        for match in matches:
-            codigo = match['codigo_rips']
-            for os in os_originales:
-                if os.get('codTecnologiaSalud') == codigo:
-                    os_nc = dict(os)
-                    cantidad = 1
-                    os_nc['cantidadOS'] = cantidad
-                    if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
-                        os_nc['vrServicio'] = 0
-                        os_nc['vrUnitOS'] = 0
-                    else:
-                        os_nc['vrServicio'] = match['valor_nc']
-                        os_nc['vrUnitOS'] = match['valor_nc'] / cantidad if cantidad > 0 else 0
-                    os_nc['consecutivo'] = len(result) + 1
-                    result.append(os_nc)
-                    break
-        return result
+    def _nc_otro_servicio(os: Dict, match: Dict, es_caso_colesterol: bool = False, codigos_igualados_a_cero: Optional[set] = None) -> ServiceOverlay:
+        """Otro servicio para la NC a partir del original."""
+        codigo = match['codigo_rips']
+        cantidad = 1
+        if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
+            valor, valor_unitario = 0, 0
+        else:
+            valor = match['valor_nc']
+            valor_unitario = match['valor_nc'] / cantidad if cantidad > 0 else 0
+        return ServiceOverlay(os, {
+            'cantidadOS': cantidad,
+            'vrServicio': valor,
+            'vrUnitOS': valor_unitario,
+        })
 
     @staticmethod
-    def _process_procedimientos(proc_originales: List[Dict], matches: List[Dict], es_caso_colesterol: bool = False, codigos_igualados_a_cero: Optional[set] = None) -> List[Dict]:
-        """Procesa procedimientos para la NC."""
-        result = []
-        for match in matches:
-            codigo = match['codigo_rips']
-            for proc in proc_originales:
-                if proc.get('codProcedimiento') == codigo:
-                    proc_nc = {k: v for k, v in proc.items()}
-                    valor = match['valor_nc']
-                    if es_caso_colesterol and codigo == '903816':
-                        valor = 0
-                    if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
-                        valor = 0
-                    proc_nc['vrServicio'] = valor
-                    proc_nc['consecutivo'] = len(result) + 1
-                    result.append(proc_nc)
-                    break
-        return result
+    def _nc_procedimiento(proc: Dict, match: Dict, es_caso_colesterol: bool = False, codigos_igualados_a_cero: Optional[set] = None) -> ServiceOverlay:
+        """Procedimiento para la NC a partir del original."""
+        codigo = match['codigo_rips']
+        valor = match['valor_nc']
+        if es_caso_colesterol and codigo == '903816':
+            valor = 0
+        if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
+            valor = 0
+        return ServiceOverlay(proc, {'vrServicio': valor})
 
     @staticmethod
-    def _process_consultas(cons_originales: List[Dict], matches: List[Dict], codigos_igualados_a_cero: Optional[set] = None) -> List[Dict]:
-        """Procesa consultas para la NC."""
-        result = []
-        for match in matches:
-            codigo = match['codigo_rips']
-            for cons in cons_originales:
-                if cons.get('codConsulta') == codigo:
-                    cons_nc = {k: v for k, v in cons.items()}
-                    if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
-                        cons_nc['vrServicio'] = 0
-                    else:
-                        cons_nc['vrServicio'] = match['valor_nc']
-                    cons_nc['consecutivo'] = len(result) + 1
-                    result.append(cons_nc)
-                    break
-        return result
+    def _nc_consulta(cons: Dict, match: Dict, es_caso_colesterol: bool = False, codigos_igualados_a_cero: Optional[set] = None) -> ServiceOverlay:
+        """Consulta para la NC a partir de la original."""
+        codigo = match['codigo_rips']
+        if codigos_igualados_a_cero and codigo in codigos_igualados_a_cero:
+            valor = 0
+        else:
+            valor = match['valor_nc']
+        return ServiceOverlay(cons, {'vrServicio': valor})
 
     @staticmethod
-    def calculate_total(rips_data: Dict[str, Any]) -> float:
-        """Calcula el total de vrServicio en el RIPS."""
-        total = 0.0
-        for usuario in rips_data.get('usuarios', []):
-            servicios = usuario.get('servicios', {})
-            for tipo, lista in servicios.items():
+    def calculate_totals(rips_data: RIPSData) -> RIPSTotals:
+        """Totales exactos (centavos) de vrServicio en un recorrido del RIPS."""
+        totales = RIPSTotals()
+        por_tipo = totales.por_tipo
+        for usuario in RIPSProcessor.iter_usuarios(rips_data):
+            total_usuario = 0
+            for tipo, lista in usuario.get('servicios', {}).items():
+                total_tipo = 0
                 for servicio in lista:
-                    total += float(servicio.get('vrServicio', 0))
-        return total
+                    total_tipo += to_cents(servicio.get('vrServicio', 0))
+                por_tipo[tipo] = por_tipo.get(tipo, 0) + total_tipo
+                total_usuario += total_tipo
+            totales.por_usuario.append((usuario.get('numDocumentoIdentificacion'), total_usuario))
+            totales.total += total_usuario
+        return totales
+
+    @staticmethod
+    def calculate_total(rips_data: RIPSData) -> float:
+        """Calcula el total de vrServicio en el RIPS."""
+        return from_cents(RIPSProcessor.calculate_totals(rips_data).total)
+
+
+# Constructor del servicio de la NC por tipo
+_CONSTRUCTORES_NC = {
+    'medicamentos': RIPSProcessor._nc_medicamento,
+    'otrosServicios': RIPSProcessor._nc_otro_servicio,
+    'procedimientos': RIPSProcessor._nc_procedimiento,
+    'consultas': RIPSProcessor._nc_consulta,
+}
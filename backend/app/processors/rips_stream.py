@@ -0,0 +1,180 @@
+import codecs
+import io
+import json
+import re
+from itertools import islice
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Union
+
+# Bytes leídos del archivo por bloque
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Tamaño máximo de un valor JSON (p.ej. un usuario) que se acumula en el buffer
+MAX_VALUE_SIZE = 256 * 1024 * 1024
+
+# Un error a menos de esto del final del buffer puede ser solo un valor cortado
+# (literal, número o escape \uXXXX incompletos) y se reintenta con otro bloque
+_MARGEN_TRUNCADO = 6
+
+# Campos de cabecera que se necesitan antes de recorrer los usuarios
+CAMPOS_CABECERA = ('numDocumentoIdObligado', 'numFactura')
+
+_WS_RE = re.compile(r'[ \t\n\r]*')
+
+
+class _JSONScanner:
+    """
+    Lector incremental de valores JSON sobre un archivo binario UTF-8.
+
+    Mantiene en memoria solo el bloque actual: cada valor se decodifica con
+    ``JSONDecoder.raw_decode`` y, si el buffer se queda corto, se lee otro bloque
+    (al menos del tamaño del buffer, para no re-decodificar valores grandes muchas veces).
+    Un error de sintaxis dentro del texto ya leído se propaga sin leer más, y un valor
+    que no termina en ``max_value_size`` caracteres se rechaza.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int, max_value_size: int = MAX_VALUE_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._max_value_size = max_value_size
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, minimum: int = 0) -> bool:
+        """Agrega un bloque al buffer descartando lo ya consumido. False al final del archivo."""
+        if self._eof:
+            return False
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        data = self._stream.read(max(self._chunk_size, minimum))
+        if not data:
+            self._eof = True
+            self._buf += self._decoder.decode(b'', final=True)
+            return False
+        self._buf += self._decoder.decode(data)
+        return True
+
+    def peek(self) -> str:
+        """Siguiente carácter que no es espacio ('' al final del archivo)."""
+        while True:
+            self._pos = _WS_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def take(self, expected: str) -> str:
+        """Consume el siguiente carácter, que debe estar en ``expected``."""
+        char = self.peek()
+        if not char or char not in expected:
+            raise json.JSONDecodeError(f"Expecting one of {expected!r}", self._buf, self._pos)
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decodifica el siguiente valor JSON completo."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                truncado = e.pos >= len(self._buf) - _MARGEN_TRUNCADO or e.msg.startswith('Unterminated string')
+                if not truncado:
+                    raise
+                if len(self._buf) - self._pos >= self._max_value_size:
+                    raise json.JSONDecodeError(
+                        f"Value exceeds {self._max_value_size} characters", self._buf, self._pos
+                    ) from e
+                if self._fill(len(self._buf)):
+                    continue
+                raise
+            # Un número al final del buffer puede continuar en el siguiente bloque
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+class RIPSStream:
+    """
+    RIPS JSON leído de forma incremental: un usuario a la vez.
+
+    Los campos de cabecera (todo menos ``usuarios``) quedan en ``header`` al crear el
+    objeto; ``get()`` los consulta igual que en el dict de ``json.loads``. Cada llamada
+    a ``usuarios()`` vuelve a recorrer el archivo, así que la memoria usada depende del
+    usuario más grande y no del tamaño del RIPS.
+    """
+
+    def __init__(self, opener: Callable[[], BinaryIO], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._opener = opener
+        self.chunk_size = chunk_size
+        self.header = self._read_header()
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE) -> "RIPSStream":
+        path = Path(path)
+        return cls(lambda: open(path, 'rb'), chunk_size)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "RIPSStream":
+        return cls(lambda: io.BytesIO(data), chunk_size)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Campo de cabecera del RIPS."""
+        return self.header.get(key, default)
+
+    def _scan(self, header: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre el objeto raíz generando los usuarios.
+
+        Si se pasa ``header`` se llenan en él los demás campos y el recorrido termina al
+        llegar a ``usuarios`` cuando ya se leyeron los campos de CAMPOS_CABECERA.
+        """
+        with self._opener() as stream:
+            scanner = _JSONScanner(stream, self.chunk_size)
+            scanner.take('{')
+            if scanner.peek() == '}':
+                return
+            while True:
+                key = scanner.value()
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name", '', 0)
+                scanner.take(':')
+                if key != 'usuarios':
+                    value = scanner.value()
+                    if header is not None:
+                        header[key] = value
+                elif header is not None and all(campo in header for campo in CAMPOS_CABECERA):
+                    return
+                else:
+                    scanner.take('[')
+                    if scanner.peek() == ']':
+                        scanner.take(']')
+                    else:
+                        while True:
+                            yield scanner.value()
+                            if scanner.take(',]') == ']':
+                                break
+                if scanner.take(',}') == '}':
+                    return
+
+    def _read_header(self) -> Dict[str, Any]:
+        header: Dict[str, Any] = {}
+        for _ in self._scan(header):
+            # Cabecera después de los usuarios: se saltan sin retenerlos
+            pass
+        return header
+
+    def usuarios(self) -> Iterator[Dict[str, Any]]:
+        """Usuarios del RIPS en orden, decodificados uno a la vez."""
+        return self._scan()
+
+    def usuario(self, idx: int) -> Dict[str, Any]:
+        """Usuario en la posición ``idx`` (recorre el archivo hasta él)."""
+        for usuario in islice(self.usuarios(), idx, None):
+            return usuario
+        raise IndexError('usuario index out of range')
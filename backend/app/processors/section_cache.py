@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from app.config import settings
+from app.processors import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Valor guardado para distinguir "no está en caché" de un resultado None
+_MISS = object()
+
+
+def content_digest(content: Union[str, bytes]) -> str:
+    """Digest SHA-256 del contenido (clave de caché)."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+class SectionCache:
+    """
+    Caché LRU acotada de secciones extraídas de facturas, por digest de contenido.
+
+    Una misma factura suele aparecer en varias carpetas (varias NC parciales de una
+    misma factura); las secciones extraídas dependen solo del contenido, así que se
+    reutilizan. Si se indica ``persist_dir`` las entradas también se guardan en disco
+    (un JSON por clave) y sobreviven a reinicios; en disco se conservan hasta
+    ``max_disk_entries`` archivos, descartando los de uso más antiguo (0 desactiva el
+    disco). Es segura entre hilos (las etapas CPU del batch corren en hilos).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        persist_dir: Optional[Union[str, Path]] = None,
+        max_disk_entries: int = 4096
+    ):
+        self.max_entries = max(0, max_entries)
+        self.max_disk_entries = max(0, max_disk_entries)
+        # Sin cupo en disco no se persiste: cada escritura se podaría enseguida
+        self.persist_dir = Path(persist_dir) if persist_dir and self.max_disk_entries else None
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        # Archivos en disco estimados (otros workers también escriben; se recuenta al podar)
+        self._disk_entries = 0
+
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_entries = len(self._disk_files())
+
+    def _disk_files(self) -> List[Path]:
+        return list(self.persist_dir.glob('*.json'))
+
+    def _disk_path(self, key: str) -> Path:
+        return self.persist_dir / f"{key.replace(':', '_')}.json"
+
+    def _read_disk(self, key: str) -> Any:
+        if not self.persist_dir:
+            return _MISS
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = json_codec.loads(f.read())['value']
+            # La fecha de modificación marca el último uso para la poda del disco
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return _MISS
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"[SectionCache] Entrada en disco inválida {path.name}: {e}")
+            return _MISS
+
+    def _write_disk(self, key: str, value: Any) -> None:
+        if not self.persist_dir:
+            return
+        path = self._disk_path(key)
+        # Único por proceso e hilo: varios workers de uvicorn comparten el directorio
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json_codec.dumps({'value': value}))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"[SectionCache] No se pudo persistir {path.name}: {e}")
+            return
+
+        with self._lock:
+            self._disk_entries += 1
+            podar = self._disk_entries > self.max_disk_entries
+        if podar:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """
+        Deja en disco el 90% de ``max_disk_entries`` (los de uso más reciente), así la
+        poda corre cada tantas escrituras y no en cada una.
+        """
+        objetivo = self.max_disk_entries * 9 // 10
+        archivos = []
+        for path in self._disk_files():
+            try:
+                archivos.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        archivos.sort()
+        eliminados = 0
+        for _, path in archivos[:max(0, len(archivos) - objetivo)]:
+            try:
+                path.unlink()
+                eliminados += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_entries = len(archivos) - eliminados
+            self.disk_evictions += eliminados
+
+    def _store(self, key: str, value: Any) -> None:
+        """Guarda en memoria respetando el límite (llamar con el lock tomado)."""
+        if self.max_entries == 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Retorna el valor en caché (memoria o disco) o ``default``."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is _MISS:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, value)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Guarda un valor (debe ser serializable a JSON si hay persistencia)."""
+        with self._lock:
+            self._store(key, value)
+        self._write_disk(key, value)
+
+    def get_or_compute(self, key: str, compute):
+        """Retorna el valor en caché o lo calcula con ``compute()`` y lo guarda."""
+        value = self.get(key, _MISS)
+        if value is _MISS:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Vacía la caché (en memoria y en disco) y reinicia los contadores."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = self.evictions = self.disk_evictions = 0
+            self._disk_entries = 0
+        if self.persist_dir:
+            for path in self._disk_files():
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"[SectionCache] No se pudo borrar {path.name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores para dimensionar la caché."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'disk_entries': self._disk_entries,
+                'disk_evictions': self.disk_evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'persistente': self.persist_dir is not None,
+            }
+
+
+factura_section_cache = SectionCache(
+    max_entries=settings.factura_cache_size,
+    persist_dir=settings.factura_cache_dir or None,
+    max_disk_entries=settings.factura_cache_disk_size
+)
@@ -0,0 +1,85 @@
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+# Marca de un campo eliminado en la capa de cambios
+_ELIMINADO = object()
+
+
+class ServiceOverlay(MutableMapping):
+    """
+    Servicio del RIPS con algunos campos cambiados, sin copiar el original.
+
+    Los cambios (vrServicio, cantidad, consecutivo, ...) se guardan en una capa propia
+    y las lecturas caen al servicio original para el resto de campos. El orden de las
+    claves es el mismo que tendría ``dict(original)`` con los cambios aplicados, así
+    que al serializar el JSON es idéntico al de la copia completa. ``json_codec`` llama
+    a ``to_dict()`` en el momento de codificar cada servicio: la copia es temporal y no
+    se acumula. El original no se modifica.
+    """
+
+    __slots__ = ('_base', '_cambios')
+
+    def __init__(self, base: Mapping, cambios: Optional[Dict[str, Any]] = None):
+        # ``cambios`` pasa a ser la capa del overlay (no se copia)
+        self._base = base
+        self._cambios: Dict[str, Any] = cambios if cambios is not None else {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._cambios:
+            value = self._cambios[key]
+            if value is _ELIMINADO:
+                raise KeyError(key)
+            return value
+        return self._base[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._cambios[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._cambios[key] = _ELIMINADO
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._cambios:
+            return self._cambios[key] is not _ELIMINADO
+        return key in self._base
+
+    def __iter__(self) -> Iterator[str]:
+        cambios = self._cambios
+        for key in self._base:
+            if cambios.get(key) is not _ELIMINADO:
+                yield key
+        for key, value in cambios.items():
+            if key not in self._base and value is not _ELIMINADO:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"ServiceOverlay({dict(self)!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Copia plana con los cambios aplicados (mismo orden de claves que la iteración)."""
+        resultado = dict(self._base)
+        resultado.update(self._cambios)
+        if _ELIMINADO in self._cambios.values():
+            resultado = {k: v for k, v in resultado.items() if v is not _ELIMINADO}
+        return resultado
+
+    @property
+    def cambios(self) -> Dict[str, Any]:
+        """Campos cambiados respecto al original."""
+        return {k: v for k, v in self._cambios.items() if v is not _ELIMINADO}
+
+
+def materialize(value: Any) -> Any:
+    """Copia ``value`` reemplazando los ServiceOverlay (y otros Mapping) por dicts."""
+    if isinstance(value, list):
+        return [materialize(v) for v in value]
+    if isinstance(value, Mapping):
+        if isinstance(value, ServiceOverlay):
+            return value.to_dict()
+        return {k: materialize(v) for k, v in value.items()}
+    return value
@@ -0,0 +1,450 @@
+import re
+from array import array
+from bisect import bisect_left
+from functools import cached_property, lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.models import LineaNC
+from app.processors.money import Cents, from_cents, sum_cents, to_cents
+from app.processors.section_cache import content_digest, factura_section_cache
+from app.processors.xml_rewriter import XMLText
+
+# Etiquetas de apertura/cierre (<cbc:ID ...>, </cbc:ID>); ignora <?xml, <!-- y <![CDATA[
+_TAG_RE = re.compile(r'<(/?)([A-Za-z_][\w.\-]*(?::[A-Za-z_][\w.\-]*)?)(?=[\s/>])[^>]*>')
+
+# Espacios entre etiquetas de la sección de Interoperabilidad (equivale a \s* de los patrones originales)
+_WS_RE = re.compile(r'\s*')
+_COBERTURA_RE = re.compile(
+    r'(<Name>COBERTURA_PLAN_BENEFICIOS</Name>\s*<Value[^>]*schemeID=")01(")',
+    re.DOTALL
+)
+
+_LINE_ID_RE = re.compile(r'<cbc:ID[^>]*>(\d+)</cbc:ID>')
+_LINE_QTY_RE = re.compile(r'<cbc:CreditedQuantity[^>]*>([^<]+)</cbc:CreditedQuantity>')
+_LINE_AMOUNT_RE = re.compile(r'<cbc:LineExtensionAmount[^>]*>([^<]+)</cbc:LineExtensionAmount>')
+_LINE_DESC_RE = re.compile(r'<cbc:Description>([^<]+)</cbc:Description>')
+_LINE_CODE_RE = re.compile(r'\(([A-Z0-9\-]+)\)')
+
+Span = Tuple[int, int]
+
+
+@lru_cache(maxsize=None)
+def binary_pattern(pattern: "re.Pattern") -> "re.Pattern":
+    """Versión para bytes de un patrón de texto (mismas flags)."""
+    return re.compile(pattern.pattern.encode('utf-8'), pattern.flags & ~re.UNICODE)
+
+
+def pattern_for(pattern: "re.Pattern", binary: bool) -> "re.Pattern":
+    """Patrón a usar según el tipo del documento."""
+    return binary_pattern(pattern) if binary else pattern
+
+
+def _skip_ws(raw: XMLText, position: int, end: int) -> int:
+    """Posición después de los espacios que empiezan en ``position``."""
+    return pattern_for(_WS_RE, isinstance(raw, (bytes, bytearray))).match(raw, position, end).end()
+
+
+def _expect(raw: XMLText, literal: XMLText, position: int, end: int) -> int:
+    """Posición después de ``literal`` si está en ``position`` (tras espacios), o -1."""
+    position = _skip_ws(raw, position, end)
+    if position + len(literal) <= end and raw.startswith(literal, position):
+        return position + len(literal)
+    return -1
+
+
+def locate_interoperabilidad(raw: XMLText, start: int, end: int) -> Optional[Span]:
+    """
+    Localiza el UBLExtension con CustomTagGeneral/Interoperabilidad dentro de [start, end).
+
+    Equivale a buscar ``<ext:UBLExtension>\\s*<ext:ExtensionContent>\\s*<CustomTagGeneral>
+    .*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>\\s*
+    </ext:ExtensionContent>\\s*</ext:UBLExtension>`` pero con búsquedas ``find`` en tiempo
+    lineal, sin backtracking.
+
+    El primer UBLExtension con la cabecera completa decide el resultado: su primera
+    Interoperabilidad cerrada y el primer ``</CustomTagGeneral>`` posterior seguido del
+    cierre esperado. Si alguna de esas piezas falta para esa cabecera también falta para
+    cualquier cabecera posterior (todas quedan más adelante), así que no se sigue buscando.
+    """
+    lit = (lambda t: t.encode('ascii')) if isinstance(raw, (bytes, bytearray)) else (lambda t: t)
+    open_ext = lit('<ext:UBLExtension>')
+
+    # Primera cabecera completa
+    position = raw.find(open_ext, start, end)
+    while position != -1:
+        header_end = _expect(raw, lit('<ext:ExtensionContent>'), position + len(open_ext), end)
+        if header_end != -1:
+            header_end = _expect(raw, lit('<CustomTagGeneral>'), header_end, end)
+        if header_end != -1:
+            break
+        position = raw.find(open_ext, position + 1, end)
+    if position == -1:
+        return None
+
+    interop_open = raw.find(lit('<Interoperabilidad>'), header_end, end)
+    if interop_open == -1:
+        return None
+    interop_close = raw.find(lit('</Interoperabilidad>'), interop_open + len('<Interoperabilidad>'), end)
+    if interop_close == -1:
+        return None
+
+    # Primer </CustomTagGeneral> seguido de </ext:ExtensionContent> y </ext:UBLExtension>
+    close_custom = lit('</CustomTagGeneral>')
+    candidate = raw.find(close_custom, interop_close + len('</Interoperabilidad>'), end)
+    while candidate != -1:
+        tail_end = _expect(raw, lit('</ext:ExtensionContent>'), candidate + len(close_custom), end)
+        if tail_end != -1:
+            tail_end = _expect(raw, lit('</ext:UBLExtension>'), tail_end, end)
+        if tail_end != -1:
+            return position, tail_end
+        candidate = raw.find(close_custom, candidate + 1, end)
+    return None
+
+
+def locate_custom_tag_general(raw: XMLText, start: int, end: int) -> Optional[Span]:
+    """
+    Localiza ``<CustomTagGeneral>...</CustomTagGeneral>`` con Interoperabilidad en [start, end).
+
+    Equivale a ``<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?
+    </CustomTagGeneral>`` en tiempo lineal: solo el primer CustomTagGeneral puede coincidir.
+    """
+    lit = (lambda t: t.encode('ascii')) if isinstance(raw, (bytes, bytearray)) else (lambda t: t)
+
+    position = raw.find(lit('<CustomTagGeneral>'), start, end)
+    if position == -1:
+        return None
+    interop_open = raw.find(lit('<Interoperabilidad>'), position + len('<CustomTagGeneral>'), end)
+    if interop_open == -1:
+        return None
+    interop_close = raw.find(lit('</Interoperabilidad>'), interop_open + len('<Interoperabilidad>'), end)
+    if interop_close == -1:
+        return None
+    close_custom = raw.find(lit('</CustomTagGeneral>'), interop_close + len('</Interoperabilidad>'), end)
+    if close_custom == -1:
+        return None
+    return position, close_custom + len('</CustomTagGeneral>')
+
+
+class _TagSpans:
+    """Offsets de inicio y fin de las ocurrencias de una etiqueta, en orden de documento."""
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+
+
+_NO_SPANS = _TagSpans()
+
+
+def fix_cobertura_scheme_id(interop_content: str) -> str:
+    """Cambia schemeID de COBERTURA_PLAN_BENEFICIOS de 01 a 10 (resultado en caché por contenido)."""
+    # El schemeID viene como atributo: <Name>COBERTURA_PLAN_BENEFICIOS</Name> <Value schemeID="01" ...>
+    return factura_section_cache.get_or_compute(
+        f"cobertura:{content_digest(interop_content)}",
+        lambda: _COBERTURA_RE.sub(r'\g<1>10\g<2>', interop_content)
+    )
+
+
+class ParsedUBLDocument:
+    """
+    Documento UBL (NC o Factura) analizado una sola vez.
+
+    El CDATA se localiza con búsquedas de texto y las etiquetas se indexan en un único
+    recorrido (nombre -> offsets de apertura y cierre). Cada sección o valor se calcula
+    la primera vez que se pide y queda memorizado, de modo que extraer Interoperabilidad,
+    InvoicePeriod, líneas, número y total no vuelve a recorrer el documento completo.
+
+    Acepta el XML como str o como bytes UTF-8. Con bytes se trabaja sobre el buffer
+    original (sin decodificar el documento completo): solo se decodifican los valores
+    y secciones que se extraen, y las ediciones se ensamblan como bytes.
+    """
+
+    def __init__(self, xml_content: XMLText):
+        self.raw = xml_content
+        self.binary = isinstance(xml_content, (bytes, bytearray))
+
+    @classmethod
+    def of(cls, xml: Union[XMLText, "ParsedUBLDocument"]) -> "ParsedUBLDocument":
+        """Retorna el documento ya analizado o lo analiza si es texto o bytes."""
+        return xml if isinstance(xml, ParsedUBLDocument) else cls(xml)
+
+    def literal(self, text: str) -> XMLText:
+        """Literal en el tipo del documento."""
+        return text.encode('utf-8') if self.binary else text
+
+    def text(self, start: int, end: int) -> str:
+        """Fragmento del documento como str."""
+        fragment = self.raw[start:end]
+        return fragment.decode('utf-8') if self.binary else fragment
+
+    # ------------------------------------------------------------------
+    # CDATA y documento embebido
+    # ------------------------------------------------------------------
+
+    @cached_property
+    def digest(self) -> str:
+        """Digest SHA-256 del XML completo (clave de caché)."""
+        return content_digest(self.raw)
+
+    @cached_property
+    def cdata_span(self) -> Optional[Span]:
+        """Offsets (inicio, fin) del contenido del primer CDATA, o None si no hay."""
+        start = self.raw.find(self.literal('<![CDATA['))
+        if start == -1:
+            return None
+        start += len('<![CDATA[')
+        end = self.raw.find(self.literal(']]>'), start)
+        if end == -1:
+            return None
+        return start, end
+
+    @cached_property
+    def cdata(self) -> Optional[str]:
+        """Contenido del CDATA (documento embebido) o None."""
+        span = self.cdata_span
+        return self.text(*span) if span else None
+
+    @cached_property
+    def embedded_span(self) -> Span:
+        """Offsets del documento embebido (CDATA no vacío) o del XML completo."""
+        span = self.cdata_span
+        if span and span[1] > span[0]:
+            return span
+        return 0, len(self.raw)
+
+    @cached_property
+    def embedded(self) -> str:
+        """Documento embebido (dentro de CDATA o el mismo XML)."""
+        start, end = self.embedded_span
+        if start == 0 and end == len(self.raw) and not self.binary:
+            return self.raw
+        return self.text(start, end)
+
+    # ------------------------------------------------------------------
+    # Índice de etiquetas
+    # ------------------------------------------------------------------
+
+    @cached_property
+    def _index(self) -> Tuple[Dict[str, "_TagSpans"], Dict[str, "_TagSpans"]]:
+        """Índice nombre de etiqueta -> offsets de aperturas y de cierres (arrays compactos)."""
+        opens: Dict[str, _TagSpans] = {}
+        closes: Dict[str, _TagSpans] = {}
+        binary = self.binary
+        for match in pattern_for(_TAG_RE, binary).finditer(self.raw):
+            target = closes if match.group(1) else opens
+            name = match.group(2).decode('ascii') if binary else match.group(2)
+            spans = target.get(name)
+            if spans is None:
+                spans = target[name] = _TagSpans()
+            spans.starts.append(match.start())
+            spans.ends.append(match.end())
+        return opens, closes
+
+    def _opens(self, tag: str) -> "_TagSpans":
+        return self._index[0].get(tag, _NO_SPANS)
+
+    def _closes(self, tag: str) -> "_TagSpans":
+        return self._index[1].get(tag, _NO_SPANS)
+
+    def element_spans(self, tag: str, scope: Optional[Span] = None) -> List[Tuple[Span, Span]]:
+        """
+        Elementos ``<tag ...>...</tag>`` dentro de ``scope``, en orden de documento.
+
+        Cada elemento se retorna como (span de apertura, span de cierre). El cierre es el
+        primero posterior a la apertura y los elementos no se solapan (misma semántica que
+        ``re.finditer(r'<tag[^>]*>(.*?)</tag>')``).
+        """
+        start, end = scope if scope else (0, len(self.raw))
+        opens = self._opens(tag)
+        closes = self._closes(tag)
+        result = []
+        i = bisect_left(opens.starts, start)
+        while i < len(opens.starts):
+            open_span = (opens.starts[i], opens.ends[i])
+            if open_span[1] > end:
+                break
+            j = bisect_left(closes.starts, open_span[1])
+            if j == len(closes.starts) or closes.ends[j] > end:
+                break
+            close_span = (closes.starts[j], closes.ends[j])
+            result.append((open_span, close_span))
+            # Siguiente apertura después del cierre (sin solapamiento)
+            i = bisect_left(opens.starts, close_span[1], i + 1)
+        return result
+
+    def first_element(self, tag: str, scope: Optional[Span] = None) -> Optional[Span]:
+        """Span completo del primer elemento ``tag`` dentro de ``scope``."""
+        elements = self.element_spans(tag, scope)
+        if not elements:
+            return None
+        open_span, close_span = elements[0]
+        return open_span[0], close_span[1]
+
+    def simple_values(self, tag: str, scope: Optional[Span] = None) -> List[Tuple[Span, str]]:
+        """
+        Valores de texto de ``<tag ...>valor</tag>`` dentro de ``scope``.
+
+        Solo considera elementos cuyo contenido no tiene etiquetas y no está vacío
+        (misma semántica que ``<tag[^>]*>([^<]+)</tag>``). Retorna (span del valor, valor).
+        """
+        start, end = scope if scope else (0, len(self.raw))
+        closing = self.literal(f'</{tag}>')
+        lt = self.literal('<')
+        values = []
+        opens = self._opens(tag)
+        for i in range(bisect_left(opens.starts, start), len(opens.starts)):
+            open_end = opens.ends[i]
+            if open_end > end:
+                break
+            value_end = self.raw.find(lt, open_end, end)
+            if value_end > open_end and self.raw.startswith(closing, value_end):
+                values.append(((open_end, value_end), self.text(open_end, value_end)))
+        return values
+
+    def first_value(self, tag: str, scope: Optional[Span] = None) -> Optional[str]:
+        """Primer valor de texto de ``tag`` dentro de ``scope`` (ver simple_values)."""
+        values = self.simple_values(tag, scope)
+        return values[0][1] if values else None
+
+    # ------------------------------------------------------------------
+    # Secciones de la factura
+    # ------------------------------------------------------------------
+
+    @cached_property
+    def interoperabilidad(self) -> Optional[str]:
+        """UBLExtension completo con CustomTagGeneral/Interoperabilidad (schemeID corregido)."""
+        start, end = self.embedded_span
+
+        span = locate_interoperabilidad(self.raw, start, end)
+        if span:
+            # Corregir schemeID de COBERTURA_PLAN_BENEFICIOS de 01 a 10
+            return fix_cobertura_scheme_id(self.text(*span))
+
+        # Fallback: buscar solo CustomTagGeneral y envolver en UBLExtension
+        span = locate_custom_tag_general(self.raw, start, end)
+        if span:
+            content = fix_cobertura_scheme_id(self.text(*span))
+            return f'<ext:UBLExtension>\n      <ext:ExtensionContent>\n        {content}\n      </ext:ExtensionContent>\n    </ext:UBLExtension>'
+
+        return None
+
+    @cached_property
+    def invoice_period(self) -> Optional[str]:
+        """Sección cac:InvoicePeriod completa del documento embebido."""
+        span = self.first_element('cac:InvoicePeriod', self.embedded_span)
+        return self.text(*span) if span else None
+
+    # ------------------------------------------------------------------
+    # Nota Crédito
+    # ------------------------------------------------------------------
+
+    @cached_property
+    def nc_line_spans(self) -> List[Tuple[Span, Span]]:
+        """Elementos cac:CreditNoteLine del documento embebido."""
+        return self.element_spans('cac:CreditNoteLine', self.embedded_span)
+
+    @cached_property
+    def nc_lines(self) -> List[LineaNC]:
+        """Líneas de la Nota Crédito."""
+        lines = []
+
+        for open_span, close_span in self.nc_line_spans:
+            line_content = self.text(open_span[1], close_span[0])
+            line = {}
+
+            # ID
+            id_match = _LINE_ID_RE.search(line_content)
+            if id_match:
+                line['id'] = int(id_match.group(1))
+            else:
+                continue
+
+            # Cantidad (CreditedQuantity)
+            qty_match = _LINE_QTY_RE.search(line_content)
+            line['cantidad'] = float(qty_match.group(1)) if qty_match else 0.0
+
+            # Valor (LineExtensionAmount)
+            amount_match = _LINE_AMOUNT_RE.search(line_content)
+            line['valor'] = float(amount_match.group(1)) if amount_match else 0.0
+
+            # Descripción
+            desc_match = _LINE_DESC_RE.search(line_content)
+            if desc_match:
+                desc = desc_match.group(1)
+                line['descripcion'] = desc
+                # Extraer código entre paréntesis
+                code_match = _LINE_CODE_RE.search(desc)
+                if code_match:
+                    line['codigo_extraido'] = code_match.group(1)
+            else:
+                line['descripcion'] = ''
+
+            lines.append(LineaNC(**line))
+
+        return lines
+
+    @cached_property
+    def nc_number(self) -> Optional[str]:
+        """Número de nota: ParentDocumentID (o ID como fallback) en el XML completo."""
+        for tag in ('cbc:ParentDocumentID', 'ParentDocumentID', 'cbc:ID', 'ID'):
+            value = self.first_value(tag)
+            if value is not None:
+                return value.strip()
+        return None
+
+    @cached_property
+    def parent_document_id(self) -> Optional[str]:
+        """ParentDocumentID en el XML completo (sin fallback a ID)."""
+        for tag in ('cbc:ParentDocumentID', 'ParentDocumentID'):
+            value = self.first_value(tag)
+            if value is not None:
+                return value.strip()
+        return None
+
+    @cached_property
+    def payable_amount_cents(self) -> Optional[Cents]:
+        """PayableAmount del documento embebido, en centavos."""
+        value = self.first_value('cbc:PayableAmount', self.embedded_span)
+        return to_cents(value) if value is not None else None
+
+    @cached_property
+    def payable_amount(self) -> Optional[float]:
+        """PayableAmount del documento embebido."""
+        cents = self.payable_amount_cents
+        return from_cents(cents) if cents is not None else None
+
+    @cached_property
+    def total_nc_cents(self) -> Cents:
+        """Total de la NC en centavos: PayableAmount o, si no existe, la suma de las líneas."""
+        if self.payable_amount_cents is not None:
+            return self.payable_amount_cents
+        return sum_cents(l.valor for l in self.nc_lines)
+
+    @cached_property
+    def total_nc(self) -> float:
+        """Total de la NC: PayableAmount o, si no existe, la suma de las líneas."""
+        return from_cents(self.total_nc_cents)
+
+    # ------------------------------------------------------------------
+    # Reescritura
+    # ------------------------------------------------------------------
+
+    def splice(self, edits: List[Tuple[int, int, str]]) -> XMLText:
+        """
+        Aplica reemplazos (inicio, fin, texto) sobre el XML original en una sola pasada.
+
+        Los offsets son del XML original; los reemplazos no deben solaparse. El resultado
+        es del mismo tipo que el documento (str o bytes) y se arma en un único buffer.
+        """
+        if not edits:
+            return self.raw
+        raw = memoryview(self.raw) if self.binary else self.raw
+        parts = []
+        position = 0
+        for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+            parts.append(raw[position:start])
+            parts.append(self.literal(text) if isinstance(text, str) else text)
+            position = end
+        parts.append(raw[position:])
+        return (b'' if self.binary else '').join(parts)
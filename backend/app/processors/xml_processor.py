@@ -1,280 +1,149 @@
 import re
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Union
 from app.models import LineaNC
+from app.processors.money import format_cents, to_cents
+from app.processors.section_cache import factura_section_cache
+from app.processors.ubl_document import ParsedUBLDocument, XMLText, fix_cobertura_scheme_id
+from app.processors.xml_rewriter import VALOR_NUMERICO, RewriteRule, XMLRewriter
+
+# Las funciones aceptan el XML como texto, bytes UTF-8 o ya analizado
+UBLInput = Union[XMLText, ParsedUBLDocument]
+
+_NUMERIC_RE = re.compile(VALOR_NUMERICO)
+# Campos que se ponen en cero en una linea igualada
+_CAMPOS_CERO_LINEA = ('cbc:LineExtensionAmount', 'cbc:PriceAmount', 'cbc:CreditedQuantity', 'cbc:BaseQuantity')
+# Campos de LegalMonetaryTotal que se recalculan
+_CAMPOS_TOTAL = ('cbc:LineExtensionAmount', 'cbc:TaxInclusiveAmount', 'cbc:PayableAmount')
+# Caso colesterol: todos los montos y cantidades en 0.00
+_COLESTEROL_REWRITER = XMLRewriter([
+    RewriteRule(f'cbc:{campo}', '0.00')
+    for campo in ('LineExtensionAmount', 'TaxExclusiveAmount', 'TaxInclusiveAmount',
+                  'PrepaidAmount', 'PayableAmount', 'PriceAmount',
+                  'CreditedQuantity', 'BaseQuantity')
+])
 
 
 class XMLProcessor:
     """Procesador de archivos XML para NC y Facturas."""
 
     @staticmethod
-    def extract_cdata(xml_content: str) -> Optional[str]:
+    def extract_cdata(xml_content: UBLInput) -> Optional[str]:
         """Extrae el contenido del CDATA (documento embebido)."""
-        match = re.search(r'<!\[CDATA\[(.*?)\]\]>', xml_content, re.DOTALL)
-        return match.group(1) if match else None
+        return ParsedUBLDocument.of(xml_content).cdata
 
     @staticmethod
-    def get_embedded_document(xml_content: str) -> str:
+    def get_embedded_document(xml_content: UBLInput) -> str:
         """Obtiene el documento embebido (dentro de CDATA o el mismo XML)."""
-        embedded = XMLProcessor.extract_cdata(xml_content)
-        return embedded if embedded else xml_content
+        return ParsedUBLDocument.of(xml_content).embedded
 
     @staticmethod
-    def extract_interoperabilidad(factura_xml: str) -> Optional[str]:
-        """Extrae UBLExtension completo con CustomTagGeneral."""
-        embedded = XMLProcessor.get_embedded_document(factura_xml)
-
-        # Buscar el UBLExtension que contiene CustomTagGeneral con Interoperabilidad
-        pattern = r'(<ext:UBLExtension>\s*<ext:ExtensionContent>\s*<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>\s*</ext:ExtensionContent>\s*</ext:UBLExtension>)'
-        match = re.search(pattern, embedded, re.DOTALL)
-
-        if match:
-            interop_section = match.group(1)
-            # Corregir schemeID de COBERTURA_PLAN_BENEFICIOS de 01 a 10
-            interop_section = XMLProcessor._fix_cobertura_scheme_id(interop_section)
-            return interop_section
-
-        # Fallback: buscar solo CustomTagGeneral
-        pattern2 = r'(<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>)'
-        match2 = re.search(pattern2, embedded, re.DOTALL)
-        if match2:
-            # Envolver en UBLExtension
-            content = match2.group(1)
-            # Corregir schemeID de COBERTURA_PLAN_BENEFICIOS de 01 a 10
-            content = XMLProcessor._fix_cobertura_scheme_id(content)
-            return f'<ext:UBLExtension>\n      <ext:ExtensionContent>\n        {content}\n      </ext:ExtensionContent>\n    </ext:UBLExtension>'
+    def extract_factura_sections(factura_xml: UBLInput) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Extrae (Interoperabilidad, InvoicePeriod) de la factura.
+
+        El resultado depende solo del contenido, así que se guarda en la caché de
+        secciones por digest: la misma factura en varias carpetas se analiza una vez.
+        """
+        doc = ParsedUBLDocument.of(factura_xml)
+        interop, period = factura_section_cache.get_or_compute(
+            f"secciones:{doc.digest}",
+            lambda: [doc.interoperabilidad, doc.invoice_period]
+        )
+        return interop, period
 
-        return None
+    @staticmethod
+    def extract_interoperabilidad(factura_xml: UBLInput) -> Optional[str]:
+        """Extrae UBLExtension completo con CustomTagGeneral."""
+        return XMLProcessor.extract_factura_sections(factura_xml)[0]
 
     @staticmethod
-    def extract_invoice_period(factura_xml: str) -> Optional[str]:
+    def extract_invoice_period(factura_xml: UBLInput) -> Optional[str]:
         """Extrae el InvoicePeriod del documento."""
-        embedded = XMLProcessor.get_embedded_document(factura_xml)
-
-        pattern = r'(<cac:InvoicePeriod>.*?</cac:InvoicePeriod>)'
-        match = re.search(pattern, embedded, re.DOTALL)
-        return match.group(1) if match else None
+        return XMLProcessor.extract_factura_sections(factura_xml)[1]
 
     @staticmethod
-    def extract_nc_lines(nc_xml: str) -> List[LineaNC]:
+    def extract_nc_lines(nc_xml: UBLInput) -> List[LineaNC]:
         """Extrae las líneas de la Nota Crédito."""
-        embedded = XMLProcessor.get_embedded_document(nc_xml)
-        lines = []
-
-        # Buscar CreditNoteLine
-        for match in re.finditer(r'<cac:CreditNoteLine[^>]*>(.*?)</cac:CreditNoteLine>', embedded, re.DOTALL):
-            line_content = match.group(1)
-            line = {}
-
-            # ID
-            id_match = re.search(r'<cbc:ID[^>]*>(\d+)</cbc:ID>', line_content)
-            if id_match:
-                line['id'] = int(id_match.group(1))
-            else:
-                continue
-
-            # Cantidad (CreditedQuantity)
-            qty_match = re.search(r'<cbc:CreditedQuantity[^>]*>([^<]+)</cbc:CreditedQuantity>', line_content)
-            if qty_match:
-                line['cantidad'] = float(qty_match.group(1))
-            else:
-                line['cantidad'] = 0.0
-
-            # Valor (LineExtensionAmount)
-            amount_match = re.search(r'<cbc:LineExtensionAmount[^>]*>([^<]+)</cbc:LineExtensionAmount>', line_content)
-            if amount_match:
-                line['valor'] = float(amount_match.group(1))
-            else:
-                line['valor'] = 0.0
-
-            # Descripción
-            desc_match = re.search(r'<cbc:Description>([^<]+)</cbc:Description>', line_content)
-            if desc_match:
-                desc = desc_match.group(1)
-                line['descripcion'] = desc
-                # Extraer código entre paréntesis
-                code_match = re.search(r'\(([A-Z0-9\-]+)\)', desc)
-                if code_match:
-                    line['codigo_extraido'] = code_match.group(1)
-            else:
-                line['descripcion'] = ''
-
-            lines.append(LineaNC(**line))
-
-        return lines
+        return list(ParsedUBLDocument.of(nc_xml).nc_lines)
 
     @staticmethod
-    def insert_sections(nc_xml: str, interop: Optional[str], period: Optional[str]) -> str:
+    def insert_sections(nc_xml: UBLInput, interop: Optional[str], period: Optional[str]) -> XMLText:
         """Inserta Interoperabilidad e InvoicePeriod en la NC."""
+        doc = ParsedUBLDocument.of(nc_xml)
         if not interop and not period:
-            return nc_xml
-
-        # Buscar CDATA
-        cdata_match = re.search(r'(<!\[CDATA\[)(.*?)(\]\]>)', nc_xml, re.DOTALL)
-
-        if cdata_match:
-            prefix, creditnote, suffix = cdata_match.groups()
-            modified_creditnote = creditnote
-
-            # Insertar Interoperabilidad (después del último UBLExtension)
-            if interop:
-                close_extensions = modified_creditnote.find('</ext:UBLExtensions>')
-                if close_extensions != -1:
-                    # Encontrar el último UBLExtension antes de cerrar UBLExtensions
-                    last_ext = modified_creditnote.rfind('</ext:UBLExtension>', 0, close_extensions)
-                    if last_ext != -1:
-                        insert_pos = last_ext + len('</ext:UBLExtension>')
-                        modified_creditnote = (
-                            modified_creditnote[:insert_pos] +
-                            '\n    ' + interop +
-                            modified_creditnote[insert_pos:]
-                        )
+            return doc.raw
 
-            # Insertar InvoicePeriod (después de DiscrepancyResponse)
-            if period:
-                discrepancy_end = modified_creditnote.find('</cac:DiscrepancyResponse>')
-                if discrepancy_end != -1:
-                    insert_pos = discrepancy_end + len('</cac:DiscrepancyResponse>')
-                    modified_creditnote = (
-                        modified_creditnote[:insert_pos] +
-                        '\n  ' + period +
-                        modified_creditnote[insert_pos:]
-                    )
-
-            # Reconstruir
-            new_cdata = prefix + modified_creditnote + suffix
-            return nc_xml[:cdata_match.start()] + new_cdata + nc_xml[cdata_match.end():]
-
-        # Si no hay CDATA, modificar directamente
-        modified = nc_xml
+        # Dentro del CDATA si existe; si no, modificar directamente el XML
+        scope_start, scope_end = doc.cdata_span or (0, len(doc.raw))
+        edits = []
 
+        # Insertar Interoperabilidad (después del último UBLExtension)
         if interop:
-            close_extensions = modified.find('</ext:UBLExtensions>')
+            close_extensions = doc.raw.find(doc.literal('</ext:UBLExtensions>'), scope_start, scope_end)
             if close_extensions != -1:
-                last_ext = modified.rfind('</ext:UBLExtension>', 0, close_extensions)
+                # Encontrar el último UBLExtension antes de cerrar UBLExtensions
+                last_ext = doc.raw.rfind(doc.literal('</ext:UBLExtension>'), scope_start, close_extensions)
                 if last_ext != -1:
                     insert_pos = last_ext + len('</ext:UBLExtension>')
-                    modified = modified[:insert_pos] + '\n    ' + interop + modified[insert_pos:]
+                    edits.append((insert_pos, insert_pos, '\n    ' + interop))
 
+        # Insertar InvoicePeriod (después de DiscrepancyResponse)
         if period:
-            discrepancy_end = modified.find('</cac:DiscrepancyResponse>')
+            discrepancy_end = doc.raw.find(doc.literal('</cac:DiscrepancyResponse>'), scope_start, scope_end)
             if discrepancy_end != -1:
                 insert_pos = discrepancy_end + len('</cac:DiscrepancyResponse>')
-                modified = modified[:insert_pos] + '\n  ' + period + modified[insert_pos:]
+                edits.append((insert_pos, insert_pos, '\n  ' + period))
 
-        return modified
+        return doc.splice(edits)
 
     @staticmethod
     def _fix_cobertura_scheme_id(interop_content: str) -> str:
         """Cambia schemeID de COBERTURA_PLAN_BENEFICIOS de 01 a 10."""
-        # Reemplazar schemeID="01" por schemeID="10" cuando el campo es COBERTURA_PLAN_BENEFICIOS
-        # El schemeID viene como atributo: <Value schemeID="01" ...>
-
-        # Buscar <Name>COBERTURA_PLAN_BENEFICIOS</Name> seguido de <Value schemeID="01" ...>
-        # y reemplazar por schemeID="10"
-        result = re.sub(
-            r'(<Name>COBERTURA_PLAN_BENEFICIOS</Name>\s*<Value[^>]*schemeID=")01(")',
-            r'\g<1>10\g<2>',
-            interop_content,
-            flags=re.DOTALL
-        )
-
-        return result
+        return fix_cobertura_scheme_id(interop_content)
 
     @staticmethod
-    def aplicar_caso_colesterol(nc_xml: str) -> str:
+    def aplicar_caso_colesterol(nc_xml: UBLInput) -> XMLText:
         """Aplica el caso especial de colesterol: pone todos los valores monetarios en 0.00."""
-        # Reemplazar valores monetarios en el XML por 0.00
-        result = nc_xml
-
-        # Reemplazar en elementos de monto
-        montos = ['LineExtensionAmount', 'TaxExclusiveAmount', 'TaxInclusiveAmount',
-                  'PrepaidAmount', 'PayableAmount', 'PriceAmount']
-
-        for monto in montos:
-            # Buscar valores como >38900.00<, >38900<, >38900.0000<
-            pattern = rf'(<cbc:{monto}[^>]*>)[\d.]+(</cbc:{monto}>)'
-            result = re.sub(pattern, r'\g<1>0.00\g<2>', result)
-
-        # Reemplazar CreditedQuantity y BaseQuantity
-        result = re.sub(r'(<cbc:CreditedQuantity[^>]*>)[\d.]+(</cbc:CreditedQuantity>)', r'\g<1>0.00\g<2>', result)
-        result = re.sub(r'(<cbc:BaseQuantity[^>]*>)[\d.]+(</cbc:BaseQuantity>)', r'\g<1>0.00\g<2>', result)
-
-        return result
+        # Montos (>38900.00<, >38900<, >38900.0000<), CreditedQuantity y BaseQuantity en una pasada
+        return _COLESTEROL_REWRITER.apply(ParsedUBLDocument.of(nc_xml).raw).text
 
     @staticmethod
-    def aplicar_valores_cero_por_linea(nc_xml: str, lineas_ids: List[int]) -> str:
-        """Pone a 0 los valores monetarios de lineas especificas de la NC y recalcula totales."""
+    def aplicar_valores_cero_por_linea(nc_xml: UBLInput, lineas_ids: List[int]) -> XMLText:
+        """
+        Pone a 0 los valores monetarios de lineas especificas de la NC y recalcula totales.
+
+        Las lineas se identifican por su primer cbc:ID numérico (igual que XMLRewriter).
+        Es lineal en el tamaño del XML: una pasada sobre los spans ya indexados de las
+        lineas suma el nuevo total (las lineas restantes) y otra del XMLRewriter escribe
+        los ceros y el total. LegalMonetaryTotal va antes de las lineas en UBL, así que
+        el total no se puede calcular en la misma pasada que lo escribe.
+        """
+        doc = ParsedUBLDocument.of(nc_xml)
         if not lineas_ids:
-            return nc_xml
+            return doc.raw
 
-        result = nc_xml
+        ids = set(lineas_ids)
 
-        # Process each CreditNoteLine
-        for line_id in lineas_ids:
-            # Find the specific CreditNoteLine by ID
-            pattern = rf'(<cac:CreditNoteLine[^>]*>.*?<cbc:ID[^>]*>{line_id}</cbc:ID>.*?</cac:CreditNoteLine>)'
-            match = re.search(pattern, result, re.DOTALL)
-            if not match:
+        # Nuevo total: primer LineExtensionAmount numérico de cada linea no igualada
+        total = 0
+        for open_span, close_span in doc.nc_line_spans:
+            scope = (open_span[1], close_span[0])
+            line_id = next((v for _, v in doc.simple_values('cbc:ID', scope) if v.isdigit()), None)
+            if line_id is not None and int(line_id) in ids:
                 continue
-
-            original_line = match.group(1)
-            modified_line = original_line
-
-            # Zero out LineExtensionAmount in this line
-            modified_line = re.sub(
-                r'(<cbc:LineExtensionAmount[^>]*>)[\d.]+(</cbc:LineExtensionAmount>)',
-                r'\g<1>0.00\g<2>',
-                modified_line
-            )
-            # Zero out PriceAmount in this line
-            modified_line = re.sub(
-                r'(<cbc:PriceAmount[^>]*>)[\d.]+(</cbc:PriceAmount>)',
-                r'\g<1>0.00\g<2>',
-                modified_line
-            )
-            # Zero out CreditedQuantity in this line
-            modified_line = re.sub(
-                r'(<cbc:CreditedQuantity[^>]*>)[\d.]+(</cbc:CreditedQuantity>)',
-                r'\g<1>0.00\g<2>',
-                modified_line
-            )
-            # Zero out BaseQuantity in this line
-            modified_line = re.sub(
-                r'(<cbc:BaseQuantity[^>]*>)[\d.]+(</cbc:BaseQuantity>)',
-                r'\g<1>0.00\g<2>',
-                modified_line
-            )
-
-            result = result.replace(original_line, modified_line)
-
-        # Recalculate LegalMonetaryTotal by summing remaining LineExtensionAmounts
-        total = 0.0
-        for line_match in re.finditer(
-            r'<cac:CreditNoteLine[^>]*>.*?<cbc:LineExtensionAmount[^>]*>([\d.]+)</cbc:LineExtensionAmount>.*?</cac:CreditNoteLine>',
-            result, re.DOTALL
-        ):
-            total += float(line_match.group(1))
-
-        # Update LegalMonetaryTotal fields
-        total_str = f"{total:.2f}"
-
-        # Update LineExtensionAmount in LegalMonetaryTotal
-        result = re.sub(
-            r'(<cac:LegalMonetaryTotal>.*?<cbc:LineExtensionAmount[^>]*>)[\d.]+(</cbc:LineExtensionAmount>)',
-            rf'\g<1>{total_str}\g<2>',
-            result, count=1, flags=re.DOTALL
-        )
-        # Update TaxInclusiveAmount in LegalMonetaryTotal
-        result = re.sub(
-            r'(<cac:LegalMonetaryTotal>.*?<cbc:TaxInclusiveAmount[^>]*>)[\d.]+(</cbc:TaxInclusiveAmount>)',
-            rf'\g<1>{total_str}\g<2>',
-            result, count=1, flags=re.DOTALL
-        )
-        # Update PayableAmount in LegalMonetaryTotal
-        result = re.sub(
-            r'(<cac:LegalMonetaryTotal>.*?<cbc:PayableAmount[^>]*>)[\d.]+(</cbc:PayableAmount>)',
-            rf'\g<1>{total_str}\g<2>',
-            result, count=1, flags=re.DOTALL
-        )
-
-        return result
+            for _, value in doc.simple_values('cbc:LineExtensionAmount', scope):
+                if _NUMERIC_RE.fullmatch(value):
+                    total += to_cents(value)
+                    break
+        total_str = format_cents(total)
+
+        rules = [
+            RewriteRule(tag, '0.00', linea_id=line_id)
+            for line_id in ids
+            for tag in _CAMPOS_CERO_LINEA
+        ]
+        rules += [
+            RewriteRule(tag, total_str, padre='cac:LegalMonetaryTotal', max_cambios=1)
+            for tag in _CAMPOS_TOTAL
+        ]
+        return XMLRewriter(rules).apply(doc.raw).text
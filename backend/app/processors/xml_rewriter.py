@@ -0,0 +1,214 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# XML como texto o como bytes UTF-8 (tal como se leyó del archivo o del upload)
+XMLText = Union[str, bytes]
+
+# Costo aproximado en memoria de retener una vista por tramo al ensamblar bytes
+_BYTES_POR_VISTA = 512
+
+# Valor numérico por defecto que reemplazan las reglas (montos y cantidades)
+VALOR_NUMERICO = r'[\d.]+'
+
+
+@dataclass(frozen=True)
+class RewriteRule:
+    """
+    Regla de reescritura de un valor de texto ``<tag ...>valor</tag>``.
+
+    Attributes:
+        tag: Etiqueta cuyo valor se reemplaza (ej: 'cbc:PayableAmount')
+        valor: Nuevo valor
+        linea_id: Solo dentro de la cac:CreditNoteLine con este cbc:ID
+        padre: Solo dentro de este elemento padre (ej: 'cac:LegalMonetaryTotal')
+        patron_valor: Regex que debe cumplir el valor actual completo (None: cualquier texto)
+        max_cambios: Máximo de reemplazos de la regla (None: todos)
+    """
+    tag: str
+    valor: str
+    linea_id: Optional[int] = None
+    padre: Optional[str] = None
+    patron_valor: Optional[str] = VALOR_NUMERICO
+    max_cambios: Optional[int] = None
+
+
+@dataclass(slots=True)
+class RewriteChange:
+    """Cambio aplicado por una regla (offsets sobre el texto original)."""
+    tag: str
+    inicio: int
+    fin: int
+    valor_anterior: str
+    valor_nuevo: str
+    linea_id: Optional[int] = None
+
+
+@dataclass
+class RewriteResult:
+    """Documento reescrito (mismo tipo que la entrada) y registro de cambios."""
+    text: XMLText
+    cambios: List[RewriteChange] = field(default_factory=list)
+
+    @property
+    def modificado(self) -> bool:
+        return bool(self.cambios)
+
+
+class _CompiledRule:
+    __slots__ = ('rule', 'patron', 'valor', 'restantes')
+
+    def __init__(self, rule: RewriteRule, patron: Optional["re.Pattern"], binary: bool):
+        self.rule = rule
+        self.patron = patron
+        self.valor = rule.valor.encode('utf-8') if binary else rule.valor
+        self.restantes = rule.max_cambios
+
+
+class XMLRewriter:
+    """
+    Aplica un conjunto de reglas de reescritura en un solo recorrido del documento.
+
+    Las reglas se compilan una vez en una sola expresión que reconoce las etiquetas
+    objetivo y las etiquetas de contexto (padres y CreditNoteLine). Durante el recorrido
+    se mantiene el contexto actual (padres abiertos y cbc:ID de la línea) y cada valor
+    se reemplaza con la primera regla aplicable. El resultado se ensambla una sola vez.
+
+    Acepta str o bytes UTF-8; con bytes se trabaja sobre el buffer original y el
+    resultado se arma como bytes.
+    """
+
+    LINEA_TAG = 'cac:CreditNoteLine'
+    LINEA_ID_TAG = 'cbc:ID'
+
+    def __init__(self, rules: Sequence[RewriteRule]):
+        self.rules = list(rules)
+        self._padres = sorted({r.padre for r in self.rules if r.padre})
+        self._usa_lineas = any(r.linea_id is not None for r in self.rules)
+
+        nombres = {r.tag for r in self.rules} | set(self._padres)
+        if self._usa_lineas:
+            nombres |= {self.LINEA_TAG, self.LINEA_ID_TAG}
+        alternativas = '|'.join(re.escape(n) for n in sorted(nombres, key=len, reverse=True))
+        scanner = rf'<(/?)({alternativas})(?=[\s/>])[^>]*>'
+        # Expresiones compiladas una vez por tipo de documento: False -> str, True -> bytes
+        self._scanners = {
+            False: re.compile(scanner),
+            True: re.compile(scanner.encode('utf-8')),
+        } if nombres else None
+        self._patrones = {
+            binary: {
+                r.patron_valor: re.compile(r.patron_valor.encode('utf-8') if binary else r.patron_valor)
+                for r in self.rules if r.patron_valor is not None
+            }
+            for binary in (False, True)
+        }
+
+    def _compile(self, binary: bool) -> Tuple[Dict[str, List[_CompiledRule]], Dict[Tuple[str, int], List[_CompiledRule]]]:
+        """Reglas por etiqueta (sin línea) y por (etiqueta, línea); estado nuevo por ejecución."""
+        generales: Dict[str, List[_CompiledRule]] = {}
+        por_linea: Dict[Tuple[str, int], List[_CompiledRule]] = {}
+        patrones = self._patrones[binary]
+        for rule in self.rules:
+            patron = patrones[rule.patron_valor] if rule.patron_valor is not None else None
+            compiled = _CompiledRule(rule, patron, binary)
+            if rule.linea_id is not None:
+                por_linea.setdefault((rule.tag, rule.linea_id), []).append(compiled)
+            else:
+                generales.setdefault(rule.tag, []).append(compiled)
+        return generales, por_linea
+
+    def apply(self, text: XMLText) -> RewriteResult:
+        """Aplica las reglas sobre ``text`` y retorna el texto nuevo con los cambios."""
+        if self._scanners is None:
+            return RewriteResult(text=text)
+
+        binary = isinstance(text, (bytes, bytearray))
+        lt = b'<' if binary else '<'
+        generales, por_linea = self._compile(binary)
+        ediciones: List[Tuple[int, int, XMLText]] = []
+        padres_abiertos = {padre: 0 for padre in self._padres}
+        profundidad_linea = 0
+        linea_actual: Optional[int] = None
+        cambios: List[RewriteChange] = []
+
+        for match in self._scanners[binary].finditer(text):
+            tag = match.group(2).decode('ascii') if binary else match.group(2)
+            es_cierre = bool(match.group(1))
+            auto_cerrado = match.group(0)[-2:] in ('/>', b'/>')
+
+            if tag in padres_abiertos and not auto_cerrado:
+                padres_abiertos[tag] += -1 if es_cierre else 1
+            if tag == self.LINEA_TAG and self._usa_lineas and not auto_cerrado:
+                if es_cierre:
+                    profundidad_linea = max(0, profundidad_linea - 1)
+                    if profundidad_linea == 0:
+                        linea_actual = None
+                else:
+                    profundidad_linea += 1
+            if es_cierre or auto_cerrado:
+                continue
+
+            # Valor de texto simple: <tag ...>valor</tag>
+            inicio = match.end()
+            fin = text.find(lt, inicio)
+            cierre = f'</{tag}>'
+            if fin == -1 or not text.startswith(cierre.encode('ascii') if binary else cierre, fin):
+                continue
+            valor = text[inicio:fin]
+
+            if tag == self.LINEA_ID_TAG and profundidad_linea and linea_actual is None:
+                # El primer cbc:ID de la línea la identifica
+                if valor.isdigit():
+                    linea_actual = int(valor)
+
+            candidatas = generales.get(tag, [])
+            if linea_actual is not None:
+                candidatas = por_linea.get((tag, linea_actual), []) + candidatas
+
+            for compiled in candidatas:
+                rule = compiled.rule
+                if compiled.restantes == 0:
+                    continue
+                if rule.padre and padres_abiertos[rule.padre] <= 0:
+                    continue
+                if compiled.patron is not None and not compiled.patron.fullmatch(valor):
+                    continue
+                if compiled.restantes is not None:
+                    compiled.restantes -= 1
+                ediciones.append((inicio, fin, compiled.valor))
+                cambios.append(RewriteChange(
+                    tag=tag,
+                    inicio=inicio,
+                    fin=fin,
+                    valor_anterior=valor.decode('utf-8') if binary else valor,
+                    valor_nuevo=rule.valor,
+                    linea_id=rule.linea_id
+                ))
+                break
+
+        if not cambios:
+            return RewriteResult(text=text)
+
+        if binary and len(ediciones) * _BYTES_POR_VISTA > len(text):
+            # Muchas ediciones: acumular en un buffer evita retener una vista por tramo
+            fuente = memoryview(text)
+            salida = bytearray()
+            posicion = 0
+            for inicio, fin, valor in ediciones:
+                salida += fuente[posicion:inicio]
+                salida += valor
+                posicion = fin
+            salida += fuente[posicion:]
+            return RewriteResult(text=bytes(salida), cambios=cambios)
+
+        # Pocas ediciones: vistas sobre la entrada y una sola copia al unir
+        fuente = memoryview(text) if binary else text
+        partes = []
+        posicion = 0
+        for inicio, fin, valor in ediciones:
+            partes.append(fuente[posicion:inicio])
+            partes.append(valor)
+            posicion = fin
+        partes.append(fuente[posicion:])
+        return RewriteResult(text=(b'' if binary else '').join(partes), cambios=cambios)
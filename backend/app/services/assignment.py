@@ -0,0 +1,114 @@
+from typing import List, Sequence
+
+from app.models import LineaNC, ServicioRIPS
+from app.services.local_matcher import valor_score
+
+# Desempate: a igual costo se prefieren las filas/columnas anteriores y el orden diagonal
+_EPS = 1e-6
+
+# Por encima de esta cantidad de celdas (líneas x servicios) no se resuelve la asignación
+MAX_CELDAS = 40000
+
+
+def assignment_cost(linea: LineaNC, servicio: ServicioRIPS) -> float:
+    """
+    Costo (0 = ideal) de asignar una línea NC a un servicio del RIPS con su mismo código.
+
+    - valor: 0 si el valor de la línea es un múltiplo exacto del valor unitario; si no,
+      0.5 más la distancia de la cantidad resultante al entero más cercano
+    - cantidad: 0.5 si la cantidad resultante supera la cantidad facturada
+    - nombre: 0.25 por la fracción de palabras no compartidas entre descripción y nombre
+    """
+    costo = 0.0
+    cantidad = linea.valor / servicio.valor_unitario if servicio.valor_unitario > 0 else 0.0
+    if valor_score(linea.valor, servicio.valor_unitario) < 1.0:
+        costo += 0.5 + abs(cantidad - round(cantidad))
+    if servicio.cantidad_original and cantidad > servicio.cantidad_original + 1e-9:
+        costo += 0.5
+
+    palabras_linea = set(linea.descripcion.lower().split())
+    palabras_servicio = set((servicio.nombre or '').lower().split())
+    union = palabras_linea | palabras_servicio
+    if union:
+        costo += 0.25 * (1 - len(palabras_linea & palabras_servicio) / len(union))
+    return costo
+
+
+def solve_assignment(costos: Sequence[Sequence[float]]) -> List[int]:
+    """
+    Asignación de costo mínimo (método húngaro) sobre una matriz filas x columnas.
+
+    Retorna, para cada fila, la columna asignada o -1 si sobran filas. A igual costo
+    gana la asignación que usa las primeras filas y columnas en orden, la misma que
+    daría "el primero libre gana".
+    """
+    n = len(costos)
+    m = len(costos[0]) if n else 0
+    if n == 0 or m == 0:
+        return [-1] * n
+
+    eps_cruce = _EPS / (n * m + 1)
+    matriz = [
+        [costos[i][j] + _EPS * (i + j) - eps_cruce * i * j for j in range(m)]
+        for i in range(n)
+    ]
+    transpuesta = n > m
+    if transpuesta:
+        matriz = [list(columna) for columna in zip(*matriz)]
+        n, m = m, n
+
+    # Potenciales u/v y asignación p[columna] = fila (índices desde 1; 0 es la columna ficticia)
+    infinito = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [infinito] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            fila = matriz[i0 - 1]
+            ui0 = u[i0]
+            delta = infinito
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    actual = fila[j - 1] - ui0 - v[j]
+                    if actual < minv[j]:
+                        minv[j] = actual
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    if transpuesta:
+        resultado = [-1] * m
+        for j in range(1, m + 1):
+            if p[j]:
+                resultado[j - 1] = p[j] - 1
+        return resultado
+
+    resultado = [-1] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            resultado[p[j] - 1] = j - 1
+    return resultado
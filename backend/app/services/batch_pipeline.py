@@ -0,0 +1,199 @@
+"""
+Staged pipeline for batch processing of NC folders.
+
+Each folder flows through a sequence of stages (parse, match, build, submit)
+connected by bounded queues. Every stage has its own number of workers, so the
+CPU-bound work, the LLM calls and the ministry submissions are limited
+independently, and per-stage statistics show which one is the bottleneck.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Marker that tells a stage worker there are no more items
+_FIN = object()
+
+
+@dataclass
+class StageStats:
+    """Live statistics of a pipeline stage.
+
+    Attributes:
+        nombre: Stage name
+        workers: Number of concurrent workers of the stage
+        en_cola: Items waiting in the stage input queue
+        en_proceso: Items currently being handled by the stage
+        procesados: Items handled by the stage
+        errores: Items whose handler raised an exception
+        tiempo_ocupado: Total seconds spent inside the stage handler
+        inicio: Monotonic time when the stage handled its first item
+    """
+    nombre: str
+    workers: int
+    en_cola: int = 0
+    en_proceso: int = 0
+    procesados: int = 0
+    errores: int = 0
+    tiempo_ocupado: float = 0.0
+    inicio: Optional[float] = None
+
+    @property
+    def throughput(self) -> float:
+        """Items handled per second since the stage started."""
+        if self.inicio is None or self.procesados == 0:
+            return 0.0
+        elapsed = time.monotonic() - self.inicio
+        return self.procesados / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def tiempo_promedio(self) -> float:
+        """Average seconds spent per item in the stage handler."""
+        return self.tiempo_ocupado / self.procesados if self.procesados else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the statistics for API responses."""
+        return {
+            "nombre": self.nombre,
+            "workers": self.workers,
+            "en_cola": self.en_cola,
+            "en_proceso": self.en_proceso,
+            "procesados": self.procesados,
+            "errores": self.errores,
+            "throughput": round(self.throughput, 3),
+            "tiempo_promedio": round(self.tiempo_promedio, 3),
+        }
+
+
+@dataclass
+class PipelineStage:
+    """A stage of the pipeline.
+
+    Attributes:
+        nombre: Stage name (used in statistics)
+        handler: Coroutine function receiving an item and returning the next item
+        workers: Number of items the stage handles at the same time
+    """
+    nombre: str
+    handler: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+class BatchPipeline:
+    """Runs items through a sequence of stages connected by bounded queues.
+
+    A stage handler returns the item for the next stage, or a final result
+    (``is_final(result)`` is True) that skips the remaining stages. Final results
+    are delivered to ``on_result`` together with the index of the original item.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[PipelineStage],
+        is_final: Callable[[Any], bool],
+        queue_size: int = 8
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            stages: Stages in processing order
+            is_final: Predicate telling whether a handler output is a final result
+            queue_size: Maximum number of items waiting between two stages
+        """
+        if not stages:
+            raise ValueError("Pipeline requires at least one stage")
+        self.stages = list(stages)
+        self.is_final = is_final
+        self.queue_size = max(1, queue_size)
+        self.stats: Dict[str, StageStats] = {
+            stage.nombre: StageStats(nombre=stage.nombre, workers=max(1, stage.workers))
+            for stage in self.stages
+        }
+
+    async def run(
+        self,
+        items: Sequence[Any],
+        on_result: Callable[[int, Any], None],
+        on_error: Callable[[int, Any, Exception], Any],
+        max_in_flight: int
+    ) -> None:
+        """Run all items through the pipeline.
+
+        Args:
+            items: Items to process
+            on_result: Called with (index, final result) for every item
+            on_error: Called with (index, item, exception) when a handler raises;
+                must return a final result for the item
+            max_in_flight: Maximum number of items inside the pipeline at once
+        """
+        queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        in_flight = asyncio.Semaphore(max(1, max_in_flight))
+
+        def deliver(index: int, result: Any) -> None:
+            in_flight.release()
+            on_result(index, result)
+
+        async def feed() -> None:
+            first = self.stats[self.stages[0].nombre]
+            for index, item in enumerate(items):
+                await in_flight.acquire()
+                await queues[0].put((index, item))
+                first.en_cola = queues[0].qsize()
+
+        async def stage_worker(position: int) -> None:
+            stage = self.stages[position]
+            stats = self.stats[stage.nombre]
+            queue = queues[position]
+            is_last = position == len(self.stages) - 1
+
+            while True:
+                entry = await queue.get()
+                if entry is _FIN:
+                    return
+                index, item = entry
+                stats.en_cola = queue.qsize()
+                stats.en_proceso += 1
+                if stats.inicio is None:
+                    stats.inicio = time.monotonic()
+                started = time.monotonic()
+
+                try:
+                    output = await stage.handler(item)
+                except Exception as e:
+                    stats.errores += 1
+                    logger.error(f"Pipeline stage '{stage.nombre}' failed: {e}")
+                    output = on_error(index, item, e)
+                finally:
+                    stats.en_proceso -= 1
+                    stats.procesados += 1
+                    stats.tiempo_ocupado += time.monotonic() - started
+
+                if is_last or self.is_final(output):
+                    deliver(index, output)
+                else:
+                    next_queue = queues[position + 1]
+                    await next_queue.put((index, output))
+                    self.stats[self.stages[position + 1].nombre].en_cola = next_queue.qsize()
+
+        async def run_stage(position: int) -> None:
+            workers = self.stats[self.stages[position].nombre].workers
+            await asyncio.gather(*(stage_worker(position) for _ in range(workers)))
+            # Stage drained: tell the next stage there is nothing else coming
+            if position + 1 < len(self.stages):
+                for _ in range(self.stats[self.stages[position + 1].nombre].workers):
+                    await queues[position + 1].put(_FIN)
+
+        async def feed_and_close() -> None:
+            await feed()
+            for _ in range(self.stats[self.stages[0].nombre].workers):
+                await queues[0].put(_FIN)
+
+        await asyncio.gather(feed_and_close(), *(run_stage(i) for i in range(len(self.stages))))
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Current statistics of every stage, in pipeline order."""
+        return [self.stats[stage.nombre].to_dict() for stage in self.stages]
@@ -6,10 +6,8 @@ including token management, progress tracking, and result generation.
 """
 
 import asyncio
-import base64
 import csv
 import io
-import json
 import logging
 import os
 import re
@@ -17,11 +15,19 @@ import zipfile
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Any
-
-from app.api.nc_router import _extract_nc_number
-from app.models import NCPayload
+from typing import Callable, Dict, List, Optional, Any, Union
+
+from app.config import settings
+from app.models import LineaNC, MatchingResponse
+from app.processors import json_codec
+from app.processors.code_catalog import find_unknown_codes, get_code_catalog
+from app.processors.xml_processor import XMLProcessor
+from app.processors.ubl_document import ParsedUBLDocument
+from app.processors.rips_processor import RIPSData, RIPSProcessor, ServiceTable
+from app.processors.rips_stream import RIPSStream
+from app.services.batch_pipeline import BatchPipeline, PipelineStage, StageStats
 from app.services.folder_scanner import FolderInfo
+from app.services.llm_matcher import LLMMatcher, detect_equal_values
 from app.services.ministerio_service import MinisterioService
 
 logger = logging.getLogger(__name__)
@@ -63,7 +69,9 @@ class BatchState:
         errores: Number of failed folders
         resultados: List of BatchResult objects
         en_progreso: True if batch is currently being processed
-        token_sispro: SISPRO token for ministry API
+        token_sispro: SISPRO token for ministry API (renewed tokens are stored here)
+        concurrencia: Number of folders processed at the same time
+        etapas: Live statistics of each pipeline stage (queue depth, throughput)
     """
     batch_id: str
     total: int
@@ -74,6 +82,50 @@ class BatchState:
     rips_guardados: int = 0
     en_progreso: bool = False
     token_sispro: Optional[str] = None
+    concurrencia: int = 1
+    etapas: Dict[str, StageStats] = field(default_factory=dict)
+
+
+@dataclass
+class FolderWork:
+    """Work item carried through the batch pipeline stages for one folder.
+
+    Attributes:
+        carpeta: Name of the folder
+        folder_path: Full path to the folder
+        es_caso_especial: True if this is a special case folder
+        batch_id: Batch the folder belongs to (None outside a batch)
+        nc_doc: Parsed Nota Crédito XML
+        nc_filename: Nota Crédito XML filename
+        numero_nc: NC number extracted from XML
+        interop: Interoperabilidad section extracted from the factura
+        period: InvoicePeriod section extracted from the factura
+        lineas_nc: Lines of the Nota Crédito
+        rips_data: Parsed factura RIPS
+        servicios_rips: Services of the factura RIPS
+        matching_result: Result of the matching stage
+        items_igualados_a_cero: Number of items equalized to zero
+        rips_guardado: True if the NC RIPS was saved to disk
+        nc_rips_json: RIPS of the NC serialized once (compact JSON bytes), saved and sent as is
+        nc_xml: Final NC XML (UTF-8 bytes) ready to send to the ministry
+    """
+    carpeta: str
+    folder_path: str
+    es_caso_especial: bool = False
+    batch_id: Optional[str] = None
+    nc_doc: Optional[ParsedUBLDocument] = None
+    nc_filename: str = ""
+    numero_nc: str = "UNKNOWN"
+    interop: Optional[str] = None
+    period: Optional[str] = None
+    lineas_nc: List[LineaNC] = field(default_factory=list)
+    rips_data: RIPSData = field(default_factory=dict)
+    servicios_rips: Optional[ServiceTable] = None
+    matching_result: Optional[MatchingResponse] = None
+    items_igualados_a_cero: int = 0
+    rips_guardado: bool = False
+    nc_rips_json: Optional[bytes] = None
+    nc_xml: Optional[bytes] = None
 
 
 class BatchProcessor:
@@ -81,7 +133,8 @@ class BatchProcessor:
 
     This class manages the entire lifecycle of batch processing:
     - Creating and tracking batch jobs
-    - Processing folders sequentially
+    - Processing folders through a staged pipeline (parse, match, build, submit)
+      with separate concurrency limits per stage
     - Handling token expiration and re-login
     - Generating result reports
     """
@@ -168,6 +221,17 @@ class BatchProcessor:
         """
         return self._states.get(batch_id)
 
+    def _store_token(self, batch_id: Optional[str], token: str) -> None:
+        """Store a renewed SISPRO token so the other workers of the batch use it.
+
+        Args:
+            batch_id: Unique identifier for the batch (None outside a batch)
+            token: New SISPRO token
+        """
+        state = self._states.get(batch_id) if batch_id else None
+        if state:
+            state.token_sispro = token
+
     def _sanitize_path_component(self, component: str) -> str:
         """Sanitize a string to be safe for use in filesystem paths.
 
@@ -192,69 +256,125 @@ class BatchProcessor:
         # Replace any non-alphanumeric chars (except underscore/hyphen) with underscore
         return re.sub(r'[^\w\-]', '_', str(component))
 
+    def _resolve_concurrency(self, concurrency: Optional[int]) -> int:
+        """Resolve the number of folders processed at the same time.
+
+        Args:
+            concurrency: Per-batch concurrency level (None uses the global default)
+
+        Returns:
+            Concurrency level clamped to [1, settings.batch_max_concurrency]
+        """
+        if concurrency is None:
+            concurrency = settings.batch_concurrency
+        return max(1, min(concurrency, settings.batch_max_concurrency))
+
+    def _record_result(self, state: BatchState, result: BatchResult) -> None:
+        """Append a result to the batch state and update its counters.
+
+        Runs without awaiting, so counters stay consistent while several
+        folders are being processed concurrently.
+
+        Args:
+            state: BatchState to update
+            result: BatchResult of a processed folder
+        """
+        state.resultados.append(result)
+        state.completadas += 1
+
+        if result.exitoso:
+            state.exitosos += 1
+        else:
+            state.errores += 1
+
+        if result.rips_guardado:
+            state.rips_guardados += 1
+
+    def _build_pipeline(self, state: BatchState) -> BatchPipeline:
+        """Build the staged pipeline used by process_batch.
+
+        Stages:
+        - parse: read files, extract XML sections and parse the RIPS (thread pool)
+        - match: NC line / RIPS service matching, LLM calls limited separately
+        - build: generate NC RIPS and rewrite the XML bytes (thread pool)
+        - submit: send to the ministry, concurrency limited separately
+
+        Args:
+            state: BatchState of the batch (provides the current SISPRO token)
+
+        Returns:
+            BatchPipeline ready to run
+        """
+        async def parse(work: "FolderWork"):
+            return await asyncio.to_thread(self._parse_stage, work)
+
+        async def match(work: "FolderWork"):
+            # El rate limit del LLM lo aplica llm_rate_limiter solo cuando hay llamadas
+            return await self._match_stage(work)
+
+        async def build(work: "FolderWork"):
+            return await asyncio.to_thread(self._build_stage, work)
+
+        async def submit(work: "FolderWork"):
+            # Use the state token: it may have been renewed while processing other folders
+            return await self._submit_stage(work, state.token_sispro)
+
+        return BatchPipeline(
+            stages=[
+                PipelineStage("parse", parse, settings.batch_parse_workers),
+                PipelineStage("match", match, settings.batch_match_concurrency),
+                PipelineStage("build", build, settings.batch_parse_workers),
+                PipelineStage("submit", submit, settings.batch_submit_concurrency),
+            ],
+            is_final=lambda output: isinstance(output, BatchResult),
+            queue_size=settings.batch_queue_size
+        )
+
     async def process_batch(
         self,
         batch_id: str,
         folders: List[FolderInfo],
-        token: str
+        token: str,
+        concurrency: Optional[int] = None
     ) -> None:
         """Process a batch of folders.
 
-        Processes folders sequentially to avoid overwhelming the ministry API.
-        Updates statistics and calls progress callback after each folder.
+        Folders flow through a staged pipeline (parse, match, build, submit), with at
+        most ``concurrency`` folders inside the pipeline at the same time. Results are
+        reported in folder order: a folder that finishes early waits until all previous
+        folders have been reported, then statistics are updated and the progress
+        callback is called once per folder.
 
         Args:
             batch_id: Unique identifier for the batch
             folders: List of FolderInfo objects to process
             token: SISPRO token for ministry API
+            concurrency: Optional per-batch concurrency level (defaults to settings)
         """
         state = self._states.get(batch_id)
         if not state:
             logger.error(f"Batch {batch_id} not found")
             return
 
+        concurrency = self._resolve_concurrency(concurrency)
+
         state.en_progreso = True
         state.token_sispro = token
+        state.concurrencia = concurrency
 
-        try:
-            for i, folder in enumerate(folders):
-                try:
-                    result = await self.process_folder(
-                        folder.path,
-                        token,
-                        folder.es_caso_especial,
-                        batch_id=batch_id
-                    )
-
-                    state.resultados.append(result)
-                    state.completadas += 1
-
-                    if result.exitoso:
-                        state.exitosos += 1
-                    else:
-                        state.errores += 1
+        pipeline = self._build_pipeline(state)
+        state.etapas = pipeline.stats
 
-                    if result.rips_guardado:
-                        state.rips_guardados += 1
+        finished: Dict[int, BatchResult] = {}
+        next_to_report = 0
 
-                    # Delay entre carpetas para evitar rate limit de LLM
-                    # Moonshot tiene límites de ~10-20 req/s, con 0.5s estamos seguros
-                    if i < len(folders) - 1:  # No esperar después de la última
-                        await asyncio.sleep(0.5)
-
-                except Exception as e:
-                    # Mark error but continue processing other folders
-                    error_result = BatchResult(
-                        carpeta=folder.nombre,
-                        numero_nc="UNKNOWN",
-                        exitoso=False,
-                        error=str(e),
-                        es_caso_especial=folder.es_caso_especial
-                    )
-                    state.resultados.append(error_result)
-                    state.completadas += 1
-                    state.errores += 1
-                    logger.error(f"Error processing folder {folder.nombre}: {e}")
+        def report_finished(index: int, result: BatchResult) -> None:
+            """Report finished results in folder order."""
+            nonlocal next_to_report
+            finished[index] = result
+            while next_to_report in finished:
+                self._record_result(state, finished.pop(next_to_report))
+                next_to_report += 1
 
                 # Call progress callback if set
                 if self.on_progress:
@@ -263,9 +383,34 @@ class BatchProcessor:
                     except Exception as callback_error:
                         logger.warning(f"Progress callback error: {callback_error}")
 
+        def folder_error(index: int, work: "FolderWork", error: Exception) -> BatchResult:
+            # Mark error but continue processing other folders
+            logger.error(f"Error processing folder {work.carpeta}: {error}")
+            return BatchResult(
+                carpeta=work.carpeta,
+                numero_nc="UNKNOWN",
+                exitoso=False,
+                error=str(error),
+                es_caso_especial=work.es_caso_especial
+            )
+
+        works = [
+            FolderWork(
+                carpeta=Path(folder.path).name,
+                folder_path=folder.path,
+                es_caso_especial=folder.es_caso_especial,
+                batch_id=batch_id
+            )
+            for folder in folders
+        ]
+
+        try:
+            await pipeline.run(works, report_finished, folder_error, max_in_flight=concurrency)
+
         finally:
             state.en_progreso = False
             logger.info(f"Batch {batch_id} completed: {state.exitosos} success, {state.errores} errors")
+            logger.info(f"Batch {batch_id} stages: {pipeline.snapshot()}")
 
     async def process_folder(
         self,
@@ -276,7 +421,8 @@ class BatchProcessor:
     ) -> BatchResult:
         """Process a single folder.
 
-        Reads the 3 files from the folder, processes the NC, and sends to ministry.
+        Runs the pipeline stages one after the other for a single folder:
+        reads the 3 files, processes the NC, and sends to ministry.
         Handles token expiration by calling on_token_expired callback and retrying.
 
         Args:
@@ -287,257 +433,338 @@ class BatchProcessor:
         Returns:
             BatchResult with processing outcome
         """
-        folder = Path(folder_path)
-        folder_name = folder.name
+        work = FolderWork(
+            carpeta=Path(folder_path).name,
+            folder_path=folder_path,
+            es_caso_especial=es_caso_especial,
+            batch_id=batch_id
+        )
 
         try:
-            # Read the 3 files from the folder
-            files = self._read_folder_files(folder)
-
-            if not files:
-                return BatchResult(
-                    carpeta=folder_name,
-                    numero_nc="UNKNOWN",
-                    exitoso=False,
-                    error="Could not read required files from folder",
-                    es_caso_especial=es_caso_especial
-                )
+            parsed = self._parse_stage(work)
+            if isinstance(parsed, BatchResult):
+                return parsed
 
-            # Import here to avoid circular imports
-            from app.processors.xml_processor import XMLProcessor
-            from app.processors.rips_processor import RIPSProcessor
-            from app.services.llm_matcher import LLMMatcher
-
-            nc_content = files["nota_credito"]
-            factura_content = files["factura"]
-            rips_content = files["rips"]
-
-            # Extract NC number
-            numero_nc = _extract_nc_number(nc_content)
-
-            # Extract sections from factura
-            interop = XMLProcessor.extract_interoperabilidad(factura_content)
-            period = XMLProcessor.extract_invoice_period(factura_content)
-
-            if not interop or not period:
-                return BatchResult(
-                    carpeta=folder_name,
-                    numero_nc=numero_nc,
-                    exitoso=False,
-                    error="Missing Interoperabilidad or InvoicePeriod in factura",
-                    es_caso_especial=es_caso_especial
-                )
+            work = await self._match_stage(parsed)
 
-            # Extract NC lines
-            lineas_nc = XMLProcessor.extract_nc_lines(nc_content)
-            if not lineas_nc:
-                return BatchResult(
-                    carpeta=folder_name,
-                    numero_nc=numero_nc,
-                    exitoso=False,
-                    error="No lines found in Nota Credito",
-                    es_caso_especial=es_caso_especial
-                )
+            built = self._build_stage(work)
+            if isinstance(built, BatchResult):
+                return built
 
-            # Parse RIPS
-            rips_data = RIPSProcessor.parse_rips(rips_content)
-            servicios_rips = RIPSProcessor.get_all_services(rips_data)
-
-            if not servicios_rips:
-                return BatchResult(
-                    carpeta=folder_name,
-                    numero_nc=numero_nc,
-                    exitoso=False,
-                    error="No services found in RIPS",
-                    es_caso_especial=es_caso_especial
-                )
+            return await self._submit_stage(built, token)
 
-            # Matching
-            matcher = LLMMatcher()
-            matching_result = await matcher.match_services(lineas_nc, servicios_rips)
-
-            # Detect equal values for non-LDL folders
-            codigos_igualados = None
-            lineas_igualadas = []
-            items_igualados_count = 0
-            if not es_caso_especial:
-                for m in matching_result.matches:
-                    linea = next((l for l in lineas_nc if l.id == m.linea_nc), None)
-                    servicio = next(
-                        (s for s in servicios_rips
-                         if s.codigo == m.codigo_rips and s.tipo == m.tipo_servicio),
-                        None
-                    )
-                    if linea and servicio and abs(linea.valor - servicio.valor_unitario) < 0.01:
-                        if codigos_igualados is None:
-                            codigos_igualados = set()
-                        codigos_igualados.add(m.codigo_rips)
-                        lineas_igualadas.append(m.linea_nc)
-                        items_igualados_count += 1
-
-            # Generate RIPS for NC
-            matches_for_rips = [
-                {
-                    'tipo_servicio': m.tipo_servicio,
-                    'codigo_rips': m.codigo_rips,
-                    'valor_nc': m.valor_nc,
-                    'cantidad_calculada': m.cantidad_calculada
-                }
-                for m in matching_result.matches
-            ]
-
-            nc_rips = RIPSProcessor.generate_nc_rips(
-                rips_data,
-                numero_nc,
-                matches_for_rips,
-                es_caso_especial,
-                codigos_igualados_a_cero=codigos_igualados
+        except Exception as e:
+            logger.error(f"Error processing folder {work.carpeta}: {e}")
+            return BatchResult(
+                carpeta=work.carpeta,
+                numero_nc="UNKNOWN",
+                exitoso=False,
+                error=str(e),
+                es_caso_especial=es_caso_especial
             )
 
-            # Save RIPS JSON to temporary directory (non-critical operation)
-            rips_saved = False
-            if batch_id:
-                try:
-                    # Extract NC prefix from filename
-                    nc_xml_filename = files.get("nota_credito_filename", "")
-                    prefijo_nc = self._extraer_prefijo_nc(nc_xml_filename)
-
-                    # Get NIT from RIPS data and sanitize all path components
-                    nit = self._sanitize_path_component(rips_data.get("numDocumentoIdObligado", "UNKNOWN"))
-                    prefijo_nc_sanitized = self._sanitize_path_component(prefijo_nc)
-                    numero_nc_sanitized = self._sanitize_path_component(numero_nc)
-                    batch_id_sanitized = self._sanitize_path_component(batch_id)
-
-                    # Construct RIPS filename
-                    # numero_nc already includes prefix (e.g., "NCS2766" from ParentDocumentID)
-                    rips_filename = f"RIPS_{nit}_{numero_nc_sanitized}.json"
-
-                    # Create directory and save file (use sanitized batch_id)
-                    rips_dir = Path(__file__).parent.parent.parent / "temp" / "batch_rips" / batch_id_sanitized
-                    rips_dir.mkdir(parents=True, exist_ok=True)
-
-                    # Save RIPS JSON file
-                    rips_file_path = rips_dir / rips_filename
-                    with open(rips_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(nc_rips, f, indent=2, ensure_ascii=False)
-
-                    rips_saved = True
-                    logger.info(f"Saved RIPS file: {rips_filename}")
-                except (OSError, IOError, TypeError, ValueError) as e:
-                    logger.warning(f"Failed to save RIPS file for {folder_name}: {e}")
-
-            # Insert sections into NC
-            nc_completo = XMLProcessor.insert_sections(nc_content, interop, period)
-
-            # Apply per-line zero-equalization for non-LDL folders
-            if lineas_igualadas:
-                nc_completo = XMLProcessor.aplicar_valores_cero_por_linea(nc_completo, lineas_igualadas)
-
-            # Apply special case if needed
-            if es_caso_especial:
-                nc_completo = XMLProcessor.aplicar_caso_colesterol(nc_completo)
-
-            # Prepare payload for ministry
-            nc_bytes = nc_completo.encode('utf-8')
-            nc_base64 = base64.b64encode(nc_bytes).decode('utf-8')
-
-            payload = NCPayload(
-                rips=nc_rips,
-                xmlFevFile=nc_base64
-            )
+    def _parse_stage(self, work: "FolderWork") -> Union["FolderWork", BatchResult]:
+        """Parse stage: read the folder files and extract what matching needs.
 
-            # Send to ministry with token expiration handling
-            max_retries = 1
-            retry_count = 0
+        CPU-bound (file reads, regex extraction, RIPS parsing); runs in a thread pool
+        when called from the pipeline.
 
-            while retry_count <= max_retries:
-                try:
-                    response = await self.ministerio_service.enviar_nc(payload, token)
-
-                    if response.success:
-                        return BatchResult(
-                            carpeta=folder_name,
-                            numero_nc=numero_nc,
-                            exitoso=True,
-                            cuv=response.codigo_unico_validacion,
-                            es_caso_especial=es_caso_especial,
-                            raw_response=response.raw_response,
-                            items_igualados_a_cero=items_igualados_count,
-                            rips_guardado=rips_saved
-                        )
-                    else:
-                        # Check if it's a token expiration error (401)
-                        has_auth_error = any(
-                            e.Clase.upper() == "RECHAZADO" and
-                            ("token" in e.Descripcion.lower() or
-                             "autorizacion" in e.Descripcion.lower() or
-                             "401" in e.Descripcion)
-                            for e in response.errores
-                        )
-
-                        if has_auth_error and retry_count < max_retries and self.on_token_expired:
-                            logger.warning("Token expired, requesting new token")
-                            new_token = self.on_token_expired()
-                            if new_token:
-                                token = new_token
-                                retry_count += 1
-                                continue
-
-                        # Return error result
-                        error_msg = "; ".join([
-                            f"{e.Codigo}: {e.Descripcion}"
-                            for e in response.errores
-                        ])
-                        return BatchResult(
-                            carpeta=folder_name,
-                            numero_nc=numero_nc,
-                            exitoso=False,
-                            error=error_msg,
-                            es_caso_especial=es_caso_especial,
-                            raw_response=response.raw_response,
-                            rips_guardado=rips_saved
-                        )
+        Args:
+            work: FolderWork of the folder
 
-                except Exception as e:
-                    error_str = str(e).lower()
-                    is_auth_error = (
-                        "401" in error_str or
-                        "unauthorized" in error_str or
-                        "token" in error_str
-                    )
+        Returns:
+            The same FolderWork filled with the parsed data, or a BatchResult
+            if the folder cannot be processed
+        """
+        folder_name = work.carpeta
+        es_caso_especial = work.es_caso_especial
 
-                    if is_auth_error and retry_count < max_retries and self.on_token_expired:
-                        logger.warning(f"Token error during send: {e}, requesting new token")
-                        new_token = self.on_token_expired()
-                        if new_token:
-                            token = new_token
-                            retry_count += 1
-                            continue
+        # Read the 3 files from the folder
+        files = self._read_folder_files(Path(work.folder_path))
 
-                    raise  # Re-raise if not handled
+        if not files:
+            return BatchResult(
+                carpeta=folder_name,
+                numero_nc="UNKNOWN",
+                exitoso=False,
+                error="Could not read required files from folder",
+                es_caso_especial=es_caso_especial
+            )
 
-                retry_count += 1
+        # Parse each XML once; every extraction below reuses the same tag index
+        work.nc_doc = ParsedUBLDocument(files["nota_credito"])
+        work.nc_filename = files.get("nota_credito_filename") or ""
+        factura_doc = ParsedUBLDocument(files["factura"])
+        rips_content = files["rips"]
 
-            # Should not reach here, but just in case
+        # Extract NC number (ParentDocumentID, falling back to ID)
+        numero_nc = work.nc_doc.nc_number
+        work.numero_nc = numero_nc if numero_nc is not None else "NC"
+
+        # Extract sections from factura
+        work.interop, work.period = XMLProcessor.extract_factura_sections(factura_doc)
+
+        if not work.interop or not work.period:
             return BatchResult(
                 carpeta=folder_name,
-                numero_nc=numero_nc,
+                numero_nc=work.numero_nc,
                 exitoso=False,
-                error="Max retries exceeded",
-                es_caso_especial=es_caso_especial,
-                rips_guardado=rips_saved
+                error="Missing Interoperabilidad or InvoicePeriod in factura",
+                es_caso_especial=es_caso_especial
             )
 
-        except Exception as e:
-            logger.error(f"Error processing folder {folder_name}: {e}")
+        # Extract NC lines
+        work.lineas_nc = XMLProcessor.extract_nc_lines(work.nc_doc)
+        if not work.lineas_nc:
             return BatchResult(
                 carpeta=folder_name,
-                numero_nc="UNKNOWN",
+                numero_nc=work.numero_nc,
                 exitoso=False,
-                error=str(e),
+                error="No lines found in Nota Credito",
                 es_caso_especial=es_caso_especial
             )
 
+        # Parse RIPS (large files are already open as a stream)
+        if isinstance(rips_content, RIPSStream):
+            work.rips_data = rips_content
+        else:
+            work.rips_data = RIPSProcessor.parse_rips(rips_content)
+        work.servicios_rips = RIPSProcessor.get_all_services(work.rips_data)
+
+        if not work.servicios_rips:
+            return BatchResult(
+                carpeta=folder_name,
+                numero_nc=work.numero_nc,
+                exitoso=False,
+                error="No services found in RIPS",
+                es_caso_especial=es_caso_especial
+            )
+
+        return work
+
+    async def _match_stage(self, work: "FolderWork") -> "FolderWork":
+        """Match stage: match NC lines with RIPS services (may call the LLM).
+
+        Args:
+            work: FolderWork filled by the parse stage
+
+        Returns:
+            The same FolderWork with matching_result set
+        """
+        matcher = LLMMatcher()
+        work.matching_result = await matcher.match_services(work.lineas_nc, work.servicios_rips)
+        return work
+
+    def _build_stage(self, work: "FolderWork") -> Union["FolderWork", BatchResult]:
+        """Build stage: generate the NC RIPS and rewrite the NC XML bytes.
+
+        CPU-bound; runs in a thread pool when called from the pipeline.
+
+        Args:
+            work: FolderWork filled by the match stage
+
+        Returns:
+            The same FolderWork with nc_rips_json and nc_xml set. Codes missing
+            from the code catalog are only logged as warnings
+        """
+        folder_name = work.carpeta
+        es_caso_especial = work.es_caso_especial
+        lineas_nc = work.lineas_nc
+        servicios_rips = work.servicios_rips
+        matching_result = work.matching_result
+        rips_data = work.rips_data
+        numero_nc = work.numero_nc
+
+        # Detect equal values for non-LDL folders
+        codigos_igualados = None
+        lineas_igualadas = []
+        items_igualados_count = 0
+        if not es_caso_especial:
+            items_igualados = detect_equal_values(matching_result.matches, lineas_nc, servicios_rips)
+            if items_igualados:
+                codigos_igualados = {item.codigo_rips for item in items_igualados}
+            lineas_igualadas = [item.linea_nc for item in items_igualados]
+            items_igualados_count = len(items_igualados)
+        work.items_igualados_a_cero = items_igualados_count
+
+        # Generate RIPS for NC
+        matches_for_rips = [
+            {
+                'tipo_servicio': m.tipo_servicio,
+                'codigo_rips': m.codigo_rips,
+                'valor_nc': m.valor_nc,
+                'cantidad_calculada': m.cantidad_calculada
+            }
+            for m in matching_result.matches
+        ]
+
+        nc_rips = RIPSProcessor.generate_nc_rips(
+            rips_data,
+            numero_nc,
+            matches_for_rips,
+            es_caso_especial,
+            codigos_igualados_a_cero=codigos_igualados,
+            catalogo=servicios_rips
+        )
+
+        # Codes missing from the CUPS/CUM catalog are only warnings: the ministry has the final say
+        catalogo_codigos = get_code_catalog()
+        if catalogo_codigos is not None:
+            for advertencia in find_unknown_codes(nc_rips, catalogo_codigos):
+                logger.warning(f"[Batch] {folder_name}: {advertencia}")
+
+        # Serialize once: the same bytes are saved and sent to the ministry
+        nc_rips_json = json_codec.dumps(nc_rips)
+
+        # Save RIPS JSON to temporary directory (non-critical operation)
+        work.rips_guardado = False
+        if work.batch_id:
+            try:
+                # Extract NC prefix from filename
+                prefijo_nc = self._extraer_prefijo_nc(work.nc_filename)
+
+                # Get NIT from RIPS data and sanitize all path components
+                nit = self._sanitize_path_component(rips_data.get("numDocumentoIdObligado", "UNKNOWN"))
+                prefijo_nc_sanitized = self._sanitize_path_component(prefijo_nc)
+                numero_nc_sanitized = self._sanitize_path_component(numero_nc)
+                batch_id_sanitized = self._sanitize_path_component(work.batch_id)
+
+                # Construct RIPS filename
+                # numero_nc already includes prefix (e.g., "NCS2766" from ParentDocumentID)
+                rips_filename = f"RIPS_{nit}_{numero_nc_sanitized}.json"
+
+                # Create directory and save file (use sanitized batch_id)
+                rips_dir = Path(__file__).parent.parent.parent / "temp" / "batch_rips" / batch_id_sanitized
+                rips_dir.mkdir(parents=True, exist_ok=True)
+
+                # Save RIPS JSON file
+                rips_file_path = rips_dir / rips_filename
+                rips_file_path.write_bytes(nc_rips_json)
+
+                work.rips_guardado = True
+                logger.info(f"Saved RIPS file: {rips_filename}")
+            except (OSError, IOError, TypeError, ValueError) as e:
+                logger.warning(f"Failed to save RIPS file for {folder_name}: {e}")
+
+        # Insert sections into NC
+        nc_completo = XMLProcessor.insert_sections(work.nc_doc, work.interop, work.period)
+
+        # Apply per-line zero-equalization for non-LDL folders
+        if lineas_igualadas:
+            nc_completo = XMLProcessor.aplicar_valores_cero_por_linea(nc_completo, lineas_igualadas)
+
+        # Apply special case if needed
+        if es_caso_especial:
+            nc_completo = XMLProcessor.aplicar_caso_colesterol(nc_completo)
+
+        # Keep only the final XML bytes; base64 is encoded while sending
+        work.nc_rips_json = nc_rips_json
+        work.nc_xml = nc_completo
+        work.nc_doc = None
+
+        return work
+
+    async def _submit_stage(self, work: "FolderWork", token: str) -> BatchResult:
+        """Submit stage: send the NC RIPS and XML to the ministry.
+
+        Handles token expiration by calling on_token_expired callback and retrying.
+
+        Args:
+            work: FolderWork filled by the build stage
+            token: SISPRO token for ministry API
+
+        Returns:
+            BatchResult with processing outcome
+        """
+        folder_name = work.carpeta
+        numero_nc = work.numero_nc
+        es_caso_especial = work.es_caso_especial
+        rips_saved = work.rips_guardado
+
+        # Send to ministry with token expiration handling
+        max_retries = 1
+        retry_count = 0
+
+        while retry_count <= max_retries:
+            try:
+                response = await self.ministerio_service.enviar_nc_xml(work.nc_rips_json, work.nc_xml, token)
+
+                if response.success:
+                    return BatchResult(
+                        carpeta=folder_name,
+                        numero_nc=numero_nc,
+                        exitoso=True,
+                        cuv=response.codigo_unico_validacion,
+                        es_caso_especial=es_caso_especial,
+                        raw_response=response.raw_response,
+                        items_igualados_a_cero=work.items_igualados_a_cero,
+                        rips_guardado=rips_saved
+                    )
+                else:
+                    # Check if it's a token expiration error (401)
+                    has_auth_error = any(
+                        e.Clase.upper() == "RECHAZADO" and
+                        ("token" in e.Descripcion.lower() or
+                         "autorizacion" in e.Descripcion.lower() or
+                         "401" in e.Descripcion)
+                        for e in response.errores
+                    )
+
+                    if has_auth_error and retry_count < max_retries and self.on_token_expired:
+                        logger.warning("Token expired, requesting new token")
+                        new_token = self.on_token_expired()
+                        if new_token:
+                            token = new_token
+                            self._store_token(work.batch_id, new_token)
+                            retry_count += 1
+                            continue
+
+                    # Return error result
+                    error_msg = "; ".join([
+                        f"{e.Codigo}: {e.Descripcion}"
+                        for e in response.errores
+                    ])
+                    return BatchResult(
+                        carpeta=folder_name,
+                        numero_nc=numero_nc,
+                        exitoso=False,
+                        error=error_msg,
+                        es_caso_especial=es_caso_especial,
+                        raw_response=response.raw_response,
+                        rips_guardado=rips_saved
+                    )
+
+            except Exception as e:
+                error_str = str(e).lower()
+                is_auth_error = (
+                    "401" in error_str or
+                    "unauthorized" in error_str or
+                    "token" in error_str
+                )
+
+                if is_auth_error and retry_count < max_retries and self.on_token_expired:
+                    logger.warning(f"Token error during send: {e}, requesting new token")
+                    new_token = self.on_token_expired()
+                    if new_token:
+                        token = new_token
+                        self._store_token(work.batch_id, new_token)
+                        retry_count += 1
+                        continue
+
+                raise  # Re-raise if not handled
+
+            retry_count += 1
+
+        # Should not reach here, but just in case
+        return BatchResult(
+            carpeta=folder_name,
+            numero_nc=numero_nc,
+            exitoso=False,
+            error="Max retries exceeded",
+            es_caso_especial=es_caso_especial,
+            rips_guardado=rips_saved
+        )
+
     def generate_zip(self, batch_id: str, output_path: str) -> str:
         """Generate a ZIP file with batch results.
 
@@ -573,15 +800,15 @@ class BatchProcessor:
                     # Cuando resultState es True, guardar DIRECTAMENTE la respuesta del ministerio
                     # sin envolverla en otro objeto
                     if resultado.raw_response:
-                        content = json.dumps(resultado.raw_response, indent=2, ensure_ascii=False)
+                        content = json_codec.dumps_pretty(resultado.raw_response)
                     else:
                         # Fallback si no hay raw_response (no debería ocurrir)
-                        content = json.dumps({
+                        content = json_codec.dumps_pretty({
                             "carpeta": resultado.carpeta,
                             "numero_nc": resultado.numero_nc,
                             "cuv": resultado.cuv,
                             "es_caso_especial": resultado.es_caso_especial
-                        }, indent=2, ensure_ascii=False)
+                        })
                     zf.writestr(filename, content)
 
             # Add errors CSV
@@ -596,7 +823,7 @@ class BatchProcessor:
         logger.info(f"Generated ZIP: {zip_path}")
         return str(zip_path)
 
-    def _read_folder_files(self, folder: Path) -> Optional[Dict[str, str]]:
+    def _read_folder_files(self, folder: Path) -> Optional[Dict[str, Union[str, bytes, RIPSStream]]]:
         """Read the 3 required files from a folder.
 
         Args:
@@ -604,7 +831,9 @@ class BatchProcessor:
 
         Returns:
             Dictionary with 4 keys: 'factura', 'nota_credito', 'nota_credito_filename', 'rips'.
-            The first 3 contain file content, 'nota_credito_filename' contains the NC filename.
+            'factura' and 'nota_credito' contain the raw XML bytes (never decoded as a whole),
+            'rips' the JSON text (a RIPSStream over the file when it exceeds
+            settings.rips_stream_threshold_mb) and 'nota_credito_filename' the NC filename.
             Returns None if required files cannot be read.
         """
         files = {
@@ -627,16 +856,19 @@ class BatchProcessor:
 
                 # Detect Factura XML (contains PMD, HMD, or MDS + .xml)
                 if file_path.suffix.lower() == ".xml" and ("PMD" in filename_upper or "HMD" in filename_upper or "MDS" in filename_upper):
-                    files["factura"] = file_path.read_text(encoding='utf-8')
+                    files["factura"] = file_path.read_bytes()
 
                 # Detect Nota Credito XML (contains NC, NCD, or NCS + .xml)
                 elif file_path.suffix.lower() == ".xml" and "NC" in filename_upper:
-                    files["nota_credito"] = file_path.read_text(encoding='utf-8')
+                    files["nota_credito"] = file_path.read_bytes()
                     files["nota_credito_filename"] = file_path.name  # NUEVO
 
                 # Detect RIPS JSON (must contain "RIPS" in filename, ignore CUV/other JSONs)
                 elif file_path.suffix.lower() == ".json" and "RIPS" in filename_upper:
-                    files["rips"] = file_path.read_text(encoding='utf-8')
+                    if file_path.stat().st_size > settings.rips_stream_threshold_mb * 1024 * 1024:
+                        files["rips"] = RIPSStream.from_path(file_path)
+                    else:
+                        files["rips"] = file_path.read_text(encoding='utf-8')
 
             # Check if all required files are present (excluding nota_credito_filename which is derived)
             required_files = ["factura", "nota_credito", "rips"]
@@ -674,7 +906,7 @@ class BatchProcessor:
             detalle_completo = ""
             if error.raw_response:
                 try:
-                    detalle_completo = json.dumps(error.raw_response, ensure_ascii=False, indent=2)
+                    detalle_completo = json_codec.dumps_pretty(error.raw_response)
                 except Exception as e:
                     detalle_completo = str(error.raw_response)
 
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from openai import AsyncOpenAI
 
 from app.models import (
@@ -9,6 +9,7 @@ from app.models import (
     ValidationError
 )
 from app.config import settings
+from app.services.llm_clients import create_chat_completion, get_llm_client
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -17,9 +18,10 @@ logger = logging.getLogger(__name__)
 class CorreccionAgent:
     """Agente de IA para proponer correcciones a errores de validación CUV."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[AsyncOpenAI] = None):
         # Usar kimi_api_key si está configurado, si no, usar llm_api_key
         api_key = settings.kimi_api_key if settings.kimi_api_key else settings.llm_api_key
+        self.api_key = api_key
 
         # Log de configuración (sin exponer la API key completa)
         api_key_preview = f"{api_key[:8]}..." if api_key and len(api_key) > 8 else "NO CONFIGURADA"
@@ -27,12 +29,20 @@ class CorreccionAgent:
         logger.info(f"[CorreccionAgent] Base URL: {settings.kimi_base_url}")
         logger.info(f"[CorreccionAgent] Modelo: {settings.kimi_model}")
 
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=settings.kimi_base_url
-        )
+        self._client = client
         self.model = settings.kimi_model
 
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Cliente LLM a usar: el inyectado o el compartido de la aplicación."""
+        if self._client is not None:
+            return self._client
+        return get_llm_client(self.api_key, settings.kimi_base_url)
+
+    @client.setter
+    def client(self, client: AsyncOpenAI) -> None:
+        self._client = client
+
     async def analizar_errores(
         self,
         errores: List[ValidationError],
@@ -43,7 +53,8 @@ class CorreccionAgent:
         prompt = self._construir_prompt(errores, xml_content, rips_json)
 
         try:
-            response = await self.client.chat.completions.create(
+            response = await create_chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.config import settings
+from app.services.rate_limiter import TokenBucketLimiter, llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Clientes compartidos por (api_key, base_url); cada uno con su pool de conexiones keep-alive
+_clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+_clients_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing_tasks: Set[asyncio.Task] = set()
+
+
+def _new_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.llm_timeout, connect=settings.llm_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.llm_pool_size,
+            max_keepalive_connections=settings.llm_pool_size,
+            keepalive_expiry=settings.llm_keepalive_expiry
+        )
+    )
+    # Sin reintentos del SDK: los 429 pasan por el rate limiter compartido y los errores
+    # transitorios se reintentan en create_chat_completion
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def _discard_client(client: AsyncOpenAI) -> None:
+    """Cierra en segundo plano un cliente reemplazado para liberar su pool de conexiones."""
+    async def _close() -> None:
+        try:
+            await client.close()
+        except Exception as e:
+            # Conexiones ligadas a un event loop ya cerrado
+            logger.debug(f"[LLMClients] Error cerrando cliente anterior: {e}")
+
+    task = asyncio.get_running_loop().create_task(_close())
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def get_llm_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """
+    Retorna el cliente LLM compartido de la aplicación para ``api_key`` y ``base_url``.
+
+    LLMMatcher y CorreccionAgent se crean por request (o por carpeta en batch), pero el
+    cliente y su pool de conexiones se reutilizan, así que las llamadas no vuelven a
+    negociar TLS. Si el event loop cambió (p.ej. en tests) se crean clientes nuevos y
+    los anteriores se cierran.
+    """
+    global _clients_loop
+
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        for anterior in _clients.values():
+            if not anterior.is_closed():
+                _discard_client(anterior)
+        _clients.clear()
+        _clients_loop = loop
+
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed():
+        client = _clients[key] = _new_client(api_key, base_url)
+    return client
+
+
+def open_llm_clients() -> None:
+    """Crea al arrancar los clientes del matcher y del agente de corrección."""
+    get_llm_client(settings.llm_api_key, settings.llm_base_url)
+    get_llm_client(settings.kimi_api_key or settings.llm_api_key, settings.kimi_base_url)
+
+
+async def close_llm_clients() -> None:
+    """Cierra los clientes LLM compartidos (se llama al apagar la aplicación)."""
+    global _clients_loop
+
+    for client in list(_clients.values()):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"[LLMClients] Error cerrando cliente: {e}")
+    _clients.clear()
+    _clients_loop = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación gruesa de tokens de un texto (unos 4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+# Errores de red, timeouts y 5xx del proveedor: vale la pena reintentar
+_ERRORES_TRANSITORIOS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+def _retry_after(error: openai.RateLimitError) -> Optional[float]:
+    """Segundos indicados por el proveedor en Retry-After (o retry-after-ms), si los hay."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+async def create_chat_completion(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, Any]],
+    limiter: Optional[TokenBucketLimiter] = None,
+    **kwargs: Any
+) -> Any:
+    """
+    ``client.chat.completions.create`` pasando por el rate limiter compartido.
+
+    Los tokens estimados del prompt más ``max_tokens`` se descuentan de la cubeta de
+    tokens por minuto. Si el proveedor responde 429 el limitador se ajusta y la llamada
+    se reintenta hasta ``llm_rate_limit_retries`` veces antes de propagar el error. Los
+    errores de conexión, timeouts y 5xx se reintentan hasta ``llm_transient_retries``
+    veces, esperando ``llm_retry_delay`` segundos (el doble en cada intento).
+    """
+    limiter = limiter or llm_rate_limiter
+    tokens = sum(estimate_tokens(str(m.get('content') or '')) for m in messages) + kwargs.get('max_tokens', 0)
+    reintentos = max(0, settings.llm_rate_limit_retries)
+    reintentos_transitorios = max(0, settings.llm_transient_retries)
+    limitados = fallidos = 0
+
+    while True:
+        await limiter.acquire(tokens)
+        try:
+            response = await client.chat.completions.create(messages=messages, **kwargs)
+        except openai.RateLimitError as e:
+            limiter.penalize(_retry_after(e))
+            limitados += 1
+            logger.warning(f"[LLMClients] Rate limit del proveedor (intento {limitados}/{reintentos + 1})")
+            if limitados > reintentos:
+                raise
+            continue
+        except _ERRORES_TRANSITORIOS as e:
+            fallidos += 1
+            logger.warning(f"[LLMClients] Error transitorio del proveedor (intento {fallidos}/{reintentos_transitorios + 1}): {e}")
+            if fallidos > reintentos_transitorios:
+                raise
+            await asyncio.sleep(settings.llm_retry_delay * 2 ** (fallidos - 1))
+            continue
+        limiter.reward()
+        return response
@@ -1,20 +1,157 @@
+import asyncio
 import json
+import logging
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from collections import Counter
+from typing import List, Deque, Dict, Any, Optional, Tuple
 from openai import AsyncOpenAI
 from app.config import settings
-from app.models import LineaNC, ServicioRIPS, MatchResult, MatchingResponse, Confianza
+from app.models import LineaNC, ServicioRIPS, MatchResult, MatchingResponse, Confianza, ItemIgualadoCero
+from app.processors.money import montos_iguales, to_cents
+from app.processors.code_automaton import CodeAutomaton
+from app.processors.code_catalog import get_code_catalog
+from app.processors.rips_processor import index_by_codigo
+from app.services.assignment import MAX_CELDAS, assignment_cost, solve_assignment
+from app.services.llm_clients import create_chat_completion, estimate_tokens, get_llm_client
+from app.services.local_matcher import LocalMatcher
+from app.services.match_cache import MatchCache, match_cache
 
+logger = logging.getLogger(__name__)
 
-class LLMMatcher:
-    """Servicio de matching usando LLM."""
+
+SYSTEM_PROMPT = '''Eres un experto en facturación electrónica del sector salud colombiano.
+Tu tarea es hacer el matching entre líneas de una Nota Crédito y servicios del RIPS.
+
+REGLAS:
+1. Cada línea de la NC debe matchear con UN servicio del RIPS
+2. El código puede estar entre paréntesis en la descripción: "00037492 (19943544) NOMBRE" → código es "19943544"
+3. Calcula cantidad: cantidad = valor_nc / valor_unitario_rips
+4. Si no puedes calcular cantidad exacta, indica "verificar_manualmente"
+
+TIPOS DE SERVICIO VÁLIDOS:
+- medicamentos
+- procedimientos
+- consultas
+- otrosServicios
+
+RESPONDE SOLO JSON válido sin markdown ni explicaciones adicionales.'''
+
+
+# Orden de preferencia cuando dos líneas reclaman el mismo servicio
+_PRIORIDAD_CONFIANZA = {Confianza.ALTA: 0, Confianza.MEDIA: 1, Confianza.BAJA: 2}
+
+
+class _RespuestaTruncada(Exception):
+    """El LLM cortó la respuesta por el límite de tokens de salida."""
+
+
+class MatchingStats:
+    """Líneas NC resueltas por cada etapa del matching y llamadas hechas al LLM."""
+
+    ETAPAS = ('codigo', 'cache', 'local', 'llm', 'fallback')
 
     def __init__(self):
-        self.client = AsyncOpenAI(
-            api_key=settings.llm_api_key,
-            base_url=settings.llm_base_url
+        self._lock = threading.Lock()
+        self.clear()
+
+    def record(self, etapa: str, lineas: int) -> None:
+        with self._lock:
+            self.lineas[etapa] += lineas
+            if etapa == 'llm':
+                self.llm_calls += 1
+
+    def record_failure(self) -> None:
+        """Solicitud al LLM fallida (se reintenta o pasa al fallback)."""
+        with self._lock:
+            self.llm_failures += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.lineas = {etapa: 0 for etapa in self.ETAPAS}
+            self.llm_calls = 0
+            self.llm_failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.lineas.values())
+            sin_llm = self.lineas['codigo'] + self.lineas['cache'] + self.lineas['local']
+            return {
+                'lineas': dict(self.lineas),
+                'llm_calls': self.llm_calls,
+                'llm_failures': self.llm_failures,
+                'sin_llm_rate': round(sin_llm / total, 4) if total else 0.0,
+            }
+
+
+matching_stats = MatchingStats()
+
+
+def detect_equal_values(
+    matches: List[MatchResult],
+    lineas_nc: List[LineaNC],
+    servicios_rips: List[ServicioRIPS]
+) -> List[ItemIgualadoCero]:
+    """
+    Detecta los matches cuyo valor en la NC es igual al valor unitario del RIPS.
+
+    Usa el primer servicio con el código y tipo del match y la primera línea con su id,
+    buscados en índices armados una vez (no un recorrido por match).
+    """
+    lineas: Dict[int, LineaNC] = {}
+    for linea in lineas_nc:
+        lineas.setdefault(linea.id, linea)
+    por_codigo = index_by_codigo(servicios_rips)
+
+    items_igualados = []
+    for m in matches:
+        linea = lineas.get(m.linea_nc)
+        if not linea:
+            continue
+
+        servicio = next(
+            (servicios_rips[i] for i in por_codigo.get(m.codigo_rips, ())
+             if servicios_rips[i].tipo == m.tipo_servicio),
+            None
         )
+        if not servicio:
+            continue
+
+        if montos_iguales(linea.valor, servicio.valor_unitario):
+            items_igualados.append(ItemIgualadoCero(
+                linea_nc=m.linea_nc,
+                codigo_rips=m.codigo_rips,
+                tipo_servicio=m.tipo_servicio,
+                valor_original=linea.valor
+            ))
+
+    return items_igualados
+
+
+class LLMMatcher:
+    """Servicio de matching usando LLM."""
+
+    def __init__(
+        self,
+        cache: Optional[MatchCache] = None,
+        use_local: Optional[bool] = None,
+        client: Optional[AsyncOpenAI] = None
+    ):
+        self._client = client
         self.model = settings.llm_model
+        self.cache = cache if cache is not None else match_cache
+        self.use_local = settings.local_match_enabled if use_local is None else use_local
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Cliente LLM a usar: el inyectado o el compartido de la aplicación."""
+        if self._client is not None:
+            return self._client
+        return get_llm_client(settings.llm_api_key, settings.llm_base_url)
+
+    @client.setter
+    def client(self, client: AsyncOpenAI) -> None:
+        self._client = client
 
     async def match_services(
         self,
@@ -23,12 +160,32 @@ class LLMMatcher:
     ) -> MatchingResponse:
         """Realiza el matching entre líneas NC y servicios RIPS."""
 
-        # Primero intentar matching por código
+        # Primero intentar matching por código (entre paréntesis o en cualquier parte de la descripción)
+        lineas_nc = self._extract_rips_codes(lineas_nc, servicios_rips)
         code_matches, unmatched_lines = self._match_by_code(lineas_nc, servicios_rips)
+        matching_stats.record('codigo', len(code_matches))
+
+        # Servicios ya tomados por cada etapa (un servicio no se asigna a más líneas de las que factura)
+        usados = Counter((m.tipo_servicio, m.codigo_rips) for m in code_matches)
+
+        # Luego los matches ya resueltos por el LLM para las mismas descripciones
+        if unmatched_lines:
+            cached_matches, unmatched_lines = self._match_from_cache(unmatched_lines, servicios_rips, usados)
+            code_matches.extend(cached_matches)
+            matching_stats.record('cache', len(cached_matches))
+
+        # Matching local por similitud de nombre y valor; las líneas ambiguas siguen al LLM.
+        # El mismo índice elige después los candidatos que se envían al LLM
+        local = None
+        if unmatched_lines and self.use_local:
+            local = LocalMatcher(servicios_rips, catalogo=get_code_catalog(), usados=usados)
+            local_matches, unmatched_lines = local.match(unmatched_lines)
+            code_matches.extend(local_matches)
+            matching_stats.record('local', len(local_matches))
 
         # Si quedan líneas sin match, usar LLM
         if unmatched_lines:
-            llm_matches = await self._match_with_llm(unmatched_lines, servicios_rips)
+            llm_matches = await self._match_with_llm(unmatched_lines, servicios_rips, local, usados)
             code_matches.extend(llm_matches)
 
         return MatchingResponse(
@@ -36,110 +193,427 @@ class LLMMatcher:
             warnings=[]
         )
 
+    @staticmethod
+    def _extract_rips_codes(
+        lineas_nc: List[LineaNC],
+        servicios_rips: List[ServicioRIPS]
+    ) -> List[LineaNC]:
+        """
+        Completa ``codigo_extraido`` con códigos del RIPS que aparecen en la descripción.
+
+        Solo para líneas sin código entre paréntesis o con un código que no está en el
+        RIPS. Retorna copias de esas líneas (las originales no se modifican).
+        """
+        codigos = index_by_codigo(servicios_rips)
+        pendientes = [
+            n for n, linea in enumerate(lineas_nc)
+            if not linea.codigo_extraido or linea.codigo_extraido not in codigos
+        ]
+        if not pendientes:
+            return lineas_nc
+
+        automata = CodeAutomaton(codigos)
+        resultado = list(lineas_nc)
+        for n in pendientes:
+            codigo = automata.best_code(lineas_nc[n].descripcion)
+            if codigo:
+                resultado[n] = lineas_nc[n].model_copy(update={'codigo_extraido': codigo})
+        return resultado
+
     def _match_by_code(
         self,
         lineas_nc: List[LineaNC],
         servicios_rips: List[ServicioRIPS]
     ) -> tuple[List[MatchResult], List[LineaNC]]:
-        """Intenta hacer matching por código extraído de la descripción."""
+        """
+        Intenta hacer matching por código extraído de la descripción.
+
+        Si todos los servicios con el código tienen el mismo valor unitario, cada línea
+        toma el primero sin usar. Si el código se facturó con valores distintos, las
+        líneas y servicios de ese código se asignan con costo mínimo (valor, cantidad y
+        nombre; ver ``assignment_cost``).
+        """
         matches = []
         unmatched = []
 
-        used_services = set()
-
-        for linea in lineas_nc:
-            if not linea.codigo_extraido:
+        # Servicios aún sin usar por código; cada línea toma el primero de la cola
+        disponibles = index_by_codigo(servicios_rips)
+        asignados = self._assign_ambiguous_codes(lineas_nc, servicios_rips, disponibles)
+
+        for n, linea in enumerate(lineas_nc):
+            if n in asignados:
+                posicion = asignados[n]
+            else:
+                cola = disponibles.get(linea.codigo_extraido) if linea.codigo_extraido else None
+                posicion = cola.popleft() if cola else None
+            if posicion is None:
                 unmatched.append(linea)
                 continue
 
-            # Buscar servicio con ese código
-            found = False
-            for i, servicio in enumerate(servicios_rips):
-                if i in used_services:
-                    continue
+            servicio = servicios_rips[posicion]
+            cantidad = linea.valor / servicio.valor_unitario if servicio.valor_unitario > 0 else 0
 
-                if servicio.codigo == linea.codigo_extraido:
-                    cantidad = linea.valor / servicio.valor_unitario if servicio.valor_unitario > 0 else 0
-
-                    matches.append(MatchResult(
-                        linea_nc=linea.id,
-                        tipo_servicio=servicio.tipo,
-                        codigo_rips=servicio.codigo,
-                        valor_nc=linea.valor,
-                        valor_unitario_rips=servicio.valor_unitario,
-                        cantidad_calculada=round(cantidad, 2),
-                        confianza=Confianza.ALTA
-                    ))
-                    used_services.add(i)
-                    found = True
-                    break
-
-            if not found:
-                unmatched.append(linea)
+            matches.append(MatchResult(
+                linea_nc=linea.id,
+                tipo_servicio=servicio.tipo,
+                codigo_rips=servicio.codigo,
+                valor_nc=linea.valor,
+                valor_unitario_rips=servicio.valor_unitario,
+                cantidad_calculada=round(cantidad, 2),
+                confianza=Confianza.ALTA
+            ))
 
         return matches, unmatched
 
-    async def _match_with_llm(
+    @staticmethod
+    def _assign_ambiguous_codes(
+        lineas_nc: List[LineaNC],
+        servicios_rips: List[ServicioRIPS],
+        disponibles: Dict[str, Deque[int]]
+    ) -> Dict[int, Optional[int]]:
+        """
+        Resuelve los códigos facturados con varios valores unitarios.
+
+        Retorna ``{posición de la línea: posición del servicio o None}`` para las líneas
+        de esos códigos; sus servicios se sacan de ``disponibles``.
+        """
+        grupos: Dict[str, List[int]] = {}
+        for n, linea in enumerate(lineas_nc):
+            if linea.codigo_extraido and linea.codigo_extraido in disponibles:
+                grupos.setdefault(linea.codigo_extraido, []).append(n)
+
+        asignados: Dict[int, Optional[int]] = {}
+        for codigo, filas in grupos.items():
+            posiciones = list(disponibles[codigo])
+            valores = {to_cents(servicios_rips[i].valor_unitario) for i in posiciones}
+            if len(valores) < 2 or len(filas) * len(posiciones) > MAX_CELDAS:
+                continue
+
+            costos = [
+                [assignment_cost(lineas_nc[n], servicios_rips[i]) for i in posiciones]
+                for n in filas
+            ]
+            for n, columna in zip(filas, solve_assignment(costos)):
+                asignados[n] = posiciones[columna] if columna >= 0 else None
+            disponibles[codigo].clear()
+
+        return asignados
+
+    def _match_from_cache(
         self,
         lineas_nc: List[LineaNC],
-        servicios_rips: List[ServicioRIPS]
-    ) -> List[MatchResult]:
-        """Usa LLM para hacer matching de líneas restantes."""
+        servicios_rips: List[ServicioRIPS],
+        usados: Optional[Counter] = None
+    ) -> tuple[List[MatchResult], List[LineaNC]]:
+        """
+        Resuelve las líneas cuya descripción ya se matcheó antes con un servicio de este RIPS.
 
-        system_prompt = '''Eres un experto en facturación electrónica del sector salud colombiano.
-Tu tarea es hacer el matching entre líneas de una Nota Crédito y servicios del RIPS.
+        Solo se usan servicios con capacidad libre según ``usados``, que se actualiza.
+        """
+        matches = []
+        unmatched = []
+        por_codigo = None
+        usados = usados if usados is not None else Counter()
+        capacidad = Counter((s.tipo, s.codigo) for s in servicios_rips)
+        disponibles = {clave for clave, n in capacidad.items() if usados[clave] < n}
 
-REGLAS:
-1. Cada línea de la NC debe matchear con UN servicio del RIPS
-2. El código puede estar entre paréntesis en la descripción: "00037492 (19943544) NOMBRE" → código es "19943544"
-3. Calcula cantidad: cantidad = valor_nc / valor_unitario_rips
-4. Si no puedes calcular cantidad exacta, indica "verificar_manualmente"
+        for linea in lineas_nc:
+            cached = self.cache.get(linea.descripcion, disponibles)
+            servicio = None
+            if cached:
+                tipo_servicio, codigo_rips, confianza = cached
+                if por_codigo is None:
+                    por_codigo = index_by_codigo(servicios_rips)
+                servicio = next(
+                    (servicios_rips[i] for i in por_codigo.get(codigo_rips, ())
+                     if servicios_rips[i].tipo == tipo_servicio),
+                    None
+                )
+            if not servicio:
+                unmatched.append(linea)
+                continue
 
-TIPOS DE SERVICIO VÁLIDOS:
-- medicamentos
-- procedimientos
-- consultas
-- otrosServicios
+            clave = (servicio.tipo, servicio.codigo)
+            usados[clave] += 1
+            if usados[clave] >= capacidad[clave]:
+                disponibles.discard(clave)
+            cantidad = linea.valor / servicio.valor_unitario if servicio.valor_unitario > 0 else 0
+            matches.append(MatchResult(
+                linea_nc=linea.id,
+                tipo_servicio=servicio.tipo,
+                codigo_rips=servicio.codigo,
+                valor_nc=linea.valor,
+                valor_unitario_rips=servicio.valor_unitario,
+                cantidad_calculada=round(cantidad, 2),
+                confianza=Confianza(confianza)
+            ))
 
-RESPONDE SOLO JSON válido sin markdown ni explicaciones adicionales.'''
+        return matches, unmatched
 
-        user_prompt = self._build_prompt(lineas_nc, servicios_rips)
-
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=2000
-            )
+    def _remember_matches(
+        self,
+        lineas_nc: List[LineaNC],
+        matches: List[MatchResult]
+    ) -> None:
+        """Guarda en la caché los matches que devolvió el LLM."""
+        lineas = {linea.id: linea for linea in lineas_nc}
+        for m in matches:
+            linea = lineas.get(m.linea_nc)
+            if linea:
+                self.cache.put(linea.descripcion, m.tipo_servicio, m.codigo_rips, m.confianza.value)
 
-            content = response.choices[0].message.content
-            # Limpiar posible markdown
-            content = re.sub(r'```json\s*', '', content)
-            content = re.sub(r'```\s*', '', content)
+    async def _match_with_llm(
+        self,
+        lineas_nc: List[LineaNC],
+        servicios_rips: List[ServicioRIPS],
+        local: Optional[LocalMatcher] = None,
+        usados: Optional[Counter] = None
+    ) -> List[MatchResult]:
+        """
+        Usa LLM para hacer matching de líneas restantes.
+
+        ``usados`` cuenta los servicios que ya tomaron las etapas anteriores: no se
+        ofrecen al LLM ni al fallback. ``local`` es el índice ya armado del RIPS.
+        """
+        capacidad = Counter((s.tipo, s.codigo) for s in servicios_rips)
+        usados = Counter(usados or ())
+        disponibles = [s for s in servicios_rips if usados[(s.tipo, s.codigo)] < capacidad[(s.tipo, s.codigo)]]
+        if not disponibles:
+            for linea in lineas_nc:
+                logger.warning(f"[LLMMatcher] Línea {linea.id} sin servicio libre para el LLM")
+            return []
+        if local is not None:
+            local.usados = usados
+
+        semaforo = asyncio.Semaphore(max(1, settings.llm_concurrency))
+        matches, del_llm = await self._request_all(lineas_nc, disponibles, disponibles, semaforo, local)
+
+        # Un mismo servicio no puede quedar asignado a dos líneas de solicitudes distintas
+        matches, perdedoras, usados = self._resolve_conflicts(matches, lineas_nc, capacidad, usados)
+        if perdedoras:
+            disponibles = [s for s in servicios_rips if usados[(s.tipo, s.codigo)] < capacidad[(s.tipo, s.codigo)]]
+            if local is not None:
+                local.usados = usados
+            extra, extra_del_llm = await self._request_all(perdedoras, disponibles, disponibles, semaforo, local)
+            extra, sin_servicio, _ = self._resolve_conflicts(extra, perdedoras, capacidad, usados)
+            for linea in sin_servicio:
+                logger.warning(f"[LLMMatcher] Línea {linea.id} sin servicio libre tras resolver conflictos")
+            matches.extend(extra)
+            del_llm.update(extra_del_llm)
+
+        # Solo se guardan respuestas del LLM, no las del fallback por similitud
+        self._remember_matches(lineas_nc, [m for m in matches if m.linea_nc in del_llm])
+
+        orden = {linea.id: i for i, linea in enumerate(lineas_nc)}
+        matches.sort(key=lambda m: orden.get(m.linea_nc, len(orden)))
+        return matches
 
-            data = json.loads(content)
-            matches = []
+    async def _request_all(
+        self,
+        lineas_nc: List[LineaNC],
+        candidatos: List[ServicioRIPS],
+        servicios_rips: List[ServicioRIPS],
+        semaforo: asyncio.Semaphore,
+        local: Optional[LocalMatcher] = None
+    ) -> Tuple[List[MatchResult], set]:
+        """Envía las solicitudes planeadas en paralelo; retorna los matches y los ids resueltos por el LLM."""
+        resultados = await asyncio.gather(*(
+            self._request_matches(lineas_solicitud, candidatos_solicitud, servicios_rips, semaforo)
+            for lineas_solicitud, candidatos_solicitud in self._plan_requests(lineas_nc, candidatos, local)
+        ))
+        matches = []
+        del_llm = set()
+        for matches_solicitud, ids_llm in resultados:
+            matches.extend(matches_solicitud)
+            del_llm.update(ids_llm)
+        return matches, del_llm
+
+    @staticmethod
+    def _resolve_conflicts(
+        matches: List[MatchResult],
+        lineas_nc: List[LineaNC],
+        capacidad: Counter,
+        usados: Counter
+    ) -> Tuple[List[MatchResult], List[LineaNC], Counter]:
+        """
+        Asigna cada servicio a lo sumo tantas veces como aparece en el RIPS.
+
+        Ante un conflicto gana el match de mayor confianza (y, a igual confianza, el de
+        la solicitud anterior). Retorna los matches aceptados, las líneas que perdieron
+        su servicio y el conteo de usos actualizado. Los códigos que no están en el RIPS
+        no compiten por nada y se conservan.
+        """
+        usados = Counter(usados)
+        aceptados = []
+        perdedoras_ids = set()
+        for m in sorted(matches, key=lambda m: _PRIORIDAD_CONFIANZA[m.confianza]):
+            clave = (m.tipo_servicio, m.codigo_rips)
+            if clave in capacidad:
+                if usados[clave] >= capacidad[clave]:
+                    perdedoras_ids.add(m.linea_nc)
+                    continue
+                usados[clave] += 1
+            aceptados.append(m)
+        perdedoras = [linea for linea in lineas_nc if linea.id in perdedoras_ids]
+        return aceptados, perdedoras, usados
 
-            for match_data in data.get('matches', []):
-                matches.append(MatchResult(
-                    linea_nc=match_data['linea_nc'],
-                    tipo_servicio=match_data['tipo_servicio'],
-                    codigo_rips=match_data['codigo_rips'],
-                    valor_nc=match_data['valor_nc'],
-                    valor_unitario_rips=match_data['valor_unitario_rips'],
-                    cantidad_calculada=match_data['cantidad_calculada'],
-                    confianza=Confianza(match_data.get('confianza', 'media'))
-                ))
+    def _plan_requests(
+        self,
+        lineas_nc: List[LineaNC],
+        servicios_rips: List[ServicioRIPS],
+        local: Optional[LocalMatcher] = None
+    ) -> List[Tuple[List[LineaNC], List[ServicioRIPS]]]:
+        """
+        Divide las líneas en solicitudes al LLM, cada una con sus servicios candidatos.
+
+        Si todos los servicios caben en el presupuesto de tokens se envían completos; si
+        no, cada línea lleva solo sus ``llm_candidates_per_line`` mejores candidatos. Si se
+        pasa ``local`` (índice del RIPS completo cuyos ``usados`` excluyen lo que no está en
+        ``servicios_rips``) los candidatos salen de él; si no, se indexan aquí. Las líneas
+        se agrupan mientras el prompt quepa en ``llm_prompt_token_budget`` y no pasen de
+        ``llm_max_lines_per_request`` (la respuesta también tiene límite de tokens).
+        """
+        presupuesto = settings.llm_prompt_token_budget
+        max_lineas = max(1, settings.llm_max_lines_per_request)
+        base = estimate_tokens(SYSTEM_PROMPT + self._build_prompt([], []))
+        costo_lineas = [estimate_tokens(self._linea_text(linea)) for linea in lineas_nc]
+
+        # RIPS completo si cabe junto a las líneas; si no, candidatos por línea
+        costo_servicio: Dict[int, int] = {}
+        indice = None
+        total = base + max(costo_lineas, default=0)
+        for i, servicio in enumerate(servicios_rips):
+            costo_servicio[i] = estimate_tokens(self._servicio_text(servicio))
+            total += costo_servicio[i]
+            if total > presupuesto:
+                indice = local if local is not None else LocalMatcher(servicios_rips, catalogo=get_code_catalog())
+                break
+        local = indice
+        if local is not None and local.servicios_rips is not servicios_rips:
+            # Los índices de candidatos son posiciones en la lista del índice
+            servicios_rips = local.servicios_rips
+            costo_servicio = {}
+        todos = list(range(len(servicios_rips))) if local is None else None
+        k = max(1, settings.llm_candidates_per_line)
+
+        solicitudes = []
+        lineas_actual: List[LineaNC] = []
+        candidatos_actual: Dict[int, None] = {}
+        tokens_actual = base
+
+        for linea, costo_linea in zip(lineas_nc, costo_lineas):
+            candidatos = todos if local is None else local.top_candidates(linea, k)
+            for i in candidatos:
+                if i not in costo_servicio:
+                    costo_servicio[i] = estimate_tokens(self._servicio_text(servicios_rips[i]))
+            costo = costo_linea + sum(costo_servicio[i] for i in candidatos if i not in candidatos_actual)
+
+            if lineas_actual and (tokens_actual + costo > presupuesto or len(lineas_actual) >= max_lineas):
+                solicitudes.append((lineas_actual, [servicios_rips[i] for i in candidatos_actual]))
+                lineas_actual, candidatos_actual, tokens_actual = [], {}, base
+                costo = costo_linea + sum(costo_servicio[i] for i in candidatos)
+
+            lineas_actual.append(linea)
+            for i in candidatos:
+                candidatos_actual.setdefault(i)
+            tokens_actual += costo
+
+        if lineas_actual:
+            solicitudes.append((lineas_actual, [servicios_rips[i] for i in candidatos_actual]))
+        return solicitudes
+
+    async def _request_matches(
+        self,
+        lineas_nc: List[LineaNC],
+        candidatos: List[ServicioRIPS],
+        servicios_rips: List[ServicioRIPS],
+        semaforo: asyncio.Semaphore
+    ) -> Tuple[List[MatchResult], set]:
+        """
+        Una solicitud al LLM con las líneas y sus candidatos.
+
+        Si la respuesta se corta por ``max_tokens`` la solicitud se divide en dos; ante
+        otros errores se reintenta solo esta solicitud (``llm_chunk_retries``) y, si sigue
+        fallando, sus líneas pasan al fallback por similitud. Retorna los matches y los
+        ids de las líneas que resolvió el LLM.
+        """
+        intentos = max(0, settings.llm_chunk_retries) + 1
+        for intento in range(intentos):
+            try:
+                async with semaforo:
+                    matches = await self._call_llm(lineas_nc, candidatos)
+                matching_stats.record('llm', len(matches))
+                return matches, {m.linea_nc for m in matches}
+            except _RespuestaTruncada:
+                if len(lineas_nc) > 1:
+                    mitad = len(lineas_nc) // 2
+                    partes = await asyncio.gather(
+                        self._request_all(lineas_nc[:mitad], candidatos, servicios_rips, semaforo),
+                        self._request_all(lineas_nc[mitad:], candidatos, servicios_rips, semaforo)
+                    )
+                    return partes[0][0] + partes[1][0], partes[0][1] | partes[1][1]
+                logger.warning(f"[LLMMatcher] Respuesta truncada para la línea {lineas_nc[0].id} (intento {intento + 1}/{intentos})")
+            except Exception as e:
+                logger.warning(
+                    f"[LLMMatcher] Falló la solicitud de {len(lineas_nc)} líneas "
+                    f"(intento {intento + 1}/{intentos}): {e}"
+                )
+            matching_stats.record_failure()
+            if intento + 1 < intentos:
+                await asyncio.sleep(settings.llm_retry_delay * (intento + 1))
+
+        # Fallback: crear matches con baja confianza
+        matches = self._fallback_matches(lineas_nc, servicios_rips)
+        matching_stats.record('fallback', len(matches))
+        return matches, set()
+
+    async def _call_llm(
+        self,
+        lineas_nc: List[LineaNC],
+        candidatos: List[ServicioRIPS]
+    ) -> List[MatchResult]:
+        """Llama al LLM y parsea los matches de las líneas enviadas."""
+        user_prompt = self._build_prompt(lineas_nc, candidatos)
+
+        response = await create_chat_completion(
+            self.client,
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,
+            max_tokens=2000
+        )
 
-            return matches
+        choice = response.choices[0]
+        if choice.finish_reason == 'length':
+            raise _RespuestaTruncada()
 
-        except Exception as e:
-            # Fallback: crear matches con baja confianza
-            return self._fallback_matches(lineas_nc, servicios_rips)
+        content = choice.message.content
+        # Limpiar posible markdown
+        content = re.sub(r'```json\s*', '', content)
+        content = re.sub(r'```\s*', '', content)
+
+        data = json.loads(content)
+        ids = {linea.id for linea in lineas_nc}
+        matches = []
+
+        for match_data in data.get('matches', []):
+            match = MatchResult(
+                linea_nc=match_data['linea_nc'],
+                tipo_servicio=match_data['tipo_servicio'],
+                codigo_rips=match_data['codigo_rips'],
+                valor_nc=match_data['valor_nc'],
+                valor_unitario_rips=match_data['valor_unitario_rips'],
+                cantidad_calculada=match_data['cantidad_calculada'],
+                confianza=Confianza(match_data.get('confianza', 'media'))
+            )
+            # Se ignoran líneas que no eran parte de esta solicitud
+            if match.linea_nc in ids:
+                matches.append(match)
+
+        return matches
 
     def _build_prompt(
         self,
@@ -147,19 +621,8 @@ RESPONDE SOLO JSON válido sin markdown ni explicaciones adicionales.'''
         servicios_rips: List[ServicioRIPS]
     ) -> str:
         """Construye el prompt para el LLM."""
-        lines_text = []
-        for linea in lineas_nc:
-            lines_text.append(f"Línea {linea.id}:")
-            lines_text.append(f"  - Descripción: {linea.descripcion}")
-            lines_text.append(f"  - Cantidad en NC: {linea.cantidad}")
-            lines_text.append(f"  - Valor: ${linea.valor}")
-
-        services_text = []
-        for servicio in servicios_rips:
-            services_text.append(f"- Tipo: {servicio.tipo}")
-            services_text.append(f"  Código: {servicio.codigo}")
-            services_text.append(f"  Nombre: {servicio.nombre}")
-            services_text.append(f"  Valor unitario: ${servicio.valor_unitario}")
+        lines_text = [self._linea_text(linea) for linea in lineas_nc]
+        services_text = [self._servicio_text(servicio) for servicio in servicios_rips]
 
         return f'''LÍNEAS DE LA NOTA CRÉDITO:
 {chr(10).join(lines_text)}
@@ -183,6 +646,24 @@ Realiza el matching y responde en formato JSON:
   "warnings": []
 }}'''
 
+    @staticmethod
+    def _linea_text(linea: LineaNC) -> str:
+        return (
+            f"Línea {linea.id}:\n"
+            f"  - Descripción: {linea.descripcion}\n"
+            f"  - Cantidad en NC: {linea.cantidad}\n"
+            f"  - Valor: ${linea.valor}"
+        )
+
+    @staticmethod
+    def _servicio_text(servicio: ServicioRIPS) -> str:
+        return (
+            f"- Tipo: {servicio.tipo}\n"
+            f"  Código: {servicio.codigo}\n"
+            f"  Nombre: {servicio.nombre}\n"
+            f"  Valor unitario: ${servicio.valor_unitario}"
+        )
+
     def _fallback_matches(
         self,
         lineas_nc: List[LineaNC],
@@ -191,18 +672,20 @@ Realiza el matching y responde en formato JSON:
         """Matching fallback por similitud de texto simple."""
         matches = []
         used = set()
+        # Palabras de cada servicio, calculadas una sola vez
+        service_words_list = [set(servicio.nombre.lower().split()) for servicio in servicios_rips]
 
         for linea in lineas_nc:
             best_match = None
             best_score = 0
+            line_words = set(linea.descripcion.lower().split())
 
             for i, servicio in enumerate(servicios_rips):
                 if i in used:
                     continue
 
                 # Similitud simple: palabras en común
-                line_words = set(linea.descripcion.lower().split())
-                service_words = set(servicio.nombre.lower().split())
+                service_words = service_words_list[i]
                 common = line_words & service_words
                 score = len(common) / max(len(line_words), len(service_words))
 
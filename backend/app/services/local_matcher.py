@@ -0,0 +1,235 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.models import LineaNC, ServicioRIPS, MatchResult, Confianza
+from app.processors.code_catalog import CodeCatalog
+from app.processors.money import to_cents
+from app.services.match_cache import normalize_descripcion
+
+# Tamaño de los n-gramas de caracteres
+NGRAM = 3
+
+# Peso de la cercanía de valores en el puntaje (el resto es similitud de texto)
+PESO_VALOR = 0.2
+
+# Puntaje desde el que el match local se reporta con confianza alta
+PUNTAJE_ALTA = 0.9
+
+# N-gramas presentes en más servicios que esto no generan candidatos (solo puntúan)
+MAX_POSTINGS = 64
+
+# Fragmentos de la descripción que pueden ser un código del RIPS
+_FRAGMENTO_CODIGO_RE = re.compile(r'[A-Za-z0-9][A-Za-z0-9-]*')
+
+
+def _ngrams(texto: str) -> Counter:
+    """N-gramas de caracteres de un texto ya normalizado (con un espacio en cada borde)."""
+    if not texto:
+        return Counter()
+    texto = f" {texto} "
+    return Counter(texto[i:i + NGRAM] for i in range(len(texto) - NGRAM + 1))
+
+
+def valor_score(valor_nc: float, valor_unitario: float) -> float:
+    """
+    Cercanía (0-1) del valor de la línea al múltiplo más cercano del valor unitario.
+
+    1.0 solo si es un múltiplo exacto al centavo; baja con la distancia relativa al
+    múltiplo más cercano (al menos 1 unidad) y llega a 0 a media unidad de distancia.
+    """
+    unitario = to_cents(valor_unitario)
+    valor = to_cents(valor_nc)
+    if unitario <= 0 or valor <= 0:
+        return 0.0
+    multiplo = max(1, (valor + unitario // 2) // unitario) * unitario
+    return max(0.0, 1 - 2 * abs(valor - multiplo) / unitario)
+
+
+class LocalMatcher:
+    """
+    Matching local de líneas NC contra los nombres de los servicios del RIPS.
+
+    Indexa una vez los nombres (n-gramas de caracteres con pesos TF-IDF en un índice
+    invertido) y puntúa cada línea combinando la similitud coseno de la descripción con
+    la cercanía de valores (``PESO_VALOR``). Solo acepta una línea si el mejor candidato
+    supera ``min_score`` y le saca ``margin`` al segundo; las demás quedan para el LLM.
+    Los servicios repetidos (mismo tipo y código) se indexan una sola vez; cada uno se
+    puede asignar tantas veces como aparece en el RIPS. ``usados`` cuenta las veces que
+    otras etapas (match por código, caché) ya tomaron cada (tipo, codigo): esos servicios
+    no son candidatos, y ``match`` suma ahí los que toma.
+
+    Con ``catalogo``, si la línea trae un código CUPS/CUM conocido (que no está en el
+    RIPS, o ya habría hecho match por código) su nombre oficial se suma a la descripción:
+    las descripciones de la NC suelen ser abreviadas y el RIPS usa el nombre del catálogo.
+    """
+
+    def __init__(
+        self,
+        servicios_rips: Sequence[ServicioRIPS],
+        min_score: Optional[float] = None,
+        margin: Optional[float] = None,
+        catalogo: Optional[CodeCatalog] = None,
+        usados: Optional[Counter] = None
+    ):
+        self.servicios_rips = servicios_rips
+        self.catalogo = catalogo
+        self.usados = usados if usados is not None else Counter()
+        self.capacidad: Counter = Counter()
+        self.min_score = settings.local_match_min_score if min_score is None else min_score
+        self.margin = settings.local_match_margin if margin is None else margin
+
+        # Posición en servicios_rips de cada documento indexado
+        self._docs: List[int] = []
+        # Primera posición de cada (tipo, codigo), con o sin nombre
+        self._unicos: List[int] = []
+        self._claves: Dict[int, Tuple[str, str]] = {}
+        self._por_codigo: Optional[Dict[str, List[int]]] = None
+        self._por_valor: Optional[Dict[int, List[int]]] = None
+        doc_ngrams: List[Counter] = []
+        vistos = set()
+        for i, servicio in enumerate(servicios_rips):
+            clave = (servicio.tipo, servicio.codigo)
+            self.capacidad[clave] += 1
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            self._unicos.append(i)
+            self._claves[i] = clave
+            ngrams = _ngrams(normalize_descripcion(servicio.nombre))
+            if ngrams:
+                self._docs.append(i)
+                doc_ngrams.append(ngrams)
+
+        n = len(doc_ngrams)
+        df: Counter = Counter()
+        for ngrams in doc_ngrams:
+            df.update(ngrams.keys())
+        self._idf: Dict[str, float] = {g: math.log((1 + n) / (1 + c)) + 1 for g, c in df.items()}
+        # N-gramas que ningún nombre tiene: peso máximo (solo cuentan en la norma de la consulta)
+        self._idf_desconocido = math.log(1 + n) + 1
+
+        # Pesos normalizados de cada documento e índice invertido n-grama -> documentos
+        self._pesos: List[Dict[str, float]] = []
+        self._postings: Dict[str, List[int]] = {}
+        for d, ngrams in enumerate(doc_ngrams):
+            pesos = {g: tf * self._idf[g] for g, tf in ngrams.items()}
+            norma = math.sqrt(sum(w * w for w in pesos.values()))
+            self._pesos.append({g: w / norma for g, w in pesos.items()})
+            for g in pesos:
+                self._postings.setdefault(g, []).append(d)
+
+    def disponible(self, i: int) -> bool:
+        """True si el servicio en la posición ``i`` (primera de su código) aún se puede asignar."""
+        clave = self._claves[i]
+        return self.usados[clave] < self.capacidad[clave]
+
+    def _texto_linea(self, linea: LineaNC) -> str:
+        """Descripción de la línea más el nombre de catálogo de su código, si se conoce."""
+        if self.catalogo is not None and linea.codigo_extraido:
+            entrada = self.catalogo.get(linea.codigo_extraido)
+            if entrada is not None and entrada.nombre:
+                return f"{linea.descripcion} {entrada.nombre}"
+        return linea.descripcion
+
+    def candidates(self, linea: LineaNC) -> List[Tuple[float, int]]:
+        """
+        (puntaje, posición en servicios_rips) de los candidatos, de mayor a menor.
+
+        Son candidatos los servicios disponibles que comparten con la línea algún
+        n-grama poco frecuente (hasta MAX_POSTINGS servicios); la similitud se calcula
+        con todos.
+        """
+        ngrams = _ngrams(normalize_descripcion(self._texto_linea(linea)))
+        if not ngrams:
+            return []
+        consulta = {g: tf * self._idf.get(g, self._idf_desconocido) for g, tf in ngrams.items()}
+        norma = math.sqrt(sum(w * w for w in consulta.values()))
+
+        # Candidatos por los n-gramas poco frecuentes; si no hay, por todos
+        listas = [self._postings[g] for g in consulta if g in self._postings]
+        candidatos = set()
+        for docs in listas:
+            if len(docs) <= MAX_POSTINGS:
+                candidatos.update(docs)
+        if not candidatos:
+            for docs in listas:
+                candidatos.update(docs)
+
+        puntajes = []
+        for d in candidatos:
+            i = self._docs[d]
+            if not self.disponible(i):
+                continue
+            pesos = self._pesos[d]
+            sim = sum(w * pesos[g] for g, w in consulta.items() if g in pesos)
+            servicio = self.servicios_rips[i]
+            puntaje = (1 - PESO_VALOR) * sim / norma + PESO_VALOR * valor_score(linea.valor, servicio.valor_unitario)
+            puntajes.append((puntaje, i))
+        puntajes.sort(key=lambda p: (-p[0], p[1]))
+        return puntajes
+
+    def top_candidates(self, linea: LineaNC, k: int) -> List[int]:
+        """
+        Hasta ``k`` posiciones de servicios candidatos para enviar al LLM.
+
+        Primero los servicios cuyo código aparece como fragmento de la descripción, luego
+        los de mejor puntaje (nombre y valor) y por último los de valor unitario igual al
+        valor de la línea.
+        """
+        if self._por_codigo is None:
+            self._por_codigo = {}
+            self._por_valor = {}
+            for i in self._unicos:
+                servicio = self.servicios_rips[i]
+                self._por_codigo.setdefault(servicio.codigo, []).append(i)
+                self._por_valor.setdefault(to_cents(servicio.valor_unitario), []).append(i)
+
+        elegidos: Dict[int, None] = {}
+        for fragmento in _FRAGMENTO_CODIGO_RE.findall(linea.descripcion):
+            for i in self._por_codigo.get(fragmento, ()):
+                if self.disponible(i):
+                    elegidos.setdefault(i)
+        for _, i in self.candidates(linea):
+            if len(elegidos) >= k:
+                break
+            elegidos.setdefault(i)
+        for i in self._por_valor.get(to_cents(linea.valor), ()):
+            if len(elegidos) >= k:
+                break
+            if self.disponible(i):
+                elegidos.setdefault(i)
+        return list(elegidos)[:k]
+
+    def match(self, lineas_nc: List[LineaNC]) -> Tuple[List[MatchResult], List[LineaNC]]:
+        """Matches aceptados localmente y líneas ambiguas (para el LLM); suma en ``usados`` lo asignado."""
+        matches = []
+        ambiguas = []
+
+        for linea in lineas_nc:
+            puntajes = self.candidates(linea)
+            if not puntajes:
+                ambiguas.append(linea)
+                continue
+            mejor, i = puntajes[0]
+            segundo = puntajes[1][0] if len(puntajes) > 1 else 0.0
+            if mejor < self.min_score or mejor - segundo < self.margin:
+                ambiguas.append(linea)
+                continue
+
+            self.usados[self._claves[i]] += 1
+            servicio = self.servicios_rips[i]
+            cantidad = linea.valor / servicio.valor_unitario if servicio.valor_unitario > 0 else 0
+            matches.append(MatchResult(
+                linea_nc=linea.id,
+                tipo_servicio=servicio.tipo,
+                codigo_rips=servicio.codigo,
+                valor_nc=linea.valor,
+                valor_unitario_rips=servicio.valor_unitario,
+                cantidad_calculada=round(cantidad, 2),
+                confianza=Confianza.ALTA if mejor >= PUNTAJE_ALTA else Confianza.MEDIA
+            ))
+
+        return matches, ambiguas
@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Container, Dict, Optional, Tuple, Union
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_NO_ALFANUMERICO_RE = re.compile(r'[^0-9a-z]+')
+
+# Match guardado: (tipo_servicio, codigo_rips, confianza)
+CachedMatch = Tuple[str, str, str]
+
+
+def normalize_descripcion(descripcion: str) -> str:
+    """Descripción sin tildes, en minúsculas y con un solo espacio entre palabras."""
+    texto = unicodedata.normalize('NFKD', descripcion or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return _NO_ALFANUMERICO_RE.sub(' ', texto).strip()
+
+
+class MatchCache:
+    """
+    Caché persistente (SQLite) de matches resueltos por el LLM.
+
+    Cada entrada es un match (``tipo_servicio``/``codigo_rips``/``confianza``) de una
+    descripción normalizada de línea NC; una descripción puede tener varios, uno por
+    servicio con el que se resolvió. ``get`` retorna el usado más recientemente entre
+    los servicios del RIPS actual, así que un match se reutiliza en otras NC y facturas
+    que facturen el mismo servicio.
+
+    Las entradas vencen a los ``ttl_seconds`` y, al pasar de ``max_entries``, se
+    descartan las usadas hace más tiempo (LRU); la poda corre cada ``EVICT_EVERY``
+    escrituras como máximo, no en cada una. Cuando alguien corrige un match se invalidan
+    las entradas de esa descripción con ``invalidate()``.
+    """
+
+    # Escrituras entre podas (con cachés pequeñas se poda más seguido, ver _evict_interval)
+    EVICT_EVERY = 256
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_entries: int = 50000,
+        ttl_seconds: float = 30 * 24 * 3600
+    ):
+        self.path = str(path) if path else ':memory:'
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+        self._puts_since_evict = 0
+
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL' if self.path != ':memory:' else 'PRAGMA journal_mode=MEMORY')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS match_cache (
+                clave TEXT PRIMARY KEY,
+                descripcion TEXT NOT NULL,
+                tipo_servicio TEXT NOT NULL,
+                codigo_rips TEXT NOT NULL,
+                confianza TEXT NOT NULL,
+                creado REAL NOT NULL,
+                usado REAL NOT NULL
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS match_cache_descripcion ON match_cache (descripcion)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS match_cache_usado ON match_cache (usado)')
+
+    @staticmethod
+    def _clave(descripcion: str, tipo_servicio: str, codigo_rips: str) -> str:
+        return hashlib.sha256(f"{descripcion}\x1f{tipo_servicio}\x1f{codigo_rips}".encode('utf-8')).hexdigest()
+
+    def get(
+        self,
+        descripcion: str,
+        disponibles: Optional[Container[Tuple[str, str]]] = None
+    ) -> Optional[CachedMatch]:
+        """
+        Match guardado para la descripción, o None.
+
+        Con ``disponibles`` (pares (tipo, codigo) del RIPS actual) solo cuentan los
+        matches a esos servicios.
+        """
+        if self.max_entries == 0:
+            return None
+        normalizada = normalize_descripcion(descripcion)
+        ahora = time.time()
+        with self._lock:
+            encontrado = None
+            try:
+                filas = self._conn.execute(
+                    'SELECT clave, tipo_servicio, codigo_rips, confianza, creado FROM match_cache '
+                    'WHERE descripcion = ? ORDER BY usado DESC',
+                    (normalizada,)
+                ).fetchall()
+                for clave, tipo_servicio, codigo_rips, confianza, creado in filas:
+                    if ahora - creado > self.ttl_seconds:
+                        self._conn.execute('DELETE FROM match_cache WHERE clave = ?', (clave,))
+                        self.expired += 1
+                    elif encontrado is None and (disponibles is None or (tipo_servicio, codigo_rips) in disponibles):
+                        encontrado = (tipo_servicio, codigo_rips, confianza)
+                        self._conn.execute('UPDATE match_cache SET usado = ? WHERE clave = ?', (ahora, clave))
+            except sqlite3.Error as e:
+                logger.warning(f"[MatchCache] No se pudo leer la caché: {e}")
+                encontrado = None
+            if encontrado is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return encontrado
+
+    def put(self, descripcion: str, tipo_servicio: str, codigo_rips: str, confianza: str) -> None:
+        """Guarda (o reemplaza) el match de una descripción a un servicio."""
+        if self.max_entries == 0:
+            return
+        normalizada = normalize_descripcion(descripcion)
+        ahora = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO match_cache VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (self._clave(normalizada, tipo_servicio, codigo_rips), normalizada, tipo_servicio,
+                     codigo_rips, confianza, ahora, ahora)
+                )
+                self.stores += 1
+                self._puts_since_evict += 1
+                if self._puts_since_evict >= self._evict_interval():
+                    self._evict()
+            except sqlite3.Error as e:
+                # Un fallo de la caché no debe afectar el matching
+                logger.warning(f"[MatchCache] No se pudo guardar el match: {e}")
+
+    def _evict_interval(self) -> int:
+        """Escrituras entre podas: hasta EVICT_EVERY, sin pasar del 1% de ``max_entries``."""
+        return max(1, min(self.EVICT_EVERY, self.max_entries // 100))
+
+    def _evict(self) -> None:
+        """Descarta vencidas y las menos usadas sobre el límite (llamar con el lock tomado)."""
+        self._puts_since_evict = 0
+        vencidas = self._conn.execute(
+            'DELETE FROM match_cache WHERE creado < ?', (time.time() - self.ttl_seconds,)
+        ).rowcount
+        self.expired += max(0, vencidas)
+        sobrantes = self._count() - self.max_entries
+        if sobrantes > 0:
+            self._conn.execute(
+                'DELETE FROM match_cache WHERE clave IN '
+                '(SELECT clave FROM match_cache ORDER BY usado LIMIT ?)',
+                (sobrantes,)
+            )
+            self.evictions += sobrantes
+
+    def _count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM match_cache').fetchone()[0]
+
+    def invalidate(self, descripcion: str) -> int:
+        """Elimina las entradas de una descripción (p.ej. tras corregir el match). Retorna cuántas."""
+        with self._lock:
+            eliminadas = self._conn.execute(
+                'DELETE FROM match_cache WHERE descripcion = ?', (normalize_descripcion(descripcion),)
+            ).rowcount
+            self.invalidations += eliminadas
+            return eliminadas
+
+    def clear(self) -> None:
+        """Vacía la caché (también en disco) y reinicia los contadores."""
+        with self._lock:
+            self._conn.execute('DELETE FROM match_cache')
+            self.hits = self.misses = self.stores = self.evictions = self.expired = self.invalidations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores para medir cuántas llamadas al LLM se evitan."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': self._count(),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'persistente': self.path != ':memory:',
+            }
+
+
+match_cache = MatchCache(
+    path=settings.match_cache_path or None,
+    max_entries=settings.match_cache_size,
+    ttl_seconds=settings.match_cache_ttl_hours * 3600
+)
@@ -1,25 +1,126 @@
-import requests
-import json
-from typing import Dict, Any
-import urllib3
+import asyncio
+import base64
+import httpx
+from typing import Dict, Any, AsyncIterator, Callable, Optional, Set, Union
 import logging
 
 from app.models import LoginCredentials, NCPayload, NCValidationResponse, ValidationError, CapitaPeriodoPayload, CapitaPeriodoResponse, NCTotalPayload, FevRipsPayload, FevRipsResponse
 from app.config import settings
+from app.processors import json_codec
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Deshabilitar warnings de SSL verification (para certificados self-signed)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Cliente HTTP compartido (pool de conexiones keep-alive) para todas las llamadas al ministerio
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+# Cierres pendientes de clientes reemplazados (referencia para que no se recolecten)
+_closing_tasks: Set[asyncio.Task] = set()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna el cliente HTTP asíncrono compartido para el API del ministerio.
+
+    El cliente se crea de forma perezosa y se reutiliza entre requests, de modo que
+    las conexiones TLS quedan en el pool (keep-alive) y las llamadas concurrentes
+    no bloquean el event loop. Si el event loop cambió (p.ej. en tests), se crea uno nuevo.
+    """
+    global _http_client, _http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        if _http_client is not None and not _http_client.is_closed:
+            _discard_client(_http_client)
+        _http_client = httpx.AsyncClient(
+            verify=False,  # Certificado self-signed del ministerio
+            follow_redirects=True,  # Igual que requests, que seguía las redirecciones
+            timeout=settings.ministerio_api_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.ministerio_pool_size,
+                max_keepalive_connections=settings.ministerio_pool_size,
+                keepalive_expiry=settings.ministerio_keepalive_expiry
+            )
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+def _discard_client(client: httpx.AsyncClient) -> None:
+    """Cierra en segundo plano un cliente reemplazado para liberar sus conexiones."""
+    async def _close() -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Conexiones ligadas a un event loop ya cerrado
+            logger.debug(f"[MinisterioService] Error cerrando cliente HTTP anterior: {e}")
+
+    task = asyncio.get_running_loop().create_task(_close())
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+async def close_http_client() -> None:
+    """Cierra el cliente HTTP compartido (se llama al apagar la aplicación)."""
+    global _http_client, _http_client_loop
+
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
+
+# Bytes del XML codificados por bloque (múltiplo de 3: el base64 de cada bloque no lleva relleno)
+_BASE64_CHUNK = 3 * 16 * 1024
+
+
+class StreamedNCBody:
+    """
+    Cuerpo JSON de CargarNC ({"rips": ..., "xmlFevFile": "<base64>"}) armado por partes.
+
+    El XML (bytes) se codifica a base64 por bloques mientras se envía, así que no se
+    crean copias completas del base64 ni del cuerpo JSON; el resultado es idéntico a
+    ``json_codec.dumps`` del payload con el XML ya codificado. El RIPS puede llegar ya
+    serializado (bytes de ``json_codec.dumps``) para no codificarlo otra vez. Se puede
+    iterar varias veces (reintentos por timeout).
+    """
+
+    def __init__(self, rips: Union[Dict[str, Any], bytes], xml: bytes):
+        rips_json = rips if isinstance(rips, bytes) else json_codec.dumps(rips)
+        self._prefijo = b'{"rips":' + rips_json + b',"xmlFevFile":"'
+        self._sufijo = b'"}'
+        self._xml = xml
+        self.content_length = len(self._prefijo) + 4 * ((len(xml) + 2) // 3) + len(self._sufijo)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self._prefijo
+        xml = memoryview(self._xml)
+        for inicio in range(0, len(xml), _BASE64_CHUNK):
+            yield base64.b64encode(xml[inicio:inicio + _BASE64_CHUNK])
+        yield self._sufijo
+
+
+def _leer_json(response: httpx.Response) -> Dict[str, Any]:
+    """Lee el cuerpo JSON; si no es JSON válido, propaga el error HTTP si lo hay."""
+    try:
+        return json_codec.loads(response.content)
+    except ValueError:
+        response.raise_for_status()
+        raise
 
 
 class MinisterioService:
     """Servicio para comunicación con el API del Ministerio de Salud."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.base_url = settings.ministerio_api_url
         self.timeout = settings.ministerio_api_timeout
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente HTTP a usar: el inyectado o el compartido de la aplicación."""
+        return self._client if self._client is not None else get_http_client()
 
     async def login(self, credentials: LoginCredentials) -> str:
         """
@@ -32,9 +133,9 @@ class MinisterioService:
             Token JWT string
 
         Raises:
-            requests.exceptions.HTTPError: Si hay error HTTP (401, etc.)
-            requests.exceptions.Timeout: Si hay timeout
-            requests.exceptions.RequestException: Para otros errores de conexión
+            httpx.HTTPStatusError: Si hay error HTTP (401, etc.)
+            httpx.TimeoutException: Si hay timeout
+            httpx.RequestError: Para otros errores de conexión
         """
         url = f"{self.base_url}/auth/LoginSISPRO"
 
@@ -50,11 +151,10 @@ class MinisterioService:
             "nit": credentials.nit
         }
 
-        response = requests.post(
+        response = await self.client.post(
             url,
             json=payload,
-            timeout=60,  # Login al ministerio puede tardar
-            verify=False  # Certificado self-signed del ministerio
+            timeout=self.timeout  # Login al ministerio puede tardar
         )
         response.raise_for_status()
 
@@ -65,71 +165,130 @@ class MinisterioService:
 
         return token
 
-    async def enviar_nc(self, payload: NCPayload, token: str) -> NCValidationResponse:
+    async def _post_validacion(
+        self,
+        url: str,
+        json_payload: Union[Dict[str, Any], StreamedNCBody],
+        token: str,
+        parser: Callable[[Dict[str, Any]], Any],
+        descripcion: str,
+        acepta_400_con_resultados: bool = True
+    ) -> Any:
         """
-        Envía la NC al ministerio para validación.
+        Envía un paquete al ministerio con reintentos por timeout.
+
+        El ministerio puede devolver 400 con ResultadosValidacion (validación fallida);
+        en ese caso se parsea la respuesta en lugar de hacer raise.
 
         Args:
-            payload: Payload con rips y xmlFevFile en base64
+            url: Endpoint del ministerio
+            json_payload: Cuerpo JSON a enviar (dict, serializado con json_codec, o StreamedNCBody)
             token: Token JWT de autorización
+            parser: Función que convierte la respuesta JSON al modelo de respuesta
+            descripcion: Nombre del envío (para logs y mensajes de error)
+            acepta_400_con_resultados: Si False, cualquier error HTTP se propaga
 
         Returns:
-            NCValidationResponse con resultado de la validación
+            Resultado de ``parser`` sobre la respuesta del ministerio
         """
-        url = f"{self.base_url}/PaquetesFevRips/CargarNC"
-
         headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
+        if isinstance(json_payload, StreamedNCBody):
+            # Largo conocido: se envía con Content-Length (sin chunked) aunque el cuerpo sea por partes
+            headers["Content-Length"] = str(json_payload.content_length)
+            body = {"content": json_payload}
+        else:
+            body = {"content": json_codec.dumps(json_payload)}
 
-        # El payload ya viene listo: { rips: {...}, xmlFevFile: "base64..." }
-        json_payload = {
-            "rips": payload.rips,
-            "xmlFevFile": payload.xmlFevFile
-        }
-
-        # Intentar con retry logic
         max_retries = 2
         last_error = None
 
         for attempt in range(max_retries + 1):
             try:
-                response = requests.post(
+                response = await self.client.post(
                     url,
-                    json=json_payload,
                     headers=headers,
-                    timeout=60,
-                    verify=False
+                    timeout=self.timeout,
+                    **body
                 )
-                data = response.json()
+
+                if not acepta_400_con_resultados:
+                    response.raise_for_status()
+                    return parser(json_codec.loads(response.content))
+
+                data = _leer_json(response)
 
                 if response.status_code == 400 and data.get("ResultadosValidacion") is not None:
-                    return self._parse_validation_response(data)
+                    return parser(data)
 
                 response.raise_for_status()
-                return self._parse_validation_response(data)
+                return parser(data)
 
-            except requests.exceptions.Timeout as e:
+            except httpx.TimeoutException as e:
                 last_error = e
                 if attempt < max_retries:
-                    continue
-                raise
+                    continue  # Reintentar
+                raise  # Agotados los reintentos
 
-            except requests.exceptions.HTTPError as e:
-                if e.response is not None and e.response.content:
+            except httpx.HTTPStatusError as e:
+                if acepta_400_con_resultados and e.response.content:
                     try:
                         err_body = e.response.json()
                         if err_body.get("ResultadosValidacion") is not None:
-                            return self._parse_validation_response(err_body)
-                    except (ValueError, TypeError):
+                            return parser(err_body)
+                        logger.error(f"{descripcion} ministerio {e.response.status_code}: {err_body}")
+                    except (ValueError, TypeError, AttributeError):
                         pass
-                raise
+                raise  # No reintentar errores HTTP
 
+        # Si llegamos aquí, agotamos los reintentos por timeout
         if last_error:
             raise last_error
 
-        raise RuntimeError("Error inesperado al enviar NC")
+        raise RuntimeError(f"Error inesperado al enviar {descripcion}")
+
+    async def enviar_nc(self, payload: NCPayload, token: str) -> NCValidationResponse:
+        """
+        Envía la NC al ministerio para validación.
+
+        Args:
+            payload: Payload con rips y xmlFevFile en base64
+            token: Token JWT de autorización
+
+        Returns:
+            NCValidationResponse con resultado de la validación
+        """
+        url = f"{self.base_url}/PaquetesFevRips/CargarNC"
+
+        # El payload ya viene listo: { rips: {...}, xmlFevFile: "base64..." }
+        json_payload = {
+            "rips": payload.rips,
+            "xmlFevFile": payload.xmlFevFile
+        }
+
+        return await self._post_validacion(
+            url, json_payload, token, self._parse_validation_response, "NC"
+        )
+
+    async def enviar_nc_xml(self, rips: Union[Dict[str, Any], bytes], xml: bytes, token: str) -> NCValidationResponse:
+        """
+        Envía la NC al ministerio a partir del XML en bytes (sin base64 previo).
+
+        Args:
+            rips: RIPS de la NC (dict o JSON ya serializado con json_codec.dumps)
+            xml: XML de la NC (bytes UTF-8); se codifica en base64 mientras se envía
+            token: Token JWT de autorización
+
+        Returns:
+            NCValidationResponse con resultado de la validación
+        """
+        url = f"{self.base_url}/PaquetesFevRips/CargarNC"
+
+        return await self._post_validacion(
+            url, StreamedNCBody(rips, xml), token, self._parse_validation_response, "NC"
+        )
 
     async def enviar_nc_total(self, xml_base64: str, token: str) -> NCValidationResponse:
         """
@@ -144,49 +303,16 @@ class MinisterioService:
         """
         url = f"{self.base_url}/PaquetesFevRips/CargarNCTotal"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
         # El payload debe tener rips: null y xmlFevFile con el base64
         json_payload = {
             "rips": None,
             "xmlFevFile": xml_base64
         }
 
-        # Intentar con retry logic
-        max_retries = 2
-        last_error = None
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    url,
-                    json=json_payload,
-                    headers=headers,
-                    timeout=60,  # Timeout más largo para este endpoint
-                    verify=False
-                )
-                response.raise_for_status()
-
-                data = response.json()
-                return self._parse_validation_response(data)
-
-            except requests.exceptions.Timeout as e:
-                last_error = e
-                if attempt < max_retries:
-                    continue  # Reintentar
-                raise  # Agotados los reintentos
-
-            except requests.exceptions.HTTPError:
-                raise  # No reintentar errores HTTP
-
-        # Si llegamos aquí, agotamos los reintentos por timeout
-        if last_error:
-            raise last_error
-
-        raise RuntimeError("Error inesperado al enviar NC Total")
+        return await self._post_validacion(
+            url, json_payload, token, self._parse_validation_response, "NC Total",
+            acepta_400_con_resultados=False
+        )
 
     async def cargar_capita_periodo(self, payload: CapitaPeriodoPayload, token: str) -> CapitaPeriodoResponse:
         """
@@ -201,61 +327,15 @@ class MinisterioService:
         """
         url = f"{self.base_url}/PaquetesFevRips/CargarCapitaPeriodo"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
         # El payload ya viene listo: { rips: {...}, xmlFevFile: "base64..." }
         json_payload = {
             "rips": payload.rips,
             "xmlFevFile": payload.xmlFevFile
         }
 
-        # Intentar con retry logic
-        max_retries = 2
-        last_error = None
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    url,
-                    json=json_payload,
-                    headers=headers,
-                    timeout=60,  # Timeout más largo para este endpoint
-                    verify=False
-                )
-                data = response.json()
-
-                # Ministerio puede devolver 400 con ResultadosValidacion (validación fallida)
-                # Parseamos y mostramos en frontend en lugar de hacer raise
-                if response.status_code == 400 and data.get("ResultadosValidacion") is not None:
-                    return self._parse_capita_response(data)
-
-                response.raise_for_status()
-                return self._parse_capita_response(data)
-
-            except requests.exceptions.Timeout as e:
-                last_error = e
-                if attempt < max_retries:
-                    continue  # Reintentar
-                raise  # Agotados los reintentos
-
-            except requests.exceptions.HTTPError as e:
-                if e.response is not None and e.response.content:
-                    try:
-                        err_body = e.response.json()
-                        if err_body.get("ResultadosValidacion") is not None:
-                            return self._parse_capita_response(err_body)
-                    except (ValueError, TypeError):
-                        pass
-                raise  # No reintentar errores HTTP
-
-        # Si llegamos aquí, agotamos los reintentos por timeout
-        if last_error:
-            raise last_error
-
-        raise RuntimeError("Error inesperado al enviar Capita Periodo")
+        return await self._post_validacion(
+            url, json_payload, token, self._parse_capita_response, "Capita Periodo"
+        )
 
     async def cargar_fev_rips(self, payload: FevRipsPayload, token: str) -> FevRipsResponse:
         """
@@ -270,60 +350,14 @@ class MinisterioService:
         """
         url = f"{self.base_url}/PaquetesFevRips/CargarFevRips"
 
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
         json_payload = {
             "rips": payload.rips,
             "xmlFevFile": payload.xmlFevFile
         }
 
-        max_retries = 2
-        last_error = None
-
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.post(
-                    url,
-                    json=json_payload,
-                    headers=headers,
-                    timeout=60,
-                    verify=False
-                )
-
-                data = response.json()
-
-                # El ministerio puede devolver 400 con ResultadosValidacion (formato de validación)
-                # En ese caso parseamos y retornamos en lugar de hacer raise
-                if response.status_code == 400 and data.get("ResultadosValidacion") is not None:
-                    return self._parse_fev_rips_response(data)
-
-                response.raise_for_status()
-                return self._parse_fev_rips_response(data)
-
-            except requests.exceptions.Timeout as e:
-                last_error = e
-                if attempt < max_retries:
-                    continue
-                raise
-
-            except requests.exceptions.HTTPError as e:
-                if e.response is not None and e.response.content:
-                    try:
-                        err_body = e.response.json()
-                        if err_body.get("ResultadosValidacion") is not None:
-                            return self._parse_fev_rips_response(err_body)
-                        logger.error(f"FEV RIPS ministerio {e.response.status_code}: {err_body}")
-                    except (ValueError, TypeError):
-                        pass
-                raise
-
-        if last_error:
-            raise last_error
-
-        raise RuntimeError("Error inesperado al enviar FEV RIPS")
+        return await self._post_validacion(
+            url, json_payload, token, self._parse_fev_rips_response, "FEV RIPS"
+        )
 
     def _parse_fev_rips_response(self, data: Dict[str, Any]) -> FevRipsResponse:
         """Parsea la respuesta del ministerio para FEV RIPS (mismo formato que Capita)."""
@@ -455,17 +489,13 @@ class MinisterioService:
         try:
             # Intentar un GET a la raíz o health check
             url = f"{self.base_url}/health"
-            response = requests.get(
-                url,
-                timeout=5,
-                verify=False
-            )
+            response = await self.client.get(url, timeout=5)
             return response.status_code < 500
-        except requests.exceptions.RequestException:
+        except httpx.RequestError:
             # Si falla, intentar con el endpoint de auth (que sabemos existe)
             try:
                 url = f"{self.base_url}/auth/LoginSISPRO"
-                response = requests.options(url, timeout=5, verify=False)
+                await self.client.options(url, timeout=5)
                 return True  # Si no hay error de conexión, asumimos que está disponible
-            except:
+            except Exception:
                 return False
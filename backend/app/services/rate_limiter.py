@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+
+
+class TokenBucketLimiter:
+    """
+    Rate limiter asíncrono con dos cubetas: solicitudes por segundo y tokens por minuto.
+
+    Todas las llamadas al LLM de la aplicación (matching interactivo, batch y corrección)
+    pasan por el mismo limitador, así que varios batches o requests simultáneos
+    comparten el límite del proveedor. Cuando el proveedor responde 429, ``penalize()``
+    respeta el ``Retry-After`` y reduce el ritmo a la mitad (hasta ``min_factor``);
+    cada llamada exitosa lo recupera de a poco (``reward()``). Las esperas se acumulan
+    en las métricas de ``stats()``.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        burst: int = 1,
+        tokens_per_minute: int = 0,
+        min_factor: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep
+    ):
+        self.requests_per_second = max(0.0, requests_per_second)
+        self.burst = max(1, burst)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.min_factor = min(1.0, max(0.01, min_factor))
+        self._clock = clock
+        self._sleep = sleep
+        self.factor = 1.0
+        self._requests = float(self.burst)
+        self._tokens = float(self.tokens_per_minute)
+        self._ultimo = clock()
+        self._pausa_hasta = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self.acquired = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.throttled = 0
+
+    def _get_lock(self) -> asyncio.Lock:
+        """Lock del event loop actual (los tests usan un loop por caso)."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self, ahora: float) -> None:
+        transcurrido = max(0.0, ahora - self._ultimo)
+        self._ultimo = ahora
+        if self.requests_per_second:
+            self._requests = min(self.burst, self._requests + transcurrido * self.requests_per_second * self.factor)
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + transcurrido * self.tokens_per_minute / 60 * self.factor
+            )
+
+    def _espera(self, ahora: float, tokens: int) -> float:
+        """Segundos a esperar para poder hacer una solicitud de ``tokens`` (0 si ya se puede)."""
+        espera = self._pausa_hasta - ahora
+        if self.requests_per_second and self._requests < 1:
+            espera = max(espera, (1 - self._requests) / (self.requests_per_second * self.factor))
+        if self.tokens_per_minute and self._tokens < tokens:
+            espera = max(espera, (tokens - self._tokens) / (self.tokens_per_minute / 60 * self.factor))
+        return max(0.0, espera)
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Espera turno para una solicitud de ``tokens`` estimados. Retorna los segundos esperados."""
+        # Una solicitud más grande que la cubeta espera a tenerla llena
+        tokens = min(max(0, tokens), self.tokens_per_minute)
+        inicio = self._clock()
+        async with self._get_lock():
+            while True:
+                ahora = self._clock()
+                self._refill(ahora)
+                espera = self._espera(ahora, tokens)
+                if espera <= 0:
+                    break
+                await self._sleep(espera)
+            self._requests -= 1
+            self._tokens -= tokens
+
+        esperado = self._clock() - inicio
+        with self._stats_lock:
+            self.acquired += 1
+            if esperado > 0:
+                self.waited += 1
+                self.wait_total += esperado
+                self.wait_max = max(self.wait_max, esperado)
+        return esperado
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """El proveedor respondió 429: baja el ritmo y pausa hasta ``retry_after`` segundos."""
+        with self._stats_lock:
+            self.throttled += 1
+        self.factor = max(self.min_factor, self.factor / 2)
+        if retry_after and retry_after > 0:
+            self._pausa_hasta = max(self._pausa_hasta, self._clock() + retry_after)
+
+    def reward(self) -> None:
+        """Solicitud exitosa: recupera el ritmo configurado de forma gradual."""
+        if self.factor < 1.0:
+            self.factor = min(1.0, self.factor + 0.05)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de espera para dimensionar los límites."""
+        with self._stats_lock:
+            return {
+                'requests_per_second': round(self.requests_per_second * self.factor, 3),
+                'tokens_per_minute': round(self.tokens_per_minute * self.factor),
+                'factor': round(self.factor, 3),
+                'acquired': self.acquired,
+                'waited': self.waited,
+                'wait_total_s': round(self.wait_total, 3),
+                'wait_max_s': round(self.wait_max, 3),
+                'wait_avg_ms': round(self.wait_total / self.acquired * 1000, 1) if self.acquired else 0.0,
+                'throttled': self.throttled,
+            }
+
+    def clear(self) -> None:
+        """Reinicia los contadores y el ritmo (no las cubetas)."""
+        with self._stats_lock:
+            self._reset_stats()
+        self.factor = 1.0
+        self._pausa_hasta = 0.0
+
+
+llm_rate_limiter = TokenBucketLimiter(
+    requests_per_second=settings.llm_requests_per_second,
+    burst=settings.llm_burst,
+    tokens_per_minute=settings.llm_tokens_per_minute
+)
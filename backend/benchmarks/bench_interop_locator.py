@@ -0,0 +1,87 @@
+"""
+Benchmark de la localización de Interoperabilidad en facturas con entradas adversas.
+
+Compara los localizadores lineales (find/rfind) de ParsedUBLDocument con los patrones
+regex anteriores sobre un corpus de casos patológicos:
+
+- sin_cierres: muchas cabeceras UBLExtension con Interoperabilidad sin cerrar
+- muchas_extensiones: miles de UBLExtension completas salvo el cierre final
+- valida_al_final: factura válida con la sección al final de un documento grande
+- sin_interop: documento grande sin ninguna sección de Interoperabilidad
+
+Los patrones anteriores solo se ejecutan hasta LEGACY_MAX_MB porque su costo crece
+de forma cuadrática en los casos adversos.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_interop_locator
+"""
+
+import re
+import time
+from typing import Callable, Dict
+
+from app.processors.ubl_document import locate_custom_tag_general, locate_interoperabilidad
+
+SIZES_MB = [0.01, 0.1, 1, 10, 50]
+LEGACY_MAX_MB = 0.01
+
+LEGACY = re.compile(
+    r'(<ext:UBLExtension>\s*<ext:ExtensionContent>\s*<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>\s*</ext:ExtensionContent>\s*</ext:UBLExtension>)',
+    re.DOTALL
+)
+LEGACY_FALLBACK = re.compile(
+    r'(<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>)',
+    re.DOTALL
+)
+
+HEADER = '<ext:UBLExtension>\n  <ext:ExtensionContent>\n    <CustomTagGeneral>\n'
+INTEROP = '      <Interoperabilidad><Group schemeName="Sector Salud"><Collection/></Group></Interoperabilidad>\n'
+TAIL = '    </CustomTagGeneral>\n  </ext:ExtensionContent>\n</ext:UBLExtension>\n'
+FILLER = '<cbc:Note>Lorem ipsum dolor sit amet</cbc:Note>\n'
+
+
+def _repeat_to(block: str, size: int) -> str:
+    return block * max(1, size // len(block))
+
+
+def build_corpus(size: int) -> Dict[str, bytes]:
+    """Casos adversos de aproximadamente ``size`` bytes."""
+    return {
+        'sin_cierres': _repeat_to(HEADER + '<Interoperabilidad>' + FILLER, size).encode('utf-8'),
+        'muchas_extensiones': _repeat_to(
+            HEADER + INTEROP + '    </CustomTagGeneral>\n  </ext:ExtensionContent>\n', size
+        ).encode('utf-8'),
+        'valida_al_final': (_repeat_to(FILLER, size) + HEADER + INTEROP + TAIL).encode('utf-8'),
+        'sin_interop': (HEADER + _repeat_to(FILLER, size)).encode('utf-8'),
+    }
+
+
+def locate_new(raw: bytes):
+    return locate_interoperabilidad(raw, 0, len(raw)) or locate_custom_tag_general(raw, 0, len(raw))
+
+
+def locate_legacy(raw: bytes):
+    text = raw.decode('utf-8')
+    return LEGACY.search(text) or LEGACY_FALLBACK.search(text)
+
+
+def _timeit(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'caso':<20} {'MB':>6} {'actual (ms)':>12} {'anterior (ms)':>14}")
+    for size_mb in SIZES_MB:
+        corpus = build_corpus(int(size_mb * 1024 * 1024))
+        for name, raw in corpus.items():
+            actual = _timeit(lambda: locate_new(raw))
+            legacy = '-'
+            if size_mb <= LEGACY_MAX_MB:
+                legacy = f"{_timeit(lambda: locate_legacy(raw)) * 1000:.1f}"
+            print(f"{name:<20} {len(raw) / 1024 / 1024:>6.2f} {actual * 1000:>12.2f} {legacy:>14}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark de XMLProcessor.aplicar_valores_cero_por_linea.
+
+Genera NC sintéticas de 10 a 10.000 líneas, iguala a cero la mitad de las líneas y
+mide el tiempo del motor actual (una pasada indexada) frente a la implementación
+anterior basada en una búsqueda regex por línea (solo hasta LEGACY_MAX líneas,
+porque su costo es cuadrático).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_valores_cero
+"""
+
+import re
+import time
+from typing import Callable, List
+
+from app.processors.xml_processor import XMLProcessor
+
+SIZES = [10, 100, 1000, 5000, 10000]
+LEGACY_MAX = 1000
+
+
+def build_nc(num_lines: int) -> str:
+    """NC con ``num_lines`` CreditNoteLine y su LegalMonetaryTotal."""
+    lines = []
+    for i in range(1, num_lines + 1):
+        lines.append(
+            f'''  <cac:CreditNoteLine>
+    <cbc:ID>{i}</cbc:ID>
+    <cbc:CreditedQuantity unitCode="94">1</cbc:CreditedQuantity>
+    <cbc:LineExtensionAmount currencyID="COP">{i * 10}.00</cbc:LineExtensionAmount>
+    <cac:Item><cbc:Description>SERVICIO {i} ({890200 + i})</cbc:Description></cac:Item>
+    <cac:Price><cbc:PriceAmount currencyID="COP">{i * 10}.00</cbc:PriceAmount><cbc:BaseQuantity unitCode="94">1</cbc:BaseQuantity></cac:Price>
+  </cac:CreditNoteLine>
+'''
+        )
+    total = sum(i * 10 for i in range(1, num_lines + 1))
+    return (
+        '<AttachedDocument><cac:Attachment><cbc:Description><![CDATA[<CreditNote>\n'
+        + ''.join(lines)
+        + f'''  <cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount currencyID="COP">{total}.00</cbc:LineExtensionAmount>
+    <cbc:TaxInclusiveAmount currencyID="COP">{total}.00</cbc:TaxInclusiveAmount>
+    <cbc:PayableAmount currencyID="COP">{total}.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+</CreditNote>]]></cbc:Description></cac:Attachment></AttachedDocument>'''
+    )
+
+
+def legacy_valores_cero(nc_xml: str, lineas_ids: List[int]) -> str:
+    """Implementación anterior (una búsqueda regex sobre todo el documento por línea)."""
+    result = nc_xml
+    for line_id in lineas_ids:
+        pattern = rf'(<cac:CreditNoteLine[^>]*>.*?<cbc:ID[^>]*>{line_id}</cbc:ID>.*?</cac:CreditNoteLine>)'
+        match = re.search(pattern, result, re.DOTALL)
+        if not match:
+            continue
+        original_line = match.group(1)
+        modified_line = original_line
+        for tag in ('LineExtensionAmount', 'PriceAmount', 'CreditedQuantity', 'BaseQuantity'):
+            modified_line = re.sub(rf'(<cbc:{tag}[^>]*>)[\d.]+(</cbc:{tag}>)', r'\g<1>0.00\g<2>', modified_line)
+        result = result.replace(original_line, modified_line)
+
+    total = 0.0
+    for line_match in re.finditer(
+        r'<cac:CreditNoteLine[^>]*>.*?<cbc:LineExtensionAmount[^>]*>([\d.]+)</cbc:LineExtensionAmount>.*?</cac:CreditNoteLine>',
+        result, re.DOTALL
+    ):
+        total += float(line_match.group(1))
+    total_str = f"{total:.2f}"
+    for tag in ('LineExtensionAmount', 'TaxInclusiveAmount', 'PayableAmount'):
+        result = re.sub(
+            rf'(<cac:LegalMonetaryTotal>.*?<cbc:{tag}[^>]*>)[\d.]+(</cbc:{tag}>)',
+            rf'\g<1>{total_str}\g<2>',
+            result, count=1, flags=re.DOTALL
+        )
+    return result
+
+
+def _timeit(func: Callable[[], object], repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(f"{'lineas':>8} {'actual (ms)':>12} {'us/linea':>10} {'anterior (ms)':>14}")
+    for size in SIZES:
+        nc_xml = build_nc(size)
+        ids = list(range(2, size + 1, 2))
+
+        actual = _timeit(lambda: XMLProcessor.aplicar_valores_cero_por_linea(nc_xml, ids))
+        legacy = '-'
+        if size <= LEGACY_MAX:
+            legacy = f"{_timeit(lambda: legacy_valores_cero(nc_xml, ids), repeat=1) * 1000:.1f}"
+
+        print(f"{size:>8} {actual * 1000:>12.2f} {actual / size * 1e6:>10.2f} {legacy:>14}")
+
+
+if __name__ == '__main__':
+    main()
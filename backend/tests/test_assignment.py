@@ -0,0 +1,70 @@
+import itertools
+import random
+
+from app.models import LineaNC, ServicioRIPS, Confianza
+from app.services.assignment import solve_assignment
+from app.services.llm_matcher import LLMMatcher
+
+
+def _costo_total(costos, asignacion):
+    return sum(costos[i][j] for i, j in enumerate(asignacion) if j >= 0)
+
+
+def _minimo_fuerza_bruta(costos):
+    n, m = len(costos), len(costos[0])
+    if n <= m:
+        return min(sum(costos[i][p[i]] for i in range(n)) for p in itertools.permutations(range(m), n))
+    return min(sum(costos[p[j]][j] for j in range(m)) for p in itertools.permutations(range(n), m))
+
+
+class TestSolveAssignment:
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            n, m = rng.randint(1, 5), rng.randint(1, 5)
+            costos = [[rng.choice([0, 0.25, 0.5, 1, 1.5]) for _ in range(m)] for _ in range(n)]
+
+            asignacion = solve_assignment(costos)
+
+            columnas = [j for j in asignacion if j >= 0]
+            assert len(columnas) == min(n, m) == len(set(columnas))
+            assert abs(_costo_total(costos, asignacion) - _minimo_fuerza_bruta(costos)) < 1e-4
+
+    def test_ties_keep_first_free_order(self):
+        assert solve_assignment([[0] * 3 for _ in range(3)]) == [0, 1, 2]
+        assert solve_assignment([[0] * 2 for _ in range(3)]) == [0, 1, -1]
+        assert solve_assignment([]) == []
+
+
+class TestAmbiguousCodeMatching:
+    def _servicio(self, valor, cantidad=1, nombre="ACETAMINOFEN 500 MG"):
+        return ServicioRIPS(tipo="medicamentos", codigo="19943544", nombre=nombre, valor_unitario=valor,
+                            cantidad_original=cantidad, datos_completos={})
+
+    def test_same_code_different_prices(self):
+        servicios = [self._servicio(500, 10), self._servicio(1200, 5), self._servicio(90, 30)]
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=2400, descripcion="(19943544) ACETAMINOFEN", codigo_extraido="19943544"),
+            LineaNC(id=2, cantidad=1, valor=270, descripcion="(19943544) ACETAMINOFEN", codigo_extraido="19943544"),
+            LineaNC(id=3, cantidad=1, valor=1500, descripcion="(19943544) ACETAMINOFEN", codigo_extraido="19943544"),
+        ]
+
+        matches, unmatched = LLMMatcher()._match_by_code(lineas, servicios)
+
+        assert unmatched == []
+        assert [(m.linea_nc, m.valor_unitario_rips, m.cantidad_calculada) for m in matches] == [
+            (1, 1200, 2.0), (2, 90, 3.0), (3, 500, 3.0)
+        ]
+        assert all(m.confianza == Confianza.ALTA for m in matches)
+
+    def test_more_lines_than_services(self):
+        servicios = [self._servicio(500), self._servicio(700)]
+        lineas = [
+            LineaNC(id=i, cantidad=1, valor=valor, descripcion="X", codigo_extraido="19943544")
+            for i, valor in enumerate([123, 700, 500], start=1)
+        ]
+
+        matches, unmatched = LLMMatcher()._match_by_code(lineas, servicios)
+
+        assert sorted((m.linea_nc, m.valor_unitario_rips) for m in matches) == [(2, 700), (3, 500)]
+        assert [l.id for l in unmatched] == [1]
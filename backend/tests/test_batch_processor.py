@@ -0,0 +1,266 @@
+import asyncio
+import random
+
+import pytest
+
+from app.models import MatchingResponse
+from app.services.batch_processor import BatchProcessor, BatchResult
+from app.services.batch_pipeline import BatchPipeline, PipelineStage
+from app.services.folder_scanner import FolderInfo
+
+
+def _folders(n):
+    return [FolderInfo(nombre=f"NC_{i:03d}", path=f"/tmp/NC_{i:03d}") for i in range(n)]
+
+
+def _fake_stages(processor, fail_on=None, in_flight_log=None):
+    """Replace the stage methods of the processor with fast fakes."""
+    in_flight = {"actual": 0, "max": 0}
+
+    def parse(work):
+        if fail_on and work.carpeta.endswith(fail_on):
+            raise RuntimeError("boom")
+        in_flight["actual"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["actual"])
+        work.numero_nc = work.carpeta
+        return work
+
+    async def match(work):
+        await asyncio.sleep(random.uniform(0, 0.02))
+        work.matching_result = MatchingResponse(matches=[], warnings=[])
+        return work
+
+    def build(work):
+        work.rips_guardado = int(work.carpeta[-3:]) % 3 != 0
+        return work
+
+    async def submit(work, token):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        in_flight["actual"] -= 1
+        return BatchResult(
+            carpeta=work.carpeta,
+            numero_nc=work.numero_nc,
+            exitoso=work.rips_guardado,
+            rips_guardado=work.rips_guardado
+        )
+
+    processor._parse_stage = parse
+    processor._match_stage = match
+    processor._build_stage = build
+    processor._submit_stage = submit
+    return in_flight
+
+
+class TestProcessBatchConcurrency:
+    @pytest.mark.asyncio
+    async def test_results_ordered_and_in_flight_bounded(self):
+        processor = BatchProcessor()
+        folders = _folders(20)
+        batch_id = processor.create_batch(folders, batch_id="batch_test")
+        in_flight = _fake_stages(processor)
+
+        progress = []
+        processor.on_progress = lambda state: progress.append((state.completadas, state.resultados[-1].carpeta))
+
+        await processor.process_batch(batch_id, folders, "token", concurrency=4)
+
+        state = processor.get_state(batch_id)
+        assert in_flight["max"] <= 4
+        assert state.concurrencia == 4
+        assert [r.carpeta for r in state.resultados] == [f.nombre for f in folders]
+        assert progress == [(i + 1, f.nombre) for i, f in enumerate(folders)]
+        assert state.completadas == 20
+        assert state.exitosos == 13
+        assert state.errores == 7
+        assert state.rips_guardados == 13
+        assert state.en_progreso is False
+        assert [e.procesados for e in state.etapas.values()] == [20, 20, 20, 20]
+
+    @pytest.mark.asyncio
+    async def test_folder_exception_is_recorded_as_error(self):
+        processor = BatchProcessor()
+        folders = _folders(3)
+        batch_id = processor.create_batch(folders)
+        _fake_stages(processor, fail_on="001")
+
+        await processor.process_batch(batch_id, folders, "token", concurrency=2)
+
+        state = processor.get_state(batch_id)
+        assert state.completadas == 3
+        assert state.errores == 2  # NC_000 (rips no guardado) y NC_001 (excepción)
+        assert state.resultados[1].carpeta == "NC_001"
+        assert state.resultados[1].error == "boom"
+        assert state.etapas["parse"].errores == 1
+
+
+class TestBatchPipeline:
+    @pytest.mark.asyncio
+    async def test_stage_limits_are_respected(self):
+        active = {"slow": 0, "max_slow": 0}
+
+        async def fast(item):
+            return item + 1
+
+        async def slow(item):
+            active["slow"] += 1
+            active["max_slow"] = max(active["max_slow"], active["slow"])
+            await asyncio.sleep(0.01)
+            active["slow"] -= 1
+            return item * 10
+
+        pipeline = BatchPipeline(
+            stages=[PipelineStage("fast", fast, 3), PipelineStage("slow", slow, 2)],
+            is_final=lambda output: False,
+            queue_size=2
+        )
+        results = {}
+        await pipeline.run(list(range(10)), results.__setitem__, lambda i, item, e: None, max_in_flight=5)
+
+        assert results == {i: (i + 1) * 10 for i in range(10)}
+        assert active["max_slow"] <= 2
+        assert [s["procesados"] for s in pipeline.snapshot()] == [10, 10]
+
+
+NC_XML = '''<?xml version="1.0"?>
+<AttachedDocument>
+  <cbc:ParentDocumentID>NCS2766</cbc:ParentDocumentID>
+  <cac:Attachment>
+    <cac:ExternalReference>
+      <cbc:Description><![CDATA[
+        <CreditNote>
+          <ext:UBLExtensions>
+            <ext:UBLExtension>Extension1</ext:UBLExtension>
+          </ext:UBLExtensions>
+          <cbc:ID>NCS2766</cbc:ID>
+          <cac:DiscrepancyResponse>
+            <cbc:ReferenceID>HMD73787</cbc:ReferenceID>
+          </cac:DiscrepancyResponse>
+          <cac:LegalMonetaryTotal>
+            <cbc:LineExtensionAmount currencyID="COP">2500.00</cbc:LineExtensionAmount>
+            <cbc:TaxInclusiveAmount currencyID="COP">2500.00</cbc:TaxInclusiveAmount>
+            <cbc:PayableAmount currencyID="COP">2500.00</cbc:PayableAmount>
+          </cac:LegalMonetaryTotal>
+          <cac:CreditNoteLine>
+            <cbc:ID>1</cbc:ID>
+            <cbc:CreditedQuantity>1.00</cbc:CreditedQuantity>
+            <cbc:LineExtensionAmount currencyID="COP">500.00</cbc:LineExtensionAmount>
+            <cac:Item>
+              <cbc:Description>(890201) CONSULTA</cbc:Description>
+            </cac:Item>
+            <cac:Price>
+              <cbc:PriceAmount currencyID="COP">500.00</cbc:PriceAmount>
+            </cac:Price>
+          </cac:CreditNoteLine>
+          <cac:CreditNoteLine>
+            <cbc:ID>2</cbc:ID>
+            <cbc:CreditedQuantity>1.00</cbc:CreditedQuantity>
+            <cbc:LineExtensionAmount currencyID="COP">2000.00</cbc:LineExtensionAmount>
+            <cac:Item>
+              <cbc:Description>(19943544) PRESERVATIVOS</cbc:Description>
+            </cac:Item>
+            <cac:Price>
+              <cbc:PriceAmount currencyID="COP">2000.00</cbc:PriceAmount>
+            </cac:Price>
+          </cac:CreditNoteLine>
+        </CreditNote>
+      ]]></cbc:Description>
+    </cac:ExternalReference>
+  </cac:Attachment>
+</AttachedDocument>'''
+
+FACTURA_XML = '''<?xml version="1.0"?>
+<AttachedDocument>
+  <cbc:Description><![CDATA[
+    <Invoice>
+      <ext:UBLExtensions>
+        <ext:UBLExtension>
+          <ext:ExtensionContent>
+            <CustomTagGeneral>
+              <Interoperabilidad>
+                <Group schemeName="Sector Salud">Usuario</Group>
+              </Interoperabilidad>
+            </CustomTagGeneral>
+          </ext:ExtensionContent>
+        </ext:UBLExtension>
+      </ext:UBLExtensions>
+      <cac:InvoicePeriod>
+        <cbc:StartDate>2025-01-01</cbc:StartDate>
+      </cac:InvoicePeriod>
+    </Invoice>
+  ]]></cbc:Description>
+</AttachedDocument>'''
+
+RIPS_JSON = '''{
+    "numDocumentoIdObligado": "817000162",
+    "numFactura": "HMD73787",
+    "usuarios": [{
+        "tipoDocumentoIdentificacion": "CC",
+        "numDocumentoIdentificacion": "4770399",
+        "consecutivo": 1,
+        "servicios": {
+            "medicamentos": [{
+                "codTecnologiaSalud": "19943544",
+                "nomTecnologiaSalud": "PRESERVATIVOS",
+                "vrUnitMedicamento": 500,
+                "cantidadMedicamento": 10,
+                "vrServicio": 5000
+            }],
+            "consultas": [{
+                "codConsulta": "890201",
+                "vrServicio": 500
+            }]
+        }
+    }]
+}'''
+
+
+class FakeMinisterio:
+    def __init__(self):
+        self.payloads = []
+
+    async def enviar_nc_xml(self, rips, xml, token):
+        import json
+        from app.models import NCPayload, NCValidationResponse
+        from app.services.ministerio_service import StreamedNCBody
+
+        body = b"".join([chunk async for chunk in StreamedNCBody(rips, xml)])
+        self.payloads.append(NCPayload(**json.loads(body)))
+        return NCValidationResponse(success=True, result_state=True, codigo_unico_validacion="CUV123", raw_response={})
+
+
+class TestProcessFolder:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("stream_threshold_mb", [64, 0])
+    async def test_process_folder_end_to_end(self, tmp_path, monkeypatch, stream_threshold_mb):
+        import base64
+        from app.services import batch_processor
+
+        # 0 MB: el RIPS se lee por streaming
+        monkeypatch.setattr(batch_processor.settings, "rips_stream_threshold_mb", stream_threshold_mb)
+
+        folder = tmp_path / "NC_0001"
+        folder.mkdir()
+        (folder / "PMD_factura.xml").write_text(FACTURA_XML, encoding="utf-8")
+        (folder / "NCS2766.xml").write_text(NC_XML, encoding="utf-8")
+        (folder / "RIPS_817000162.json").write_text(RIPS_JSON, encoding="utf-8")
+
+        ministerio = FakeMinisterio()
+        processor = BatchProcessor(ministerio_service=ministerio)
+
+        result = await processor.process_folder(str(folder), "token")
+
+        assert result.exitoso is True
+        assert result.numero_nc == "NCS2766"
+        assert result.cuv == "CUV123"
+        # La consulta (500) coincide con el valor RIPS: se iguala a cero
+        assert result.items_igualados_a_cero == 1
+
+        payload = ministerio.payloads[0]
+        xml = base64.b64decode(payload.xmlFevFile).decode("utf-8")
+        assert "<Interoperabilidad>" in xml
+        assert "<cac:InvoicePeriod>" in xml
+        assert '<cbc:PayableAmount currencyID="COP">2000.00</cbc:PayableAmount>' in xml
+
+        servicios = payload.rips["usuarios"][0]["servicios"]
+        assert servicios["medicamentos"][0]["vrServicio"] == 2000
+        assert servicios["consultas"][0]["vrServicio"] == 0
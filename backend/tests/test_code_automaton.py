@@ -0,0 +1,66 @@
+import random
+import re
+
+from app.models import LineaNC, ServicioRIPS, Confianza
+from app.processors.code_automaton import CodeAutomaton, CodeHit
+from app.services.llm_matcher import LLMMatcher
+
+
+def _naive(codigos, texto):
+    hits = []
+    for codigo in codigos:
+        for m in re.finditer(f"(?<![A-Za-z0-9]){re.escape(codigo)}(?![A-Za-z0-9])", texto, re.IGNORECASE):
+            hits.append(CodeHit(codigo, m.start(), m.end()))
+    return sorted(hits, key=lambda h: (h.fin, -len(h.codigo)))
+
+
+class TestCodeAutomaton:
+    def test_finds_all_codes_with_positions(self):
+        automata = CodeAutomaton(["19943544", "890201", "DM-INS-099", "12"])
+
+        hits = automata.find_all("00037492 19943544 consulta 890201 / dm-ins-099 x12")
+
+        assert hits == [
+            CodeHit("19943544", 9, 17),
+            CodeHit("890201", 27, 33),
+            CodeHit("DM-INS-099", 36, 46),
+        ]
+        assert len(automata) == 3  # "12" es demasiado corto
+
+    def test_requires_code_boundaries(self):
+        automata = CodeAutomaton(["12345"])
+        assert automata.find_all("A12345 123456 (12345)") == [CodeHit("12345", 15, 20)]
+
+    def test_overlapping_codes_match_naive_search(self):
+        rng = random.Random(3)
+        alfabeto = "AB12-"
+        codigos = list({"".join(rng.choice(alfabeto) for _ in range(rng.randint(4, 7))) for _ in range(40)})
+        automata = CodeAutomaton(codigos)
+        for _ in range(100):
+            texto = "".join(rng.choice(alfabeto + " ") for _ in range(60))
+            esperado = _naive(codigos, texto)
+            assert sorted(automata.find_all(texto), key=lambda h: (h.fin, -len(h.codigo))) == esperado
+
+    def test_best_code_prefers_longest(self):
+        automata = CodeAutomaton(["19943544", "19943544-1"])
+        assert automata.best_code("PRESERVATIVO 19943544-1 CAJA") == "19943544-1"
+        assert automata.best_code("SIN CODIGO") is None
+
+
+class TestMatcherUsesAutomaton:
+    def test_code_without_parentheses_is_matched(self):
+        servicios = [
+            ServicioRIPS(tipo="procedimientos", codigo="903841", nombre="GLUCOSA", valor_unitario=8000, cantidad_original=1, datos_completos={}),
+        ]
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=8000, descripcion="903841 GLUCOSA EN SUERO"),
+            LineaNC(id=2, cantidad=1, valor=8000, descripcion="(000001) GLUCOSA 903841", codigo_extraido="000001"),
+        ]
+
+        con_codigo = LLMMatcher._extract_rips_codes(lineas, servicios)
+        matches, unmatched = LLMMatcher()._match_by_code(con_codigo, servicios)
+
+        assert [l.codigo_extraido for l in con_codigo] == ["903841", "903841"]
+        assert lineas[0].codigo_extraido is None
+        assert [(m.linea_nc, m.codigo_rips, m.confianza) for m in matches] == [(1, "903841", Confianza.ALTA)]
+        assert [l.id for l in unmatched] == [2]
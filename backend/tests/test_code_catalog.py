@@ -0,0 +1,194 @@
+import random
+
+import pytest
+
+from app.config import settings
+from app.models import LineaNC, ServicioRIPS
+from app.processors.code_catalog import (
+    CatalogEntry,
+    CodeCatalog,
+    close_code_catalog,
+    compile_catalog,
+    find_unknown_codes,
+    get_code_catalog,
+    main,
+    read_catalog_csv,
+)
+from app.services.local_matcher import LocalMatcher
+
+
+ENTRADAS = [
+    ("890201", "CONSULTA DE PRIMERA VEZ POR MEDICINA GENERAL", "CUPS"),
+    ("903841", "GLUCOSA EN SUERO U OTRO FLUIDO DIFERENTE A ORINA", "CUPS"),
+    ("19943544-1", "PRESERVATIVOS DE LATEX", "CUM"),
+    ("20012345-3", "ACETAMINOFÉN 500 MG TABLETA", "CUM"),
+]
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    path = tmp_path / "catalogo.bin"
+    compile_catalog(ENTRADAS, path)
+    catalogo = CodeCatalog(path)
+    yield catalogo
+    catalogo.close()
+
+
+class TestCodeCatalog:
+    def test_lookup(self, catalogo):
+        assert len(catalogo) == 4
+        assert catalogo.get("903841") == CatalogEntry("903841", "GLUCOSA EN SUERO U OTRO FLUIDO DIFERENTE A ORINA", "CUPS")
+        assert catalogo.get(" 20012345-3 ").nombre == "ACETAMINOFÉN 500 MG TABLETA"
+        assert "890201" in catalogo
+        assert "890202" not in catalogo
+        assert catalogo.get("") is None
+        assert catalogo.get("890201", "CUM") is None
+
+    def test_zero_padding_and_expediente(self, catalogo):
+        assert catalogo.get("019943544-01").codigo == "19943544-1"
+        assert catalogo.get("19943544", "CUM").nombre == "PRESERVATIVOS DE LATEX"
+        assert catalogo.get("020012345").codigo == "20012345-3"
+        assert catalogo.get("19943544", "CUPS") is None
+        assert catalogo.get("19943544-2", "CUM") is None
+        assert catalogo.get("1994354", "CUM") is None
+
+    def test_same_code_in_both_catalogs(self, tmp_path):
+        path = tmp_path / "catalogo.bin"
+        assert compile_catalog([("A100", "PROC", "CUPS"), ("A100", "MED", "CUM"), ("a100", "DUP", "CUM")], path) == 2
+        catalogo = CodeCatalog(path)
+        assert catalogo.get("A100", "CUM").nombre == "MED"
+        assert catalogo.get("A100", "CUPS").nombre == "PROC"
+        catalogo.close()
+
+    def test_matches_dict_lookup(self, tmp_path):
+        rng = random.Random(7)
+        codigos = {f"{rng.randint(0, 10**8):08d}-{rng.randint(1, 20)}": f"PRODUCTO {i}" for i in range(2000)}
+        path = tmp_path / "catalogo.bin"
+        compile_catalog(((c, n, "CUM") for c, n in codigos.items()), path)
+        catalogo = CodeCatalog(path)
+
+        for codigo, nombre in codigos.items():
+            assert catalogo.get(codigo).nombre == nombre
+        for _ in range(200):
+            codigo = f"{rng.randint(0, 10**8):08d}-{rng.randint(1, 20)}"
+            assert (codigo in catalogo) == (codigo in codigos)
+        catalogo.close()
+
+    def test_rejects_invalid_file(self, tmp_path):
+        path = tmp_path / "otro.bin"
+        path.write_bytes(b"no es un catalogo")
+        with pytest.raises(ValueError):
+            CodeCatalog(path)
+
+    def test_compile_from_public_csv(self, tmp_path):
+        cups = tmp_path / "cups.csv"
+        cups.write_text("Codigo;Nombre;Capitulo\n890201;CONSULTA DE PRIMERA VEZ POR MEDICINA GENERAL;1\n", encoding="utf-8-sig")
+        cum = tmp_path / "cum.csv"
+        cum.write_text(
+            "expediente,producto,consecutivocum,descripcioncomercial\n"
+            "19943544,CONDON,1,PRESERVATIVOS DE LATEX\n"
+            ",SIN EXPEDIENTE,2,X\n",
+            encoding="utf-8"
+        )
+        assert list(read_catalog_csv(cups, "CUPS")) == [("890201", "CONSULTA DE PRIMERA VEZ POR MEDICINA GENERAL", "CUPS")]
+
+        salida = tmp_path / "catalogo.bin"
+        main(["--cups", str(cups), "--cum", str(cum), "-o", str(salida)])
+        catalogo = CodeCatalog(salida)
+        assert len(catalogo) == 2
+        assert catalogo.get("19943544-1") == CatalogEntry("19943544-1", "PRESERVATIVOS DE LATEX", "CUM")
+        catalogo.close()
+
+    def test_missing_columns(self, tmp_path):
+        path = tmp_path / "cups.csv"
+        path.write_text("cod,desc\n890201,CONSULTA\n", encoding="utf-8")
+        with pytest.raises(ValueError):
+            list(read_catalog_csv(path, "CUPS"))
+
+
+class TestPreValidation:
+    def test_find_unknown_codes(self, catalogo):
+        rips = {
+            "usuarios": [
+                {"servicios": {
+                    "consultas": [{"codConsulta": "890201"}],
+                    "procedimientos": [{"codProcedimiento": "999999"}, {"codProcedimiento": "999999"}],
+                    "medicamentos": [
+                        {"codTecnologiaSalud": "19943544-1"}, {"codTecnologiaSalud": "19943544"},
+                        {"codTecnologiaSalud": "020012345-03"}, {"codTecnologiaSalud": "890201"},
+                        {"codTecnologiaSalud": "M1"},
+                    ],
+                    "otrosServicios": [{"codTecnologiaSalud": "DM-INS-099"}],
+                }},
+            ]
+        }
+        assert find_unknown_codes(rips, catalogo) == [
+            "codProcedimiento 999999 (procedimientos) no existe en el catálogo CUPS",
+            "codTecnologiaSalud 890201 (medicamentos) no existe en el catálogo CUM",
+            "codTecnologiaSalud M1 (medicamentos) no existe en el catálogo CUM",
+        ]
+
+    def test_get_code_catalog_follows_settings(self, tmp_path, monkeypatch):
+        path = tmp_path / "catalogo.bin"
+        compile_catalog(ENTRADAS, path)
+        try:
+            monkeypatch.setattr(settings, "code_catalog_path", "")
+            assert get_code_catalog() is None
+
+            monkeypatch.setattr(settings, "code_catalog_path", str(path))
+            catalogo = get_code_catalog()
+            assert len(catalogo) == 4
+            assert get_code_catalog() is catalogo
+
+            monkeypatch.setattr(settings, "code_catalog_path", str(tmp_path / "no_existe.bin"))
+            assert get_code_catalog() is None
+        finally:
+            close_code_catalog()
+
+
+class TestLocalMatcherWithCatalog:
+    def test_catalog_name_resolves_abbreviated_line(self, catalogo):
+        servicios = [
+            ServicioRIPS(tipo="procedimientos", codigo="903841A", nombre="GLUCOSA EN SUERO U OTRO FLUIDO DIFERENTE A ORINA",
+                         valor_unitario=9000, cantidad_original=1, datos_completos={}),
+            ServicioRIPS(tipo="procedimientos", codigo="902210A", nombre="HEMOGRAMA IV HEMOGLOBINA HEMATOCRITO",
+                         valor_unitario=9000, cantidad_original=1, datos_completos={}),
+        ]
+        linea = LineaNC(id=1, cantidad=1, descripcion="LAB 903841", valor=9000, codigo_extraido="903841")
+
+        matches, ambiguas = LocalMatcher(servicios).match([linea])
+        assert not matches and ambiguas == [linea]
+
+        matches, ambiguas = LocalMatcher(servicios, catalogo=catalogo).match([linea])
+        assert [m.codigo_rips for m in matches] == ["903841A"]
+
+
+class TestEnviarNCWithCatalog:
+    def test_unknown_codes_are_sent_and_notified(self, tmp_path, monkeypatch):
+        from unittest.mock import AsyncMock, patch
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.models.schemas import NCValidationResponse
+
+        path = tmp_path / "catalogo.bin"
+        compile_catalog(ENTRADAS, path)
+        monkeypatch.setattr(settings, "code_catalog_path", str(path))
+        rips = {"usuarios": [{"servicios": {"medicamentos": [{"codTecnologiaSalud": "19943544"}, {"codTecnologiaSalud": "M1"}]}}]}
+        enviar = AsyncMock(return_value=NCValidationResponse(success=True, result_state=True))
+        try:
+            with patch("app.api.validation_router.MinisterioService.enviar_nc", enviar):
+                response = TestClient(app).post(
+                    "/api/validation/enviar-nc",
+                    json={"rips": rips, "xmlFevFile": ""},
+                    headers={"Authorization": "Bearer t"}
+                )
+        finally:
+            close_code_catalog()
+
+        assert response.status_code == 200
+        enviar.assert_awaited_once()
+        body = response.json()
+        assert body["success"] is True and body["errores"] == []
+        assert [n["Descripcion"] for n in body["notificaciones"]] == [
+            "codTecnologiaSalud M1 (medicamentos) no existe en el catálogo CUM"
+        ]
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from app.processors import json_codec
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        if json_codec.orjson is None:
+            pytest.skip("orjson no instalado")
+        monkeypatch.setattr(json_codec, "USE_ORJSON", True)
+    else:
+        monkeypatch.setattr(json_codec, "USE_ORJSON", False)
+    return request.param
+
+
+DATA = {"numNota": "NC1", "usuarios": [{"nombre": "José Ñandú", "vrServicio": 2000.5, "consecutivo": 1}]}
+
+
+class TestJSONCodec:
+    def test_compact_roundtrip(self, backend):
+        encoded = json_codec.dumps(DATA)
+
+        assert isinstance(encoded, bytes)
+        assert encoded == json.dumps(DATA, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        assert json_codec.loads(encoded) == DATA
+        assert json_codec.loads(encoded.decode('utf-8')) == DATA
+
+    def test_pretty(self, backend):
+        assert json_codec.dumps_pretty(DATA) == json.dumps(DATA, ensure_ascii=False, indent=2)
+
+    def test_invalid_raises_json_decode_error(self, backend):
+        with pytest.raises(json.JSONDecodeError):
+            json_codec.loads(b'{"a": ')
+
+    def test_big_int_and_default(self, backend):
+        assert json_codec.loads(json_codec.dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+        assert json_codec.dumps({"s": {1, 2}}, default=sorted) == b'{"s":[1,2]}'
+
+    def test_overlays_are_not_all_copied_at_once(self, backend):
+        import tracemalloc
+
+        from app.processors.service_overlay import ServiceOverlay
+
+        bases = [{f"campo{k}": f"valor{k}" for k in range(20)} for _ in range(5000)]
+        overlays = {"s": [ServiceOverlay(b, {"vrServicio": 1}) for b in bases]}
+        copias = {"s": [o.to_dict() for o in overlays["s"]]}
+
+        def pico(obj):
+            tracemalloc.start()
+            try:
+                json_codec.dumps(obj)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        pico_copias = pico(copias)
+        # Copiar todos los servicios antes de serializar sumaría cerca de 5000 dicts de 20 campos
+        assert pico(overlays) - pico_copias < 200 * 1024
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services.correccion_agent import CorreccionAgent
+from app.services.llm_clients import close_llm_clients, get_llm_client, open_llm_clients
+from app.services.llm_matcher import LLMMatcher
+
+
+class TestLLMClients:
+    @pytest.mark.asyncio
+    async def test_client_is_shared(self):
+        open_llm_clients()
+        try:
+            client = get_llm_client(settings.llm_api_key, settings.llm_base_url)
+
+            assert LLMMatcher().client is client
+            assert LLMMatcher().client is client
+            assert get_llm_client(settings.llm_api_key, "http://otro/v1") is not client
+            if settings.kimi_base_url == settings.llm_base_url and not settings.kimi_api_key:
+                assert CorreccionAgent().client is client
+        finally:
+            await close_llm_clients()
+
+    @pytest.mark.asyncio
+    async def test_close_releases_clients(self):
+        client = get_llm_client("key", "http://llm/v1")
+        await close_llm_clients()
+
+        assert client.is_closed()
+        nuevo = get_llm_client("key", "http://llm/v1")
+        assert nuevo is not client
+        await close_llm_clients()
+
+    @pytest.mark.asyncio
+    async def test_clients_from_other_loop_are_closed(self, monkeypatch):
+        from app.services import llm_clients
+
+        anterior = get_llm_client("key", "http://llm/v1")
+        monkeypatch.setattr(llm_clients, "_clients_loop", object())  # otro event loop
+
+        nuevo = get_llm_client("key", "http://llm/v1")
+        await asyncio.sleep(0)
+
+        assert nuevo is not anterior
+        assert anterior.is_closed()
+        await close_llm_clients()
+
+    def test_injected_client_wins(self):
+        sentinel = object()
+        assert LLMMatcher(client=sentinel).client is sentinel
+        assert CorreccionAgent(client=sentinel).client is sentinel
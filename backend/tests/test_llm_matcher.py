@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.services.llm_matcher import LLMMatcher
-from app.models import LineaNC, ServicioRIPS, Confianza
+from app.services.llm_matcher import LLMMatcher, detect_equal_values
+from app.models import LineaNC, ServicioRIPS, Confianza, MatchResult
 
 
 class TestMatchByCode:
@@ -56,6 +56,55 @@ class TestMatchByCode:
         assert len(matches) == 0
         assert len(unmatched) == 1
 
+    def test_match_by_code_uses_first_unused_service(self):
+        matcher = LLMMatcher()
+
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=1000, descripcion="(A1) UNO", codigo_extraido="A1"),
+            LineaNC(id=2, cantidad=1, valor=3000, descripcion="(A1) DOS", codigo_extraido="A1"),
+            LineaNC(id=3, cantidad=1, valor=3000, descripcion="(A1) TRES", codigo_extraido="A1"),
+        ]
+
+        servicios = [
+            ServicioRIPS(tipo="procedimientos", codigo="A1", nombre="X", valor_unitario=1000, cantidad_original=1, datos_completos={}),
+            ServicioRIPS(tipo="consultas", codigo="B2", nombre="Y", valor_unitario=500, cantidad_original=1, datos_completos={}),
+            ServicioRIPS(tipo="medicamentos", codigo="A1", nombre="Z", valor_unitario=1500, cantidad_original=2, datos_completos={}),
+        ]
+
+        matches, unmatched = matcher._match_by_code(lineas, servicios)
+
+        assert [(m.linea_nc, m.tipo_servicio) for m in matches] == [(1, "procedimientos"), (2, "medicamentos")]
+        assert matches[1].cantidad_calculada == 2.0
+        assert [l.id for l in unmatched] == [3]
+
+
+class TestDetectEqualValues:
+    def test_detect_equal_values(self):
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=38900.0, descripcion="CONSULTA"),
+            LineaNC(id=2, cantidad=1, valor=1000.0, descripcion="MEDICAMENTO"),
+        ]
+        servicios = [
+            ServicioRIPS(tipo="medicamentos", codigo="890201", nombre="X", valor_unitario=1.0, cantidad_original=1, datos_completos={}),
+            ServicioRIPS(tipo="consultas", codigo="890201", nombre="CONSULTA", valor_unitario=38900.0, cantidad_original=1, datos_completos={}),
+            ServicioRIPS(tipo="medicamentos", codigo="M1", nombre="MED", valor_unitario=500.0, cantidad_original=4, datos_completos={}),
+        ]
+        matches = [
+            MatchResult(linea_nc=1, tipo_servicio="consultas", codigo_rips="890201", valor_nc=38900.0,
+                        valor_unitario_rips=38900.0, cantidad_calculada=1.0, confianza=Confianza.ALTA),
+            MatchResult(linea_nc=2, tipo_servicio="medicamentos", codigo_rips="M1", valor_nc=1000.0,
+                        valor_unitario_rips=500.0, cantidad_calculada=2.0, confianza=Confianza.ALTA),
+            MatchResult(linea_nc=9, tipo_servicio="consultas", codigo_rips="890201", valor_nc=38900.0,
+                        valor_unitario_rips=38900.0, cantidad_calculada=1.0, confianza=Confianza.ALTA),
+        ]
+
+        items = detect_equal_values(matches, lineas, servicios)
+
+        assert len(items) == 1
+        assert items[0].linea_nc == 1
+        assert items[0].tipo_servicio == "consultas"
+        assert items[0].valor_original == 38900.0
+
 
 class TestFallbackMatches:
     def test_fallback_similarity(self):
@@ -74,3 +123,215 @@ class TestFallbackMatches:
         assert len(matches) == 1
         assert matches[0].codigo_rips == "DM-INS-099"
         assert matches[0].confianza == Confianza.BAJA
+
+
+class TestPlanRequests:
+    def _servicios(self, n):
+        return [
+            ServicioRIPS(tipo="medicamentos", codigo=f"MED{i:04d}", nombre=f"MEDICAMENTO GENERICO {i} TABLETA",
+                         valor_unitario=100 + i, cantidad_original=1, datos_completos={})
+            for i in range(n)
+        ] + [
+            ServicioRIPS(tipo="otrosServicios", codigo="DM-INS-099", nombre="FRASCO PARA RECOLECCION DE ORINA",
+                         valor_unitario=795, cantidad_original=1, datos_completos={})
+        ]
+
+    def test_small_rips_goes_complete(self):
+        servicios = self._servicios(5)
+        lineas = [LineaNC(id=1, cantidad=1, valor=795, descripcion="FRASCO ORINA")]
+
+        solicitudes = LLMMatcher()._plan_requests(lineas, servicios)
+
+        assert len(solicitudes) == 1
+        assert solicitudes[0][1] == servicios
+
+    def test_large_rips_sends_top_candidates(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_prompt_token_budget', 2000)
+        monkeypatch.setattr(settings, 'llm_candidates_per_line', 5)
+        servicios = self._servicios(800)
+        lineas = [LineaNC(id=1, cantidad=1, valor=795, descripcion="FRASCO RECOLECCION ORINA (MED0042)")]
+
+        solicitudes = LLMMatcher()._plan_requests(lineas, servicios)
+
+        assert len(solicitudes) == 1
+        codigos = [s.codigo for s in solicitudes[0][1]]
+        assert len(codigos) == 5
+        assert codigos[0] == "MED0042"
+        assert "DM-INS-099" in codigos
+
+    def test_large_rips_reuses_given_index(self, monkeypatch):
+        from app.config import settings
+        from app.services import llm_matcher
+        from app.services.local_matcher import LocalMatcher
+        monkeypatch.setattr(settings, 'llm_prompt_token_budget', 2000)
+        servicios = self._servicios(800)
+        local = LocalMatcher(servicios)
+        lineas = [LineaNC(id=1, cantidad=1, valor=795, descripcion="FRASCO RECOLECCION ORINA")]
+
+        def sin_reindexar(*args, **kwargs):
+            raise AssertionError("el RIPS se indexó de nuevo")
+
+        monkeypatch.setattr(llm_matcher, 'LocalMatcher', sin_reindexar)
+        solicitudes = LLMMatcher()._plan_requests(lineas, servicios, local)
+
+        assert "DM-INS-099" in [s.codigo for s in solicitudes[0][1]]
+
+        local.usados[("otrosServicios", "DM-INS-099")] += 1
+        disponibles = servicios[:-1]
+        solicitudes = LLMMatcher()._plan_requests(lineas, disponibles, local)
+
+        assert "DM-INS-099" not in [s.codigo for s in solicitudes[0][1]]
+
+    def test_requests_are_split_by_lines_and_budget(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_prompt_token_budget', 1000)
+        monkeypatch.setattr(settings, 'llm_max_lines_per_request', 3)
+        servicios = self._servicios(800)
+        lineas = [
+            LineaNC(id=i, cantidad=1, valor=100 + i, descripcion=f"MEDICAMENTO GENERICO {i} TABLETA")
+            for i in range(1, 8)
+        ]
+
+        solicitudes = LLMMatcher()._plan_requests(lineas, servicios)
+
+        assert [l.id for lineas_s, _ in solicitudes for l in lineas_s] == list(range(1, 8))
+        assert all(len(lineas_s) <= 3 for lineas_s, _ in solicitudes)
+        for lineas_s, candidatos in solicitudes:
+            prompt = LLMMatcher()._build_prompt(lineas_s, candidatos)
+            assert len(prompt) // 4 < 1000
+
+    def test_small_rips_split_by_lines_keeps_all_services(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_max_lines_per_request', 2)
+        servicios = self._servicios(3)
+        lineas = [LineaNC(id=i, cantidad=1, valor=795, descripcion="FRASCO ORINA") for i in range(1, 6)]
+
+        solicitudes = LLMMatcher()._plan_requests(lineas, servicios)
+
+        assert [len(lineas_s) for lineas_s, _ in solicitudes] == [2, 2, 1]
+        assert all(candidatos == servicios for _, candidatos in solicitudes)
+
+
+def _respuesta(matches, finish_reason='stop'):
+    import json
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content=json.dumps({"matches": matches, "warnings": []})),
+                                  finish_reason=finish_reason)]
+    return response
+
+
+def _match(linea, codigo, confianza="media", tipo="medicamentos"):
+    return {"linea_nc": linea, "tipo_servicio": tipo, "codigo_rips": codigo, "valor_nc": 100,
+            "valor_unitario_rips": 100, "cantidad_calculada": 1, "confianza": confianza}
+
+
+class TestChunkedLLMMatching:
+    SERVICIOS = [
+        ServicioRIPS(tipo="medicamentos", codigo=c, nombre=f"PRODUCTO {c}", valor_unitario=100,
+                     cantidad_original=1, datos_completos={})
+        for c in ("A", "B", "C", "D")
+    ]
+
+    @pytest.fixture
+    def matcher(self, monkeypatch):
+        from app.config import settings
+        from app.services.match_cache import MatchCache
+        monkeypatch.setattr(settings, 'llm_max_lines_per_request', 1)
+        monkeypatch.setattr(settings, 'llm_retry_delay', 0)
+        matcher = LLMMatcher(cache=MatchCache(), use_local=False)
+        matcher.client = MagicMock()
+        return matcher
+
+    def _lineas(self, n):
+        return [LineaNC(id=i, cantidad=1, valor=100, descripcion=f"LINEA {i}") for i in range(1, n + 1)]
+
+    @staticmethod
+    def _linea_del_prompt(kwargs):
+        import re
+        return int(re.search(r"Línea (\d+):", kwargs['messages'][1]['content']).group(1))
+
+    @pytest.mark.asyncio
+    async def test_only_failed_chunk_is_retried(self, matcher):
+        intentos = {}
+
+        async def create(**kwargs):
+            linea = self._linea_del_prompt(kwargs)
+            intentos[linea] = intentos.get(linea, 0) + 1
+            if linea == 2 and intentos[linea] == 1:
+                raise RuntimeError("timeout")
+            return _respuesta([_match(linea, "ABC"[linea - 1])])
+
+        matcher.client.chat.completions.create = create
+        matches = await matcher._match_with_llm(self._lineas(3), self.SERVICIOS)
+
+        assert intentos == {1: 1, 2: 2, 3: 1}
+        assert [(m.linea_nc, m.codigo_rips) for m in matches] == [(1, "A"), (2, "B"), (3, "C")]
+        assert all(m.confianza == Confianza.MEDIA for m in matches)
+
+    @pytest.mark.asyncio
+    async def test_truncated_response_is_split(self, matcher, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_max_lines_per_request', 4)
+        tamanos = []
+
+        async def create(**kwargs):
+            import re
+            lineas = [int(x) for x in re.findall(r"Línea (\d+):", kwargs['messages'][1]['content'])]
+            tamanos.append(len(lineas))
+            if len(lineas) > 2:
+                return _respuesta([], finish_reason='length')
+            return _respuesta([_match(l, "ABCD"[l - 1]) for l in lineas])
+
+        matcher.client.chat.completions.create = create
+        matches = await matcher._match_with_llm(self._lineas(4), self.SERVICIOS)
+
+        assert tamanos == [4, 2, 2]
+        assert [m.codigo_rips for m in matches] == ["A", "B", "C", "D"]
+
+    @pytest.mark.asyncio
+    async def test_service_claimed_by_two_chunks_is_reassigned(self, matcher):
+        async def create(**kwargs):
+            linea = self._linea_del_prompt(kwargs)
+            if "PRODUCTO A" not in kwargs['messages'][1]['content']:
+                return _respuesta([_match(linea, "B")])
+            return _respuesta([_match(linea, "A", "alta" if linea == 2 else "media")])
+
+        matcher.client.chat.completions.create = create
+        matches = await matcher._match_with_llm(self._lineas(2), self.SERVICIOS)
+
+        assert [(m.linea_nc, m.codigo_rips) for m in matches] == [(1, "B"), (2, "A")]
+
+    @pytest.mark.asyncio
+    async def test_services_taken_before_are_not_offered(self, matcher):
+        from collections import Counter
+        prompts = []
+
+        async def create(**kwargs):
+            prompts.append(kwargs['messages'][1]['content'])
+            return _respuesta([_match(self._linea_del_prompt(kwargs), "A")])
+
+        matcher.client.chat.completions.create = create
+        matches = await matcher._match_with_llm(self._lineas(1), self.SERVICIOS, usados=Counter({("medicamentos", "A"): 1}))
+
+        assert prompts and all("PRODUCTO A" not in p for p in prompts)
+        assert "PRODUCTO B" in prompts[0]
+        assert all(m.codigo_rips != "A" for m in matches)
+
+    @pytest.mark.asyncio
+    async def test_service_matched_by_code_is_not_sent_to_llm(self, matcher):
+        prompts = []
+
+        async def create(**kwargs):
+            prompts.append(kwargs['messages'][1]['content'])
+            return _respuesta([_match(self._linea_del_prompt(kwargs), "B")])
+
+        matcher.client.chat.completions.create = create
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=100, descripcion="PRODUCTO (A)", codigo_extraido="A"),
+            LineaNC(id=2, cantidad=1, valor=100, descripcion="OTRA LINEA"),
+        ]
+        respuesta = await matcher.match_services(lineas, self.SERVICIOS)
+
+        assert [(m.linea_nc, m.codigo_rips) for m in respuesta.matches] == [(1, "A"), (2, "B")]
+        assert len(prompts) == 1 and "PRODUCTO A" not in prompts[0]
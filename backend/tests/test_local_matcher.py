@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models import LineaNC, ServicioRIPS, Confianza
+from app.services.llm_matcher import LLMMatcher
+from app.services.local_matcher import LocalMatcher, valor_score
+from app.services.match_cache import MatchCache
+
+
+def _servicio(tipo, codigo, nombre, valor_unitario):
+    return ServicioRIPS(tipo=tipo, codigo=codigo, nombre=nombre, valor_unitario=valor_unitario, cantidad_original=1, datos_completos={})
+
+
+SERVICIOS = [
+    _servicio("otrosServicios", "DM-INS-099", "FRASCO PARA RECOLECCION DE ORINA", 795),
+    _servicio("medicamentos", "19943544", "PRESERVATIVOS", 500),
+    _servicio("medicamentos", "20000", "ACETAMINOFEN 500 MG TABLETA", 120),
+    _servicio("medicamentos", "20001", "ACETAMINOFEN 150 MG JARABE", 3000),
+    _servicio("procedimientos", "903841", "GLUCOSA EN SUERO U OTRO FLUIDO", 8000),
+]
+
+
+class TestLocalMatcher:
+    def test_valor_score(self):
+        assert valor_score(1590, 795) == 1.0
+        assert 0.99 < valor_score(1590.5, 795) < 1.0
+        assert valor_score(1000, 800) == pytest.approx(0.5)  # a 1/4 de unidad del múltiplo
+        assert valor_score(1200, 800) == 0.0  # a media unidad
+        assert valor_score(500, 795) == pytest.approx(1 - 2 * 295 / 795)
+        assert valor_score(100, 0) == 0.0
+
+    def test_accepts_clear_match(self):
+        lineas = [LineaNC(id=1, cantidad=2, valor=1590, descripcion="FRASCO RECOLECCIÓN ORINA")]
+
+        matches, ambiguas = LocalMatcher(SERVICIOS).match(lineas)
+
+        assert ambiguas == []
+        assert matches[0].codigo_rips == "DM-INS-099"
+        assert matches[0].cantidad_calculada == 2.0
+        assert matches[0].confianza in (Confianza.ALTA, Confianza.MEDIA)
+
+    def test_escalates_ambiguous_and_unknown_lines(self):
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=3000, descripcion="ACETAMINOFEN"),
+            LineaNC(id=2, cantidad=1, valor=30000, descripcion="CONSULTA MEDICINA GENERAL"),
+        ]
+
+        matches, ambiguas = LocalMatcher(SERVICIOS).match(lineas)
+
+        assert matches == []
+        assert [l.id for l in ambiguas] == [1, 2]
+
+    def test_duplicated_services_are_not_ambiguous(self):
+        servicios = SERVICIOS + [_servicio("medicamentos", "19943544", "PRESERVATIVOS", 500)]
+        lineas = [LineaNC(id=1, cantidad=4, valor=2000, descripcion="PRESERVATIVO")]
+
+        matches, ambiguas = LocalMatcher(servicios).match(lineas)
+
+        assert [m.codigo_rips for m in matches] == ["19943544"]
+
+
+    def test_used_services_are_not_reassigned(self):
+        from collections import Counter
+
+        lineas = [
+            LineaNC(id=1, cantidad=2, valor=1590, descripcion="FRASCO RECOLECCION ORINA"),
+            LineaNC(id=2, cantidad=1, valor=795, descripcion="FRASCO PARA RECOLECCION DE ORINA"),
+        ]
+        matches, ambiguas = LocalMatcher(SERVICIOS).match(lineas)
+        assert [m.linea_nc for m in matches] == [1]
+        assert [l.id for l in ambiguas] == [2]
+
+        usados = Counter({("otrosServicios", "DM-INS-099"): 1})
+        matches, ambiguas = LocalMatcher(SERVICIOS, usados=usados).match(lineas[:1])
+        assert matches == []
+        assert usados[("otrosServicios", "DM-INS-099")] == 1
+
+
+class TestMatcherLocalTier:
+    @pytest.mark.asyncio
+    async def test_only_ambiguous_lines_reach_llm(self):
+        matcher = LLMMatcher(cache=MatchCache(), use_local=True)
+        response = MagicMock()
+        response.choices = [MagicMock(message=MagicMock(content='{"matches": [], "warnings": []}'))]
+        matcher.client = MagicMock()
+        matcher.client.chat.completions.create = AsyncMock(return_value=response)
+        lineas = [
+            LineaNC(id=1, cantidad=2, valor=1590, descripcion="FRASCO RECOLECCION ORINA"),
+            LineaNC(id=2, cantidad=1, valor=3000, descripcion="ACETAMINOFEN"),
+        ]
+
+        result = await matcher.match_services(lineas, SERVICIOS)
+
+        assert [m.linea_nc for m in result.matches] == [1]
+        prompt = matcher.client.chat.completions.create.await_args.kwargs['messages'][1]['content']
+        assert "Línea 2:" in prompt
+        assert "Línea 1:" not in prompt
+
+    @pytest.mark.asyncio
+    async def test_services_taken_by_code_are_not_matched_locally(self):
+        matcher = LLMMatcher(cache=MatchCache(), use_local=True)
+        response = MagicMock()
+        response.choices = [MagicMock(message=MagicMock(content='{"matches": [], "warnings": []}'))]
+        matcher.client = MagicMock()
+        matcher.client.chat.completions.create = AsyncMock(return_value=response)
+        lineas = [
+            LineaNC(id=1, cantidad=1, valor=795, descripcion="FRASCO ORINA (DM-INS-099)"),
+            LineaNC(id=2, cantidad=1, valor=795, descripcion="FRASCO RECOLECCION ORINA"),
+        ]
+
+        result = await matcher.match_services(lineas, SERVICIOS)
+
+        assert [(m.linea_nc, m.codigo_rips) for m in result.matches] == [(1, "DM-INS-099")]
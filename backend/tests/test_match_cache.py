@@ -0,0 +1,149 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models import LineaNC, ServicioRIPS, Confianza
+from app.services import match_cache as match_cache_module
+from app.services.llm_matcher import LLMMatcher
+from app.services.match_cache import MatchCache, normalize_descripcion
+
+
+SERVICIOS = [
+    ServicioRIPS(tipo="otrosServicios", codigo="DM-INS-099", nombre="FRASCO PARA RECOLECCION DE ORINA", valor_unitario=795, cantidad_original=1, datos_completos={}),
+    ServicioRIPS(tipo="medicamentos", codigo="19943544", nombre="PRESERVATIVOS", valor_unitario=500, cantidad_original=10, datos_completos={}),
+]
+
+RESPUESTA_LLM = '''{"matches": [{"linea_nc": 1, "tipo_servicio": "otrosServicios", "codigo_rips": "DM-INS-099",
+"valor_nc": 1590, "valor_unitario_rips": 795, "cantidad_calculada": 2, "confianza": "media"}], "warnings": []}'''
+
+
+def _mock_client(content: str) -> MagicMock:
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content=content))]
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=response)
+    return client
+
+
+class TestMatchCache:
+    def test_normalize(self):
+        assert normalize_descripcion("  Frasco  RECOLECCIÓN, orina ") == "frasco recoleccion orina"
+
+    def test_get_put_and_counters(self):
+        cache = MatchCache()
+        assert cache.get("FRASCO ORINA") is None
+        cache.put("FRASCO ORINA", "otrosServicios", "DM-INS-099", "media")
+
+        assert cache.get("frasco   orina", {("otrosServicios", "DM-INS-099")}) == ("otrosServicios", "DM-INS-099", "media")
+        assert cache.get("FRASCO ORINA", {("otrosServicios", "OTRO")}) is None
+        stats = cache.stats()
+        assert stats['entries'] == 1
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+        assert stats['hit_rate'] == round(1 / 3, 4)
+
+    def test_lru_eviction(self, monkeypatch):
+        reloj = iter(range(100, 200))
+        monkeypatch.setattr(match_cache_module.time, 'time', lambda: next(reloj))
+        cache = MatchCache(max_entries=2)
+        cache.put("a", "consultas", "1", "alta")
+        cache.put("b", "consultas", "2", "alta")
+        assert cache.get("a") is not None  # 'a' pasa a ser la más reciente
+        cache.put("c", "consultas", "3", "alta")
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()['evictions'] == 1
+
+    def test_eviction_runs_in_batches(self, monkeypatch):
+        cache = MatchCache(max_entries=1000)
+        podas = []
+        original = cache._evict
+        monkeypatch.setattr(cache, '_evict', lambda: podas.append(1) or original())
+        for i in range(1005):
+            cache.put(f"linea {i}", "consultas", str(i), "alta")
+
+        assert len(podas) == 100  # cada 10 escrituras (1% de max_entries)
+        assert 1000 <= cache.stats()['entries'] < 1010  # hasta una tanda por encima del límite
+
+    def test_ttl_expiry(self, monkeypatch):
+        ahora = [1000.0]
+        monkeypatch.setattr(match_cache_module.time, 'time', lambda: ahora[0])
+        cache = MatchCache(ttl_seconds=60)
+        cache.put("a", "consultas", "1", "alta")
+        ahora[0] += 61
+
+        assert cache.get("a") is None
+        assert cache.stats()['expired'] == 1
+        assert cache.stats()['entries'] == 0
+
+    def test_invalidate_and_persistence(self, tmp_path):
+        path = tmp_path / "matches.sqlite"
+        cache = MatchCache(path=path)
+        cache.put("FRASCO ORINA", "otrosServicios", "DM-INS-099", "media")
+        cache.put("FRASCO ORINA", "otrosServicios", "DM-INS-100", "media")
+        cache.put("PRESERVATIVOS", "medicamentos", "19943544", "alta")
+
+        reloaded = MatchCache(path=path)
+        assert reloaded.get("PRESERVATIVOS") == ("medicamentos", "19943544", "alta")
+        assert reloaded.get("FRASCO ORINA", {("otrosServicios", "DM-INS-100")})[1] == "DM-INS-100"
+        assert reloaded.invalidate("frasco orina") == 2
+        assert reloaded.get("FRASCO ORINA") is None
+        assert reloaded.stats()['persistente'] is True
+
+    def test_disabled(self):
+        cache = MatchCache(max_entries=0)
+        cache.put("a", "consultas", "1", "alta")
+        assert cache.get("a") is None
+        assert cache.stats()['entries'] == 0
+
+
+class TestMatcherUsesCache:
+    @pytest.mark.asyncio
+    async def test_repeated_description_skips_llm(self):
+        cache = MatchCache()
+        matcher = LLMMatcher(cache=cache, use_local=False)
+        matcher.client = _mock_client(RESPUESTA_LLM)
+        lineas = [LineaNC(id=1, cantidad=2, valor=1590, descripcion="FRASCO RECOLECCION ORINA X2")]
+
+        first = await matcher.match_services(lineas, SERVICIOS)
+        lineas_otra_nc = [LineaNC(id=7, cantidad=1, valor=795, descripcion="frasco recoleccion orina x2")]
+        second = await matcher.match_services(lineas_otra_nc, SERVICIOS)
+
+        assert matcher.client.chat.completions.create.await_count == 1
+        assert first.matches[0].codigo_rips == second.matches[0].codigo_rips == "DM-INS-099"
+        assert second.matches[0].linea_nc == 7
+        assert second.matches[0].cantidad_calculada == 1.0
+        assert second.matches[0].confianza == Confianza.MEDIA
+
+    @pytest.mark.asyncio
+    async def test_reused_across_facturas_with_other_services(self):
+        cache = MatchCache()
+        matcher = LLMMatcher(cache=cache, use_local=False)
+        matcher.client = _mock_client(RESPUESTA_LLM)
+        await matcher.match_services(
+            [LineaNC(id=1, cantidad=2, valor=1590, descripcion="FRASCO RECOLECCION ORINA X2")], SERVICIOS
+        )
+
+        otra_factura = SERVICIOS[:1] + [
+            ServicioRIPS(tipo="consultas", codigo="890201", nombre="CONSULTA", valor_unitario=30000, cantidad_original=1, datos_completos={})
+        ]
+        result = await matcher.match_services(
+            [LineaNC(id=3, cantidad=1, valor=795, descripcion="Frasco recolección orina x2")], otra_factura
+        )
+
+        assert matcher.client.chat.completions.create.await_count == 1
+        assert result.matches[0].codigo_rips == "DM-INS-099"
+
+    @pytest.mark.asyncio
+    async def test_fallback_matches_are_not_cached(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_retry_delay', 0)
+        cache = MatchCache()
+        matcher = LLMMatcher(cache=cache, use_local=False)
+        matcher.client = _mock_client("no es json")
+        lineas = [LineaNC(id=1, cantidad=1, valor=795, descripcion="FRASCO RECOLECCION ORINA")]
+
+        result = await matcher.match_services(lineas, SERVICIOS)
+
+        assert result.matches[0].confianza == Confianza.BAJA
+        assert cache.stats()['stores'] == 0
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.models import NCPayload
+from app.services.ministerio_service import MinisterioService
+
+
+def _service(handler) -> MinisterioService:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return MinisterioService(client=client)
+
+
+class TestEnviarNC:
+    @pytest.mark.asyncio
+    async def test_400_con_resultados_validacion_se_parsea(self):
+        def handler(request):
+            return httpx.Response(400, json={
+                "ResultState": False,
+                "ResultadosValidacion": [{
+                    "Clase": "RECHAZADO",
+                    "Codigo": "RVC019",
+                    "Descripcion": "Valor no coincide",
+                    "Fuente": "Rips"
+                }]
+            })
+
+        service = _service(handler)
+        result = await service.enviar_nc(NCPayload(rips={}, xmlFevFile="eA=="), "token")
+
+        assert result.success is False
+        assert len(result.errores) == 1
+        assert result.errores[0].Codigo == "RVC019"
+
+    @pytest.mark.asyncio
+    async def test_401_propaga_http_status_error(self):
+        def handler(request):
+            return httpx.Response(401, json={"message": "Unauthorized"})
+
+        service = _service(handler)
+        with pytest.raises(httpx.HTTPStatusError) as exc:
+            await service.enviar_nc(NCPayload(rips={}, xmlFevFile="eA=="), "token")
+        assert exc.value.response.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_envios_concurrentes_se_solapan(self):
+        async def handler(request):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={
+                "ResultState": True,
+                "CodigoUnicoValidacion": "abc",
+                "ResultadosValidacion": []
+            })
+
+        service = _service(handler)
+        payload = NCPayload(rips={}, xmlFevFile="eA==")
+
+        inicio = time.perf_counter()
+        results = await asyncio.gather(*[service.enviar_nc(payload, "token") for _ in range(5)])
+        duracion = time.perf_counter() - inicio
+
+        assert all(r.success for r in results)
+        assert duracion < 0.2 * 5 / 2
+
+    @pytest.mark.asyncio
+    async def test_enviar_nc_xml_cuerpo_igual_a_json(self):
+        import base64
+
+        bodies = []
+
+        def handler(request):
+            bodies.append((request.headers, request.content))
+            return httpx.Response(200, json={
+                "ResultState": True,
+                "CodigoUnicoValidacion": "abc",
+                "ResultadosValidacion": []
+            })
+
+        # Más grande que un bloque de codificación y con caracteres no ASCII
+        xml = ("<CreditNote>Señal ñ" + "x" * 100_000 + "</CreditNote>").encode("utf-8")
+        rips = {"numNota": "NC1", "usuarios": [{"nombre": "José"}]}
+
+        service = _service(handler)
+        result = await service.enviar_nc_xml(rips, xml, "token")
+        await service.enviar_nc(NCPayload(rips=rips, xmlFevFile=base64.b64encode(xml).decode()), "token")
+
+        assert result.success is True
+        (headers_xml, body_xml), (_, body_json) = bodies
+        assert body_xml == body_json
+        assert int(headers_xml["content-length"]) == len(body_xml)
+        assert "transfer-encoding" not in headers_xml
+
+    @pytest.mark.asyncio
+    async def test_enviar_nc_xml_con_rips_serializado(self):
+        from app.processors import json_codec
+
+        bodies = []
+
+        def handler(request):
+            bodies.append(request.content)
+            return httpx.Response(200, json={"ResultState": True, "ResultadosValidacion": []})
+
+        rips = {"numNota": "NC1", "usuarios": [{"nombre": "José"}]}
+        xml = b"<CreditNote/>"
+
+        service = _service(handler)
+        await service.enviar_nc_xml(rips, xml, "token")
+        await service.enviar_nc_xml(json_codec.dumps(rips), xml, "token")
+
+        assert bodies[0] == bodies[1]
+        assert json_codec.loads(bodies[0])["rips"] == rips
+
+
+class TestHttpClient:
+    @pytest.mark.asyncio
+    async def test_cliente_reemplazado_se_cierra(self, monkeypatch):
+        from app.services import ministerio_service
+
+        anterior = httpx.AsyncClient()
+        monkeypatch.setattr(ministerio_service, "_http_client", anterior)
+        monkeypatch.setattr(ministerio_service, "_http_client_loop", object())  # otro event loop
+
+        client = ministerio_service.get_http_client()
+        await asyncio.sleep(0)
+
+        assert client is not anterior
+        assert client.follow_redirects
+        assert anterior.is_closed
+        await ministerio_service.close_http_client()
@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+import pytest
+
+from app.processors.money import format_cents, from_cents, montos_iguales, sum_cents, to_cents
+
+
+class TestToCents:
+    @pytest.mark.parametrize("value,expected", [
+        ("38900", 3890000),
+        ("38900.00", 3890000),
+        ("38900.0000", 3890000),
+        (" 12.345 ", 1235),
+        ("-1.005", -101),
+        (".5", 50),
+        ("1e3", 100000),
+        (b"2000.00", 200000),
+        (12, 1200),
+        (0.285, 29),
+        (1.005, 101),
+        (Decimal("0.125"), 13),
+        (None, 0),
+    ])
+    def test_values(self, value, expected):
+        assert to_cents(value) == expected
+
+    @pytest.mark.parametrize("value", ["abc", "", "1.2.3", "-"])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            to_cents(value)
+
+    def test_bool_is_rejected(self):
+        with pytest.raises(TypeError):
+            to_cents(True)
+
+
+def test_sum_is_exact():
+    valores = [0.1] * 10
+    assert sum(valores) != 1.0
+    assert sum_cents(valores) == 100
+    assert from_cents(sum_cents(valores)) == 1.0
+
+
+def test_format_and_compare():
+    assert format_cents(123456) == "1234.56"
+    assert format_cents(-5) == "-0.05"
+    assert format_cents(0) == "0.00"
+    assert montos_iguales(500, "500.00")
+    assert not montos_iguales(500, 500.01)
+
+
+def test_float_matches_decimal_rounding():
+    import random
+    from decimal import ROUND_HALF_UP
+
+    rng = random.Random(13)
+    for _ in range(20000):
+        value = round(rng.uniform(-1e12, 1e12) / 10 ** rng.randint(0, 8), rng.randint(0, 4))
+        expected = int((Decimal(repr(value)) * 100).to_integral_value(ROUND_HALF_UP))
+        assert to_cents(value) == expected
+        assert to_cents(repr(value)) == expected
@@ -0,0 +1,124 @@
+import httpx
+import openai
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.llm_clients import create_chat_completion
+from app.services.rate_limiter import TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+def _limiter(clock, **kwargs):
+    return TokenBucketLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def _rate_limit_error(retry_after="2"):
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class TestTokenBucketLimiter:
+    @pytest.mark.asyncio
+    async def test_burst_then_rate(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_second=2, burst=2)
+
+        for _ in range(4):
+            await limiter.acquire()
+
+        assert clock.sleeps == [0.5, 0.5]
+        stats = limiter.stats()
+        assert stats['acquired'] == 4
+        assert stats['waited'] == 2
+        assert stats['wait_total_s'] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_tokens_per_minute(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_second=0, tokens_per_minute=600)
+
+        await limiter.acquire(600)
+        await limiter.acquire(100)
+
+        assert clock.sleeps == [10.0]
+
+    @pytest.mark.asyncio
+    async def test_penalize_respects_retry_after_and_recovers(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_second=10, burst=1)
+        await limiter.acquire()
+
+        limiter.penalize(retry_after=3)
+        await limiter.acquire()
+
+        assert clock.sleeps == [3.0]
+        assert limiter.factor == 0.5
+        assert limiter.stats()['throttled'] == 1
+        for _ in range(20):
+            limiter.reward()
+        assert limiter.factor == 1.0
+
+
+class TestCreateChatCompletion:
+    @pytest.mark.asyncio
+    async def test_retries_after_429(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_second=100, burst=10)
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(side_effect=[_rate_limit_error("2"), "ok"])
+
+        response = await create_chat_completion(
+            client, messages=[{"role": "user", "content": "hola"}], limiter=limiter, model="m"
+        )
+
+        assert response == "ok"
+        assert client.chat.completions.create.await_count == 2
+        assert clock.sleeps == [2.0]
+        assert limiter.stats()['throttled'] == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_5xx(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_retry_delay', 0)
+        request = httpx.Request("POST", "http://llm/v1/chat/completions")
+        error = openai.InternalServerError("bad gateway", response=httpx.Response(502, request=request), body=None)
+        limiter = _limiter(FakeClock(), requests_per_second=100, burst=10)
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(side_effect=[error, openai.APIConnectionError(request=request), "ok"])
+
+        response = await create_chat_completion(
+            client, messages=[{"role": "user", "content": "hola"}], limiter=limiter, model="m"
+        )
+
+        assert response == "ok"
+        assert client.chat.completions.create.await_count == 3
+        assert limiter.stats()['throttled'] == 0
+
+    @pytest.mark.asyncio
+    async def test_transient_errors_give_up_after_retries(self, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, 'llm_retry_delay', 0)
+        monkeypatch.setattr(settings, 'llm_transient_retries', 1)
+        request = httpx.Request("POST", "http://llm/v1/chat/completions")
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(side_effect=openai.APITimeoutError(request=request))
+
+        with pytest.raises(openai.APITimeoutError):
+            await create_chat_completion(
+                client, messages=[{"role": "user", "content": "hola"}],
+                limiter=_limiter(FakeClock(), requests_per_second=100, burst=10), model="m"
+            )
+        assert client.chat.completions.create.await_count == 2
@@ -139,3 +139,130 @@ class TestGenerateNCRIPS:
 
         total = RIPSProcessor.calculate_total(rips_data)
         assert total == 2897.0
+
+
+def _legacy_generate_nc_rips(rips_data, matches, codigos_igualados_a_cero=None):
+    """Versión anterior (recorrido por usuario y match) para comparar resultados."""
+    campos = {'medicamentos': 'codTecnologiaSalud', 'otrosServicios': 'codTecnologiaSalud',
+              'procedimientos': 'codProcedimiento', 'consultas': 'codConsulta'}
+    by_type = {}
+    for match in matches:
+        by_type.setdefault(match['tipo_servicio'], []).append(match)
+    usuarios = []
+    for usuario in rips_data['usuarios']:
+        servicios = {}
+        for tipo, tipo_matches in by_type.items():
+            result = []
+            for match in tipo_matches:
+                for original in usuario['servicios'].get(tipo, []):
+                    if original.get(campos[tipo]) == match['codigo_rips']:
+                        nuevo = dict(original)
+                        if codigos_igualados_a_cero and match['codigo_rips'] in codigos_igualados_a_cero:
+                            nuevo['vrServicio'] = 0
+                        else:
+                            nuevo['vrServicio'] = match['valor_nc']
+                        nuevo['consecutivo'] = len(result) + 1
+                        result.append(nuevo)
+                        break
+            servicios[tipo] = result
+        if any(servicios.values()):
+            usuarios.append((usuario['numDocumentoIdentificacion'], servicios))
+    return usuarios
+
+
+class TestServiceTable:
+    def _rips(self):
+        def usuario(doc, procs, cons):
+            return {
+                "numDocumentoIdentificacion": doc,
+                "servicios": {
+                    "procedimientos": [{"codProcedimiento": c, "vrServicio": 100, "n": i} for i, c in enumerate(procs)],
+                    "consultas": [{"codConsulta": c, "vrServicio": 50} for c in cons],
+                }
+            }
+        return {"usuarios": [
+            usuario("1", ["903816", "903841", "903816"], ["890201"]),
+            usuario("2", ["903841"], []),
+            usuario("3", [], ["890201", "890301"]),
+            usuario("4", ["999999"], []),
+        ]}
+
+    def test_index_keeps_rips_order(self):
+        rips_data = self._rips()
+        catalogo = RIPSProcessor.get_all_services(rips_data)
+
+        assert len(catalogo) == 8
+        assert catalogo.indice[('procedimientos', '903816')] == [(0, 0), (0, 2)]
+        assert catalogo.indice[('procedimientos', '903841')] == [(0, 1), (1, 0)]
+        assert catalogo.indice[('consultas', '890201')] == [(0, 0), (2, 0)]
+
+    def test_generate_matches_legacy(self):
+        rips_data = self._rips()
+        matches = [
+            {'tipo_servicio': 'procedimientos', 'codigo_rips': '903841', 'valor_nc': 10},
+            {'tipo_servicio': 'consultas', 'codigo_rips': '890201', 'valor_nc': 20},
+            {'tipo_servicio': 'procedimientos', 'codigo_rips': '903816', 'valor_nc': 30},
+            {'tipo_servicio': 'procedimientos', 'codigo_rips': '903816', 'valor_nc': 40},
+            {'tipo_servicio': 'consultas', 'codigo_rips': 'NOEXISTE', 'valor_nc': 5},
+        ]
+        catalogo = RIPSProcessor.get_all_services(rips_data)
+
+        for codigos in (None, {'890201'}):
+            expected = _legacy_generate_nc_rips(rips_data, matches, codigos)
+            for kwargs in ({}, {'catalogo': catalogo}):
+                result = RIPSProcessor.generate_nc_rips(
+                    rips_data, 'NC1', matches, codigos_igualados_a_cero=codigos, **kwargs
+                )
+                actual = [(u['numDocumentoIdentificacion'], u['servicios']) for u in result['usuarios']]
+                assert actual == expected
+
+    def test_catalog_from_other_rips_is_ignored(self):
+        rips_data = self._rips()
+        otro = RIPSProcessor.get_all_services({"usuarios": []})
+        matches = [{'tipo_servicio': 'consultas', 'codigo_rips': '890301', 'valor_nc': 7}]
+
+        result = RIPSProcessor.generate_nc_rips(rips_data, 'NC1', matches, catalogo=otro)
+
+        assert [u['numDocumentoIdentificacion'] for u in result['usuarios']] == ['3']
+        assert result['usuarios'][0]['servicios']['consultas'][0]['vrServicio'] == 7
+
+    def test_rows_read_source_json(self):
+        rips_data = {"usuarios": [{"servicios": {
+            "medicamentos": [{"codTecnologiaSalud": "M1", "nomTecnologiaSalud": "Med1",
+                              "vrUnitMedicamento": "100.5", "cantidadMedicamento": 3}],
+            "consultas": [{"codConsulta": "890201", "descripcion": "Consulta", "vrServicio": 50}],
+        }}]}
+
+        table = RIPSProcessor.get_all_services(rips_data)
+        med, cons = table
+
+        assert (med.tipo, med.codigo, med.nombre) == ('medicamentos', 'M1', 'Med1')
+        assert (med.valor_unitario, med.cantidad_original) == (100.5, 3.0)
+        assert med.datos_completos is rips_data['usuarios'][0]['servicios']['medicamentos'][0]
+        assert (cons.tipo, cons.cantidad_original) == ('consultas', 1.0)
+        assert table[-1].codigo == '890201'
+
+        models = table.to_models()
+        assert [m.codigo for m in models] == ['M1', '890201']
+        assert models[1].nombre == 'Consulta'
+
+
+class TestCalculateTotals:
+    def test_breakdown_in_cents(self):
+        rips_data = {"usuarios": [
+            {"numDocumentoIdentificacion": "1", "servicios": {
+                "medicamentos": [{"vrServicio": 0.1}, {"vrServicio": 0.2}],
+                "consultas": [{"vrServicio": "35000.50"}],
+            }},
+            {"numDocumentoIdentificacion": "2", "servicios": {
+                "consultas": [{"vrServicio": 100}],
+                "urgencias": [{}],
+            }},
+        ]}
+
+        totales = RIPSProcessor.calculate_totals(rips_data)
+
+        assert totales.total == 3510080
+        assert totales.por_tipo == {'medicamentos': 30, 'consultas': 3510050, 'urgencias': 0}
+        assert totales.por_usuario == [('1', 3500080), ('2', 10000)]
+        assert RIPSProcessor.calculate_total(rips_data) == 35100.80
@@ -0,0 +1,114 @@
+import io
+import json
+
+import pytest
+
+from app.processors.rips_processor import RIPSProcessor
+from app.processors.rips_stream import RIPSStream, _JSONScanner
+
+
+def _rips(n_usuarios=5):
+    return {
+        "numDocumentoIdObligado": "817000162",
+        "numFactura": "HMD73787",
+        "usuarios": [
+            {
+                "numDocumentoIdentificacion": str(1000 + u),
+                "consecutivo": u + 1,
+                "servicios": {
+                    "medicamentos": [{
+                        "codTecnologiaSalud": f"M{u % 3}",
+                        "nomTecnologiaSalud": "MEDICAMENTO ñandú",
+                        "vrUnitMedicamento": 123456.75,
+                        "cantidadMedicamento": 2,
+                        "vrServicio": 246913.5
+                    }],
+                    "procedimientos": [
+                        {"codProcedimiento": "903816", "descripcion": "LDL", "vrServicio": 12000 + u},
+                        {"codProcedimiento": "903841", "descripcion": "GLUCOSA", "vrServicio": 5000},
+                    ],
+                }
+            }
+            for u in range(n_usuarios)
+        ],
+    }
+
+
+class TestRIPSStream:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+    def test_usuarios_match_json_loads(self, chunk_size):
+        data = _rips()
+        stream = RIPSStream.from_bytes(json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'), chunk_size)
+
+        assert stream.get('numFactura') == 'HMD73787'
+        assert list(stream.usuarios()) == data['usuarios']
+        # Cada recorrido vuelve a leer desde el inicio
+        assert stream.usuario(3) == data['usuarios'][3]
+
+    def test_header_after_usuarios_and_bom(self):
+        raw = ('\ufeff{"usuarios": [{"consecutivo": 1}, {"consecutivo": 2}], '
+               '"numFactura": "HMD1", "numDocumentoIdObligado": "900"}').encode('utf-8')
+        stream = RIPSStream.from_bytes(raw, chunk_size=5)
+
+        assert stream.header == {"numFactura": "HMD1", "numDocumentoIdObligado": "900"}
+        assert [u['consecutivo'] for u in stream.usuarios()] == [1, 2]
+
+    def test_empty_and_invalid(self):
+        assert list(RIPSStream.from_bytes(b'{"numFactura": "X", "usuarios": []}').usuarios()) == []
+        with pytest.raises(json.JSONDecodeError):
+            list(RIPSStream.from_bytes(b'{"numFactura": "X", "numDocumentoIdObligado": "1", '
+                                       b'"usuarios": [{"a": 1} {"b": 2}]}').usuarios())
+
+    def test_invalid_json_stops_reading(self):
+        class Counting:
+            def __init__(self, data):
+                self._data = io.BytesIO(data)
+                self.read_bytes = 0
+
+            def read(self, n):
+                data = self._data.read(n)
+                self.read_bytes += len(data)
+                return data
+
+        cuerpo = b'{"numFactura": "X", "numDocumentoIdObligado": "1", "usuarios": [{"a": 1 "b": 2}'
+        stream = Counting(cuerpo + b' ' * (1 << 20) + b']}')
+        with pytest.raises(json.JSONDecodeError):
+            _JSONScanner(stream, 64).value()
+        assert stream.read_bytes < 1024
+
+    def test_unterminated_value_is_capped(self):
+        raw = b'"' + b'x' * 10000
+        with pytest.raises(json.JSONDecodeError):
+            _JSONScanner(io.BytesIO(raw), 16, max_value_size=256).value()
+
+    def test_from_path(self, tmp_path):
+        path = tmp_path / "RIPS.json"
+        path.write_text(json.dumps(_rips(2)), encoding='utf-8')
+
+        stream = RIPSStream.from_path(path, chunk_size=16)
+
+        assert [u['consecutivo'] for u in stream.usuarios()] == [1, 2]
+
+
+class TestRIPSProcessorOnStream:
+    def test_services_total_and_nc_rips_match_in_memory(self):
+        data = _rips(20)
+        stream = RIPSStream.from_bytes(json.dumps(data).encode('utf-8'), chunk_size=32)
+        matches = [
+            {'tipo_servicio': 'procedimientos', 'codigo_rips': '903816', 'valor_nc': 100},
+            {'tipo_servicio': 'medicamentos', 'codigo_rips': 'M1', 'valor_nc': 50},
+        ]
+
+        table = RIPSProcessor.get_all_services(stream)
+        expected = RIPSProcessor.get_all_services(data)
+
+        assert table.usuarios is None
+        assert [(s.tipo, s.codigo, s.nombre, s.valor_unitario) for s in table] == \
+            [(s.tipo, s.codigo, s.nombre, s.valor_unitario) for s in expected]
+        assert table[5].datos_completos == expected[5].datos_completos
+        assert RIPSProcessor.calculate_total(stream) == RIPSProcessor.calculate_total(data)
+
+        nc_stream = RIPSProcessor.generate_nc_rips(stream, 'NC1', matches, True, {'M1'}, catalogo=table)
+        nc_memory = RIPSProcessor.generate_nc_rips(data, 'NC1', matches, True, {'M1'})
+        assert nc_stream == nc_memory
+        assert nc_stream['numFactura'] == 'HMD73787'
@@ -0,0 +1,92 @@
+from app.processors.section_cache import SectionCache
+from app.processors.ubl_document import ParsedUBLDocument
+from app.processors.xml_processor import XMLProcessor
+from app.processors import xml_processor
+
+
+FACTURA = '''<root><![CDATA[<Invoice>
+  <ext:UBLExtension>
+    <ext:ExtensionContent>
+      <CustomTagGeneral>
+        <Interoperabilidad><Name>COBERTURA_PLAN_BENEFICIOS</Name><Value schemeID="01">X</Value></Interoperabilidad>
+      </CustomTagGeneral>
+    </ext:ExtensionContent>
+  </ext:UBLExtension>
+  <cac:InvoicePeriod><cbc:StartDate>2025-01-01</cbc:StartDate></cac:InvoicePeriod>
+</Invoice>]]></root>'''
+
+
+class TestSectionCache:
+    def test_lru_eviction_and_counters(self):
+        cache = SectionCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1  # 'a' pasa a ser la más reciente
+        cache.put('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        stats = cache.stats()
+        assert stats['entries'] == 2
+        assert stats['evictions'] == 1
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+
+    def test_none_values_are_cached(self):
+        cache = SectionCache(max_entries=4)
+        calls = []
+        for _ in range(3):
+            cache.get_or_compute('k', lambda: calls.append(1))
+        assert len(calls) == 1
+
+    def test_disk_persistence(self, tmp_path):
+        SectionCache(max_entries=4, persist_dir=tmp_path).put('secciones:abc', ['i', None])
+
+        reloaded = SectionCache(max_entries=4, persist_dir=tmp_path)
+        assert reloaded.get('secciones:abc') == ['i', None]
+        assert reloaded.stats()['disk_hits'] == 1
+
+    def test_disk_tier_is_bounded(self, tmp_path):
+        import os
+
+        cache = SectionCache(max_entries=0, persist_dir=tmp_path, max_disk_entries=10)
+        for i in range(10):
+            cache.put(f'k{i}', i)
+            os.utime(tmp_path / f'k{i}.json', (i, i))
+        cache.get('k0')  # uso reciente: sobrevive a la poda
+        cache.put('k10', 10)
+
+        restantes = sorted(p.stem for p in tmp_path.glob('*.json'))
+        assert len(restantes) == 9
+        assert 'k0' in restantes and 'k10' in restantes and 'k1' not in restantes
+        assert cache.stats()['disk_evictions'] == 2
+        assert not list(tmp_path.glob('*.tmp'))
+
+    def test_zero_disk_size_disables_disk(self, tmp_path):
+        cache = SectionCache(max_entries=4, persist_dir=tmp_path, max_disk_entries=0)
+        cache.put('secciones:abc', ['i', None])
+
+        assert not list(tmp_path.iterdir())
+        assert cache.get('secciones:abc') == ['i', None]
+        assert cache.stats()['disk_evictions'] == 0
+
+    def test_clear_removes_disk_entries(self, tmp_path):
+        cache = SectionCache(max_entries=4, persist_dir=tmp_path)
+        cache.put('secciones:abc', ['i', None])
+        cache.clear()
+
+        assert not list(tmp_path.glob('*.json'))
+        assert SectionCache(max_entries=4, persist_dir=tmp_path).get('secciones:abc') is None
+
+    def test_factura_sections_reuse_cache(self, monkeypatch):
+        cache = SectionCache(max_entries=8)
+        monkeypatch.setattr(xml_processor, 'factura_section_cache', cache)
+
+        first = XMLProcessor.extract_factura_sections(FACTURA)
+        second = XMLProcessor.extract_factura_sections(ParsedUBLDocument(FACTURA))
+
+        assert first == second
+        assert 'schemeID="10"' in first[0]
+        assert first[1].startswith('<cac:InvoicePeriod>')
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
@@ -0,0 +1,47 @@
+from app.processors import json_codec
+from app.processors.rips_processor import RIPSProcessor
+from app.processors.service_overlay import ServiceOverlay, materialize
+
+
+class TestServiceOverlay:
+    def test_reads_through_and_keeps_original(self):
+        original = {"codConsulta": "890201", "vrServicio": 500, "consecutivo": 3}
+        overlay = ServiceOverlay(original)
+        overlay["vrServicio"] = 0
+        overlay["consecutivo"] = 1
+        overlay["nuevo"] = True
+
+        assert original == {"codConsulta": "890201", "vrServicio": 500, "consecutivo": 3}
+        assert list(overlay.items()) == [("codConsulta", "890201"), ("vrServicio", 0), ("consecutivo", 1), ("nuevo", True)]
+        assert overlay.cambios == {"vrServicio": 0, "consecutivo": 1, "nuevo": True}
+        assert overlay == {**original, "vrServicio": 0, "consecutivo": 1, "nuevo": True}
+
+        del overlay["codConsulta"]
+        assert "codConsulta" not in overlay
+        assert len(overlay) == 3
+        assert original["codConsulta"] == "890201"
+
+    def test_serializes_like_dict_copy(self):
+        original = {"codTecnologiaSalud": "M1", "nomTecnologiaSalud": "José", "cantidadMedicamento": 10}
+        overlay = ServiceOverlay(original, {"cantidadMedicamento": 1, "vrServicio": 2000})
+        copia = dict(original, cantidadMedicamento=1, vrServicio=2000)
+
+        assert json_codec.dumps({"s": [overlay]}) == json_codec.dumps({"s": [copia]})
+        assert json_codec.dumps_pretty([overlay]) == json_codec.dumps_pretty([copia])
+
+    def test_generate_nc_rips_overlays_original_services(self):
+        med = {"codTecnologiaSalud": "M1", "vrUnitMedicamento": 500, "cantidadMedicamento": 10, "vrServicio": 5000}
+        rips_data = {"usuarios": [{"servicios": {"medicamentos": [med]}}]}
+        matches = [{"tipo_servicio": "medicamentos", "codigo_rips": "M1", "valor_nc": 2000}]
+
+        nc_rips = RIPSProcessor.generate_nc_rips(rips_data, "NC1", matches)
+        med_nc = nc_rips["usuarios"][0]["servicios"]["medicamentos"][0]
+
+        assert isinstance(med_nc, ServiceOverlay)
+        assert med["vrServicio"] == 5000
+        plano = materialize(nc_rips)
+        assert type(plano["usuarios"][0]["servicios"]["medicamentos"][0]) is dict
+        assert plano["usuarios"][0]["servicios"]["medicamentos"][0] == {
+            "codTecnologiaSalud": "M1", "vrUnitMedicamento": 2000.0, "cantidadMedicamento": 1,
+            "vrServicio": 2000, "consecutivo": 1
+        }
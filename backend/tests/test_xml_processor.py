@@ -1,3 +1,4 @@
+import re
 import pytest
 from app.processors.xml_processor import XMLProcessor
 
@@ -167,3 +168,212 @@ class TestInsertSections:
         nc_xml = '<root>content</root>'
         result = XMLProcessor.insert_sections(nc_xml, None, None)
         assert result == nc_xml
+
+
+NC_DOC = '''<?xml version="1.0"?>
+<AttachedDocument>
+  <cbc:ParentDocumentID>NC123 </cbc:ParentDocumentID>
+  <cac:Attachment><cbc:Description><![CDATA[<CreditNote>
+  <cbc:ID>NC123</cbc:ID>
+  <cac:CreditNoteLine>
+    <cbc:ID>1</cbc:ID>
+    <cbc:CreditedQuantity unitCode="94">2</cbc:CreditedQuantity>
+    <cbc:LineExtensionAmount currencyID="COP">300.00</cbc:LineExtensionAmount>
+    <cac:Item><cbc:Description>CONSULTA (890201)</cbc:Description></cac:Item>
+  </cac:CreditNoteLine>
+  <cac:CreditNoteLine>
+    <cbc:ID>2</cbc:ID>
+    <cbc:LineExtensionAmount currencyID="COP">200.00</cbc:LineExtensionAmount>
+    <cac:Item><cbc:Description>OTRO</cbc:Description></cac:Item>
+  </cac:CreditNoteLine>
+  <cac:LegalMonetaryTotal>
+    <cbc:PayableAmount currencyID="COP">500.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+</CreditNote>]]></cbc:Description></cac:Attachment>
+</AttachedDocument>'''
+
+
+class TestParsedUBLDocument:
+    def test_accessors_reuse_single_index(self, monkeypatch):
+        from app.processors import ubl_document
+
+        calls = []
+        original = ubl_document._TAG_RE
+
+        class CountingPattern:
+            def finditer(self, text):
+                calls.append(len(text))
+                return original.finditer(text)
+
+        monkeypatch.setattr(ubl_document, '_TAG_RE', CountingPattern())
+        doc = ubl_document.ParsedUBLDocument(NC_DOC)
+
+        assert doc.nc_number == 'NC123'
+        assert [l.id for l in doc.nc_lines] == [1, 2]
+        assert doc.payable_amount == 500.0
+        assert doc.invoice_period is None
+        assert len(calls) == 1
+
+    def test_lines_match_legacy_fields(self):
+        from app.processors.ubl_document import ParsedUBLDocument
+
+        lines = XMLProcessor.extract_nc_lines(ParsedUBLDocument(NC_DOC))
+        assert lines[0].cantidad == 2.0
+        assert lines[0].valor == 300.0
+        assert lines[0].codigo_extraido == '890201'
+        assert lines[1].cantidad == 0.0
+        assert lines[1].codigo_extraido is None
+
+    def test_nc_number_falls_back_to_id(self):
+        from app.processors.ubl_document import ParsedUBLDocument
+
+        doc = ParsedUBLDocument('<CreditNote><cbc:ID schemeID="x">NC9</cbc:ID></CreditNote>')
+        assert doc.parent_document_id is None
+        assert doc.nc_number == 'NC9'
+        assert ParsedUBLDocument('<CreditNote/>').nc_number is None
+
+    def test_total_falls_back_to_lines(self):
+        from app.processors.ubl_document import ParsedUBLDocument
+
+        xml = NC_DOC.replace('<cbc:PayableAmount currencyID="COP">500.00</cbc:PayableAmount>', '')
+        assert ParsedUBLDocument(xml).total_nc == 500.0
+
+    def test_insert_sections_accepts_parsed_document(self):
+        from app.processors.ubl_document import ParsedUBLDocument
+
+        xml = '<root><![CDATA[<CreditNote><ext:UBLExtensions><ext:UBLExtension>A</ext:UBLExtension></ext:UBLExtensions><cac:DiscrepancyResponse>x</cac:DiscrepancyResponse></CreditNote>]]></root>'
+        from_text = XMLProcessor.insert_sections(xml, '<I/>', '<P/>')
+        from_doc = XMLProcessor.insert_sections(ParsedUBLDocument(xml), '<I/>', '<P/>')
+        assert from_doc == from_text
+        assert '</ext:UBLExtension>\n    <I/></ext:UBLExtensions>' in from_doc
+        assert '</cac:DiscrepancyResponse>\n  <P/></CreditNote>' in from_doc
+
+
+def _nc_with_lines(valores):
+    lines = ''.join(
+        f'''<cac:CreditNoteLine>
+    <cbc:ID>{i}</cbc:ID>
+    <cbc:CreditedQuantity unitCode="94">1</cbc:CreditedQuantity>
+    <cbc:LineExtensionAmount currencyID="COP">{v:.2f}</cbc:LineExtensionAmount>
+    <cac:Price><cbc:PriceAmount currencyID="COP">{v:.2f}</cbc:PriceAmount><cbc:BaseQuantity>1</cbc:BaseQuantity></cac:Price>
+  </cac:CreditNoteLine>
+  '''
+        for i, v in enumerate(valores, start=1)
+    )
+    total = sum(valores)
+    return f'''<root><![CDATA[<CreditNote>
+  {lines}<cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount currencyID="COP">{total:.2f}</cbc:LineExtensionAmount>
+    <cbc:TaxExclusiveAmount currencyID="COP">0.00</cbc:TaxExclusiveAmount>
+    <cbc:TaxInclusiveAmount currencyID="COP">{total:.2f}</cbc:TaxInclusiveAmount>
+    <cbc:PayableAmount currencyID="COP">{total:.2f}</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+</CreditNote>]]></root>'''
+
+
+class TestValoresCeroPorLinea:
+    def test_zeroes_only_requested_line(self):
+        xml = _nc_with_lines([100.0, 250.0, 40.0])
+        result = XMLProcessor.aplicar_valores_cero_por_linea(xml, [2])
+
+        lines = XMLProcessor.extract_nc_lines(result)
+        assert [(l.id, l.valor, l.cantidad) for l in lines] == [
+            (1, 100.0, 1.0), (2, 0.0, 0.0), (3, 40.0, 1.0)
+        ]
+        assert result.count('<cbc:PriceAmount currencyID="COP">0.00</cbc:PriceAmount>') == 1
+        assert '<cbc:PayableAmount currencyID="COP">140.00</cbc:PayableAmount>' in result
+        assert '<cbc:TaxInclusiveAmount currencyID="COP">140.00</cbc:TaxInclusiveAmount>' in result
+        assert '<cbc:TaxExclusiveAmount currencyID="COP">0.00</cbc:TaxExclusiveAmount>' in result
+
+    def test_unknown_line_keeps_lines_and_recalculates_total(self):
+        xml = _nc_with_lines([100.0, 250.0])
+        result = XMLProcessor.aplicar_valores_cero_por_linea(xml, [7])
+        assert XMLProcessor.extract_nc_lines(result) == XMLProcessor.extract_nc_lines(xml)
+        assert '<cbc:PayableAmount currencyID="COP">350.00</cbc:PayableAmount>' in result
+
+    def test_no_lines_returns_input(self):
+        xml = _nc_with_lines([100.0])
+        assert XMLProcessor.aplicar_valores_cero_por_linea(xml, []) == xml
+
+    def test_line_identified_by_first_numeric_id(self):
+        # La linea 2 trae antes un cbc:ID no numérico; la 3 no tiene ID numérico
+        xml = _nc_with_lines([100.0, 250.0, 40.0])
+        xml = xml.replace('<cbc:ID>2</cbc:ID>', '<cbc:ID>L-2</cbc:ID><cbc:ID>2</cbc:ID>')
+        xml = xml.replace('<cbc:ID>3</cbc:ID>', '<cbc:ID>L-3</cbc:ID>')
+
+        result = XMLProcessor.aplicar_valores_cero_por_linea(xml, [1])
+        assert result.count('<cbc:PriceAmount currencyID="COP">0.00</cbc:PriceAmount>') == 1
+        assert '<cbc:PayableAmount currencyID="COP">290.00</cbc:PayableAmount>' in result
+
+        result = XMLProcessor.aplicar_valores_cero_por_linea(xml, [2])
+        assert '<cbc:PriceAmount currencyID="COP">250.00</cbc:PriceAmount>' not in result
+        assert '<cbc:PayableAmount currencyID="COP">140.00</cbc:PayableAmount>' in result
+
+
+class TestBytesInput:
+    def test_bytes_and_str_give_same_results(self):
+        xml = NC_DOC.replace('OTRO', 'ÓRTESIS AÑO').replace(
+            '<CreditNote>', '<CreditNote><ext:UBLExtensions><ext:UBLExtension>A</ext:UBLExtension></ext:UBLExtensions>'
+            '<cac:DiscrepancyResponse>ñ</cac:DiscrepancyResponse>', 1
+        )
+        raw = xml.encode('utf-8')
+
+        assert XMLProcessor.extract_nc_lines(raw) == XMLProcessor.extract_nc_lines(xml)
+        assert XMLProcessor.extract_cdata(raw) == XMLProcessor.extract_cdata(xml)
+
+        completo = XMLProcessor.insert_sections(raw, '<Interop>é</Interop>', '<P/>')
+        assert isinstance(completo, bytes)
+        assert completo == XMLProcessor.insert_sections(xml, '<Interop>é</Interop>', '<P/>').encode('utf-8')
+
+        cero = XMLProcessor.aplicar_valores_cero_por_linea(completo, [2])
+        assert cero == XMLProcessor.aplicar_valores_cero_por_linea(completo.decode('utf-8'), [2]).encode('utf-8')
+        assert XMLProcessor.aplicar_caso_colesterol(cero) == XMLProcessor.aplicar_caso_colesterol(cero.decode('utf-8')).encode('utf-8')
+
+
+class TestInteropLocators:
+    # Patrones originales: los localizadores deben dar exactamente el mismo resultado
+    LEGACY = re.compile(
+        r'(<ext:UBLExtension>\s*<ext:ExtensionContent>\s*<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>\s*</ext:ExtensionContent>\s*</ext:UBLExtension>)',
+        re.DOTALL
+    )
+    LEGACY_FALLBACK = re.compile(
+        r'(<CustomTagGeneral>.*?<Interoperabilidad>.*?</Interoperabilidad>.*?</CustomTagGeneral>)',
+        re.DOTALL
+    )
+    TOKENS = [
+        '<ext:UBLExtension>', '<ext:ExtensionContent>', '<CustomTagGeneral>', '<Interoperabilidad>',
+        '</Interoperabilidad>', '</CustomTagGeneral>', '</ext:ExtensionContent>', '</ext:UBLExtension>',
+        '<ext:UBLExtensions>', ' ', '\n', 'x', 'ñ',
+        # Cabecera y cierre completos para que el patrón principal también coincida
+        '<ext:UBLExtension>\n <ext:ExtensionContent><CustomTagGeneral>',
+        '</CustomTagGeneral> </ext:ExtensionContent>\n</ext:UBLExtension>',
+    ]
+
+    @staticmethod
+    def _span(match):
+        return match.span(1) if match else None
+
+    def test_same_result_as_legacy_patterns(self):
+        import random
+        from app.processors.ubl_document import locate_custom_tag_general, locate_interoperabilidad
+
+        legacy_bytes = re.compile(self.LEGACY.pattern.encode('utf-8'), re.DOTALL)
+        rng = random.Random(20240501)
+        for _ in range(3000):
+            text = ''.join(rng.choice(self.TOKENS) for _ in range(rng.randint(0, 40)))
+            start = rng.randint(0, 3) if text else 0
+            end = len(text) - (rng.randint(0, 3) if len(text) > 3 else 0)
+
+            assert locate_interoperabilidad(text, start, end) == self._span(self.LEGACY.search(text, start, end)), text
+            assert locate_custom_tag_general(text, start, end) == self._span(self.LEGACY_FALLBACK.search(text, start, end)), text
+
+            raw = text.encode('utf-8')
+            assert locate_interoperabilidad(raw, 0, len(raw)) == self._span(legacy_bytes.search(raw))
+
+    def test_bytes_offsets_match_encoded_text(self):
+        from app.processors.ubl_document import locate_interoperabilidad
+
+        text = 'ñ<ext:UBLExtension>\n <ext:ExtensionContent><CustomTagGeneral><Interoperabilidad>é</Interoperabilidad></CustomTagGeneral> </ext:ExtensionContent></ext:UBLExtension>'
+        raw = text.encode('utf-8')
+        span = locate_interoperabilidad(raw, 0, len(raw))
+        assert raw[span[0]:span[1]].decode('utf-8') == self.LEGACY.search(text).group(1)
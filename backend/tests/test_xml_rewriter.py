@@ -0,0 +1,52 @@
+from app.processors.xml_rewriter import RewriteRule, XMLRewriter
+
+
+XML = '''<CreditNote>
+  <cac:CreditNoteLine>
+    <cbc:ID>1</cbc:ID>
+    <cbc:LineExtensionAmount currencyID="COP">100.00</cbc:LineExtensionAmount>
+  </cac:CreditNoteLine>
+  <cac:CreditNoteLine>
+    <cbc:ID>2</cbc:ID>
+    <cbc:LineExtensionAmount currencyID="COP">50.00</cbc:LineExtensionAmount>
+    <cac:Item><cac:StandardItemIdentification><cbc:ID>1</cbc:ID></cac:StandardItemIdentification></cac:Item>
+  </cac:CreditNoteLine>
+  <cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount currencyID="COP">150.00</cbc:LineExtensionAmount>
+    <cbc:PayableAmount currencyID="COP">150.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+  <cbc:Note>N/A</cbc:Note>
+</CreditNote>'''
+
+
+class TestXMLRewriter:
+    def test_all_occurrences_in_single_scan(self):
+        result = XMLRewriter([RewriteRule('cbc:LineExtensionAmount', '0.00')]).apply(XML)
+        assert result.text.count('>0.00</cbc:LineExtensionAmount>') == 3
+        assert [c.valor_anterior for c in result.cambios] == ['100.00', '50.00', '150.00']
+
+    def test_line_scope_uses_line_own_id(self):
+        result = XMLRewriter([RewriteRule('cbc:LineExtensionAmount', '0.00', linea_id=2)]).apply(XML)
+        assert '>100.00</cbc:LineExtensionAmount>' in result.text
+        assert '>150.00</cbc:LineExtensionAmount>' in result.text
+        assert len(result.cambios) == 1
+        assert result.cambios[0].linea_id == 2
+        assert result.cambios[0].valor_anterior == '50.00'
+
+    def test_parent_scope_and_max_changes(self):
+        rules = [
+            RewriteRule('cbc:LineExtensionAmount', '100.00', padre='cac:LegalMonetaryTotal', max_cambios=1),
+            RewriteRule('cbc:PayableAmount', '100.00', padre='cac:LegalMonetaryTotal', max_cambios=1),
+        ]
+        result = XMLRewriter(rules).apply(XML)
+        assert '<cbc:LineExtensionAmount currencyID="COP">50.00</cbc:LineExtensionAmount>' in result.text
+        assert '<cbc:PayableAmount currencyID="COP">100.00</cbc:PayableAmount>' in result.text
+        assert [c.tag for c in result.cambios] == ['cbc:LineExtensionAmount', 'cbc:PayableAmount']
+
+    def test_value_pattern_filters_non_numeric(self):
+        numeric = XMLRewriter([RewriteRule('cbc:Note', 'X')]).apply(XML)
+        assert not numeric.modificado
+        assert numeric.text is XML
+
+        any_text = XMLRewriter([RewriteRule('cbc:Note', 'X', patron_valor=None)]).apply(XML)
+        assert '<cbc:Note>X</cbc:Note>' in any_text.text